@@ -0,0 +1,40 @@
+"""
+トークン予算に基づくバッチ分割
+
+複数のアイテムを1回のLLMリクエストにまとめる際、
+プロンプト全体が予算内に収まるようにアイテムをバッチへ詰める。
+"""
+from typing import Callable, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def pack_by_token_budget(
+    items: Sequence[T],
+    item_tokens: Callable[[T], int],
+    *,
+    fixed_tokens: int,
+    budget: int,
+    max_items: int,
+) -> List[List[T]]:
+    """
+    items を順序を保ったままバッチに分割する
+    各バッチは fixed_tokens（指示文・タグ一覧など共通部分）+ アイテム分のトークンが budget 以下、
+    かつ max_items 件以下になる。1件で予算を超えるアイテムは単独のバッチにする
+    """
+    batches: List[List[T]] = []
+    current: List[T] = []
+    current_tokens = fixed_tokens
+
+    for item in items:
+        tokens = item_tokens(item)
+        if current and (current_tokens + tokens > budget or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            current_tokens = fixed_tokens
+        current.append(item)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,229 @@
+"""
+LLM応答のキャッシュ
+
+同じ入力に対するLLM呼び出しを省くため、正規化した入力のハッシュをキーに結果を保存する。
+- make_key: 入力を正規化してハッシュ化する（表記ゆれ・空白・タグの順序の違いは同じキーになる）
+- InMemoryCache: メモリ上に保存（TTL + LRUで古いものから削除）
+- SQLiteCache: SQLiteに保存（再起動後も有効）
+
+リクエストの処理中は aget / aset / aget_many / aset_many を使う。
+SQLiteCache の読み書きはスレッドで実行し、イベントループを止めない。
+複数件をまとめて読み書きする場合は get_many / set_many で1回のトランザクションにする。
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def normalize_text(value: Any) -> str:
+    """NFKC正規化し、前後の空白を除いて連続する空白を1つにまとめる"""
+    if value is None:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", str(value)).split())
+
+
+def make_key(**fields) -> str:
+    """
+    入力を正規化してキーを作る
+    文字列はnormalize_text、リストは各要素を正規化して重複を除き並べ替える
+    """
+    normalized = {}
+    for name, value in fields.items():
+        if isinstance(value, (list, tuple, set)):
+            normalized[name] = sorted({normalize_text(item) for item in value})
+        else:
+            normalized[name] = normalize_text(value)
+    encoded = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """キャッシュのインターフェース（値はJSON化できるもの）"""
+
+    # 読み書きがI/Oを伴うか（True なら非同期版はスレッドで実行する）
+    blocking = False
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """見つかったキー -> 値（見つからないキーは含まない）"""
+        keys = list(dict.fromkeys(keys))
+        found = self._get_many(keys, time.time() - self.ttl_seconds) if keys else {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        if items:
+            self._set_many(items, time.time())
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await self._run(self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        await self._run(self.set, key, value)
+
+    async def aget_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        return await self._run(self.get_many, list(keys))
+
+    async def aset_many(self, items: Dict[str, Any]) -> None:
+        await self._run(self.set_many, dict(items))
+
+    async def _run(self, function, *args):
+        if self.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def _get_many(self, keys, not_before: float) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _set_many(self, items: Dict[str, Any], now: float) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class InMemoryCache(ResponseCache):
+    """メモリ上のキャッシュ"""
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # キー -> (保存時刻, 値)
+
+    def _get_many(self, keys, not_before: float) -> Dict[str, Any]:
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            stored_at, value = entry
+            if stored_at < not_before:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            found[key] = value
+        return found
+
+    def _set_many(self, items: Dict[str, Any], now: float) -> None:
+        for key, value in items.items():
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(ResponseCache):
+    """
+    SQLiteのキャッシュ（サーバー再起動後も有効。table を分ければ1つのファイルを共有できる）
+    件数が max_entries を超えたときだけ、最後に使われた時刻が古いものから
+    max_entries の EVICT_RATIO 分をまとめて削除する（書き込みのたびに全件を数えない）
+    """
+
+    blocking = True
+    EVICT_RATIO = 0.1
+    _QUERY_BATCH = 500  # IN (...) に渡すキーの数（SQLiteの変数の上限より小さくする）
+
+    def __init__(self, path: str, *, ttl_seconds: float, max_entries: int, table: str = "cache"):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        if not table.isidentifier():
+            raise ValueError(f"テーブル名が不正です: {table}")
+        self._table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self._table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._table}_used_at ON {self._table} (used_at)")
+            # 件数の上限（置き換えも1件と数えるため実際の件数以上。超えたら数え直す）
+            self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def _get_many(self, keys, not_before: float) -> Dict[str, Any]:
+        rows = []
+        with self._lock, self._conn:
+            for start in range(0, len(keys), self._QUERY_BATCH):
+                batch = keys[start:start + self._QUERY_BATCH]
+                rows.extend(self._conn.execute(
+                    f"SELECT key, value, stored_at FROM {self._table} WHERE key IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ))
+            expired = [(key,) for key, _, stored_at in rows if stored_at < not_before]
+            if expired:
+                self._conn.executemany(f"DELETE FROM {self._table} WHERE key = ?", expired)
+            used_at = time.time()
+            self._conn.executemany(
+                f"UPDATE {self._table} SET used_at = ? WHERE key = ?",
+                [(used_at, key) for key, _, stored_at in rows if stored_at >= not_before],
+            )
+        return {key: json.loads(value) for key, value, stored_at in rows if stored_at >= not_before}
+
+    def _set_many(self, items: Dict[str, Any], now: float) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False), now, now) for key, value in items.items()],
+            )
+            self._count += len(items)
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        """上限を超えていれば、最後に使われた時刻が古いものから上限の EVICT_RATIO 分を余分に削除する"""
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        keep = self.max_entries - int(self.max_entries * self.EVICT_RATIO)
+        # used_at のインデックスを古い順に辿るので、削除する件数分だけ読めばよい
+        self._conn.execute(
+            f"DELETE FROM {self._table} WHERE key IN ("
+            f"SELECT key FROM {self._table} ORDER BY used_at LIMIT ?)",
+            (self._count - keep,),
+        )
+        self._count = keep
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+
+def create_cache(backend: str, path: str, *, ttl_seconds: float, max_entries: int, table: str = "cache") -> Optional[ResponseCache]:
+    """設定値からキャッシュを作る（backend: memory / sqlite / off。off は None を返す）"""
+    if backend == "sqlite":
+        return SQLiteCache(path, ttl_seconds=ttl_seconds, max_entries=max_entries, table=table)
+    if backend == "memory":
+        return InMemoryCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+    return None
@@ -0,0 +1,129 @@
+"""
+チャンク分割による一括処理
+
+件数に上限のない入力をチャンクに分けて並行処理し、結果をまとめる。
+- 応答に含まれなかったアイテムや失敗したチャンクのアイテムだけを再試行する
+- 再試行のたびにチャンクを小さくする（応答が途中で切れる場合の対策）
+- 最後まで処理できなかったアイテムは、最初に所属していたチャンク単位で報告する
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fanout import fan_out
+
+
+class ChunkError(Exception):
+    """チャンクの処理失敗（LLMの呼び出し自体は完了していればusageを保持する）"""
+
+    def __init__(self, message: str, usage: Any = None):
+        super().__init__(message)
+        self.usage = usage
+
+
+async def iter_chunked(
+    items: Sequence[dict],
+    *,
+    item_id: Callable[[dict], str],
+    plan_chunks: Callable[[Sequence[dict], int], List[List[dict]]],
+    process_chunk: Callable[[List[dict], Callable[[Dict[str, Any]], None]], Awaitable[Tuple[Dict[str, Any], Any]]],
+    concurrency: int,
+    timeout: float,
+    retries: int,
+    on_round: Optional[Callable[[int, int, int], None]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    items をチャンクに分割して並行処理し、結果が得られた順にイベントを返す
+    - ("results", アイテムID -> 結果 の辞書): チャンクの結果
+    - ("usage", usage): LLM呼び出しのトークン使用量
+    - ("failed_chunk", {chunk_index, bookmark_ids, reason}): 最後まで処理できなかったアイテム（最後にまとめて返す）
+
+    plan_chunks(items, attempt): 試行回数 attempt（0始まり）に応じてチャンクを決める
+    process_chunk(chunk, emit): (アイテムID -> 結果 の辞書, usage) を返す。例外はチャンクの失敗として扱う
+        （ChunkError に usage を持たせると、失敗したチャンクのトークン数も集計される）
+        emit(結果の辞書) を呼ぶと、チャンクの完了を待たずに結果を確定できる（ストリーミング応答向け）。
+        emit 済みの結果は、その後チャンクが失敗・タイムアウトしても再試行されない
+    on_round(attempt, アイテム数, チャンク数): 各試行の開始時に呼ばれる（ログ用）
+
+    結果そのものは保持しないため、件数が多くてもメモリ使用量は処理済みIDの集合程度で済む
+    """
+    done_ids = set()
+    chunk_of: Dict[str, int] = {}  # アイテムID -> 最初のチャンク番号
+    last_errors: Dict[str, str] = {}  # アイテムID -> 最後のエラー
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run_chunk(chunk):
+        chunk_ids = {item_id(item) for item in chunk}
+
+        def emit(results):
+            # チャンクに含まれないIDと確定済みのIDは無視する
+            new_results = {
+                key: value for key, value in results.items()
+                if key in chunk_ids and key not in done_ids
+            }
+            if new_results:
+                done_ids.update(new_results)
+                events.put_nowait(("results", new_results))
+
+        results, usage = await process_chunk(chunk, emit)
+        emit(results)
+        if usage is not None:
+            events.put_nowait(("usage", usage))
+
+    def on_chunk_error(chunk, e):
+        if isinstance(e, asyncio.TimeoutError):
+            message = f"タイムアウト（{timeout:.0f}秒）"
+        else:
+            message = str(e) or type(e).__name__
+        for item in chunk:
+            last_errors[item_id(item)] = message
+        if isinstance(e, ChunkError) and e.usage is not None:
+            events.put_nowait(("usage", e.usage))
+
+    async def run_round(chunks):
+        try:
+            await fan_out(
+                chunks,
+                run_chunk,
+                concurrency=concurrency,
+                timeout=timeout,
+                on_error=on_chunk_error,
+            )
+        finally:
+            events.put_nowait(None)
+
+    pending = list(items)
+    for attempt in range(retries + 1):
+        chunks = plan_chunks(pending, attempt)
+        if attempt == 0:
+            for index, chunk in enumerate(chunks):
+                for item in chunk:
+                    chunk_of.setdefault(item_id(item), index)
+        if on_round:
+            on_round(attempt, len(pending), len(chunks))
+
+        round_task = asyncio.ensure_future(run_round(chunks))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            # 途中で反復をやめた場合は未完了のチャンクをキャンセルする
+            round_task.cancel()
+
+        pending = [item for item in pending if item_id(item) not in done_ids]
+        if not pending:
+            break
+
+    # 最後まで処理できなかったアイテムを元のチャンク単位で報告
+    failed: Dict[int, dict] = {}
+    for item in pending:
+        key = item_id(item)
+        index = chunk_of.get(key, 0)
+        entry = failed.setdefault(index, {"chunk_index": index, "bookmark_ids": [], "reason": ""})
+        entry["bookmark_ids"].append(key)
+        entry["reason"] = last_errors.get(key, "AIの応答に含まれていませんでした")
+    for index in sorted(failed):
+        yield "failed_chunk", failed[index]
+
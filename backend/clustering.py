@@ -0,0 +1,181 @@
+"""
+ブックマークのクラスタリングと要約（cluster-then-summarize）
+
+構成分析で全件のタイトルをLLMに渡す代わりに、ブックマークを埋め込みベクトルで
+クラスタに分け、クラスタごとの件数・現在のフォルダ・特徴語・代表タイトルだけを渡す。
+プロンプトの長さはブックマーク数ではなくクラスタ数に比例する。
+
+k-means は正規化済みベクトルに対する球面k-means（コサイン類似度）。
+件数が多い場合はミニバッチで重心を更新する。
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import lexical
+
+# ミニバッチk-meansに切り替える件数と、バッチの大きさ
+MINI_BATCH_THRESHOLD = 20000
+MINI_BATCH_SIZE = 4096
+# 全件を割り当てる際のブロックの大きさ
+_ASSIGN_BLOCK = 8192
+
+# 特徴語から除く語
+_KEYWORD_STOPWORDS = frozenset({
+    "the", "a", "an", "and", "or", "of", "to", "in", "for", "on", "with", "is", "how", "what",
+    "com", "www", "http", "https", "html", "の", "と", "に", "を", "は", "が", "で", "から", "まとめ", "方法",
+})
+
+
+def suggest_cluster_count(n: int, *, max_clusters: int = 40) -> int:
+    """ブックマーク数に応じたクラスタ数（√(n/2) を目安に 2〜max_clusters）"""
+    if n <= 2:
+        return max(1, n)
+    return int(min(max_clusters, max(2, round(np.sqrt(n / 2)))))
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = vectors[start:start + _ASSIGN_BLOCK]
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _init_centroids(vectors: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means++ の初期化（既存の重心から遠い点ほど選ばれやすい）"""
+    candidates = vectors if len(vectors) <= MINI_BATCH_SIZE * 4 else vectors[rng.choice(len(vectors), MINI_BATCH_SIZE * 4, replace=False)]
+    chosen = [int(rng.integers(len(candidates)))]
+    distance = 1.0 - candidates @ candidates[chosen[0]]
+    for _ in range(k - 1):
+        weights = np.clip(distance, 0, None)
+        total = weights.sum()
+        index = int(rng.choice(len(candidates), p=weights / total)) if total > 0 else int(rng.integers(len(candidates)))
+        chosen.append(index)
+        distance = np.minimum(distance, 1.0 - candidates @ candidates[index])
+    return candidates[chosen].copy()
+
+
+def _normalize(centroids: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    empty = norms[:, 0] == 0
+    return np.where(empty[:, None], fallback, centroids / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def kmeans(vectors: np.ndarray, k: int, *, iterations: int = 20, seed: int = 0):
+    """
+    球面k-means
+    vectors: 正規化済みの (件数, 次元)
+    戻り値: (重心 (k, 次元), 各ベクトルのクラスタ番号)
+    """
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    centroids = _init_centroids(vectors, k, rng)
+
+    if len(vectors) <= MINI_BATCH_THRESHOLD:
+        labels = None
+        for _ in range(iterations):
+            new_labels = _assign(vectors, centroids)
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, vectors)
+            centroids = _normalize(sums, centroids)
+        return centroids, labels
+
+    # ミニバッチ: バッチごとに重心を学習率 1/割り当て数 で更新する
+    counts = np.zeros(k)
+    for _ in range(iterations * 2):
+        batch = vectors[rng.choice(len(vectors), MINI_BATCH_SIZE, replace=False)]
+        batch_labels = _assign(batch, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, batch_labels, batch)
+        batch_counts = np.bincount(batch_labels, minlength=k)
+        counts += batch_counts
+        rate = np.divide(batch_counts, counts, out=np.zeros(k), where=counts > 0)[:, None]
+        means = sums / np.maximum(batch_counts, 1)[:, None]
+        centroids = _normalize(centroids * (1 - rate) + means * rate, centroids)
+    return centroids, _assign(vectors, centroids)
+
+
+def _title_words(title: str) -> frozenset:
+    return frozenset(
+        word for word in lexical.tokenize(lexical.normalize(title))
+        if len(word) >= 2 and word not in _KEYWORD_STOPWORDS and not word.isdigit()
+    )
+
+
+def _keywords(member_words: Sequence[frozenset], document_frequency: Counter, total: int, limit: int) -> List[str]:
+    """
+    クラスタの特徴語（クラスタ内の出現数 × log(全体の件数 / 全体の出現数) が大きい語）
+    どのクラスタにも現れる語は低く、そのクラスタに偏って現れる語ほど高くなる
+    """
+    counter = Counter()
+    for words in member_words:
+        counter.update(words)
+    scored = [
+        (count * np.log(total / document_frequency[word]), word)
+        for word, count in counter.items() if count >= 2
+    ]
+    scored.sort(key=lambda item: -item[0])
+    return [word for score, word in scored[:limit] if score > 0]
+
+
+def cluster_digest(
+    bookmarks: Sequence[dict],
+    vectors: np.ndarray,
+    k: int,
+    *,
+    group_field: Optional[str] = "current_folder",
+    exemplars: int = 5,
+    keywords: int = 6,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    ブックマークをクラスタに分け、大きい順にクラスタの要約を返す
+    各要約: {size, groups: [(フォルダ, 件数)], keywords: [...], exemplars: [タイトル], members: [元の番号]}
+    """
+    if len(bookmarks) == 0:
+        return []
+    centroids, labels = kmeans(vectors, k, seed=seed)
+    similarity = np.einsum("ij,ij->i", vectors, centroids[labels])
+    titles = [str(bookmark.get("title") or "") for bookmark in bookmarks]
+    words = [_title_words(title) for title in titles]
+    document_frequency = Counter()
+    for title_words in words:
+        document_frequency.update(title_words)
+
+    # クラスタ番号順・重心に近い順に並べる
+    order = np.lexsort((-similarity, labels))
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    digest = []
+    for members in np.split(order, boundaries):
+        member_titles = [titles[i] for i in members]
+        groups = Counter(str(bookmarks[i].get(group_field) or "未分類") for i in members) if group_field else Counter()
+        digest.append({
+            "size": len(members),
+            "groups": groups.most_common(3),
+            "keywords": _keywords([words[i] for i in members], document_frequency, len(bookmarks), keywords),
+            "exemplars": [title[:80] for title in dict.fromkeys(t for t in member_titles if t)][:exemplars],
+            "members": members.tolist(),
+        })
+    digest.sort(key=lambda cluster: -cluster["size"])
+    return digest
+
+
+def format_digest(digest: Sequence[Dict], *, group_label: str = "フォルダ") -> str:
+    """クラスタの要約をプロンプト用のテキストにする"""
+    lines = []
+    for i, cluster in enumerate(digest):
+        groups = "、".join(f"{name}({count})" for name, count in cluster["groups"])
+        parts = [f"クラスタ{i + 1}（{cluster['size']}件）"]
+        if groups:
+            parts.append(f"{group_label}: {groups}")
+        if cluster["keywords"]:
+            parts.append(f"特徴語: {', '.join(cluster['keywords'])}")
+        parts.append(f"例: {' / '.join(cluster['exemplars'])}")
+        lines.append(" - ".join(parts))
+    return "\n".join(lines)
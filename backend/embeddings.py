@@ -0,0 +1,198 @@
+"""
+埋め込みベクトルによるフォルダ・タグの分類
+
+ブックマークとフォルダ名・タグ名を同じベクトル空間に埋め込み、コサイン類似度で割り当てる。
+- HashingEmbedder: 特徴ハッシングによる決定的な埋め込み（ネットワーク・APIキー不要）
+- OpenAIEmbedder: OpenAIの埋め込みAPI
+- label_scores: 各ラベル（フォルダ・タグ）に対するスコアを行列演算でまとめて計算する
+
+ラベルのスコアは「そのラベルを持つ例のうち最も近いものとの類似度」（ラベルごとの最近傍）。
+例にはラベル名そのものと、すでにそのラベルが付いているブックマークを使う。
+ベクトルはすべてL2正規化した float32 の行列で扱う。
+"""
+import asyncio
+import zlib
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import lexical
+import llm
+
+# 類似度行列を一度に計算するクエリ数（メモリ使用量の上限）
+_BLOCK_SIZE = 1024
+
+
+def bookmark_text(bookmark: dict) -> str:
+    """埋め込み用のブックマークのテキスト（タイトル・URLの語・メモの冒頭）"""
+    return " ".join([
+        bookmark.get("title") or "",
+        " ".join(sorted(lexical.url_tokens(bookmark.get("url") or ""))),
+        (bookmark.get("excerpt") or "")[:200],
+    ])
+
+
+def label_text(label: str) -> str:
+    """埋め込み用のラベルのテキスト（階層の末端を強調する）"""
+    leaf = label.split("/")[-1].strip()
+    return f"{label} {leaf}"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+@lru_cache(maxsize=65536)
+def _hash_feature(feature: str, dim: int) -> Tuple[int, float]:
+    value = zlib.crc32(feature.encode("utf-8"))
+    return value % dim, 1.0 if value & 0x80000000 else -1.0
+
+
+class HashingEmbedder:
+    """
+    特徴ハッシングによる埋め込み（同じテキストは常に同じベクトルになる）
+    特徴: 英数字の語、日本語の文字bigram（語より軽い重み）
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512, ngram_weight: float = 0.5):
+        self.dim = dim
+        self.ngram_weight = ngram_weight
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        normalized = lexical.normalize(text)
+        features = [(f"w:{word}", 1.0) for word in lexical.tokenize(normalized) if word.isascii()]
+        features += [(f"b:{gram}", self.ngram_weight) for gram in lexical.char_ngrams(normalized)]
+        return features
+
+    def embed_sync(self, texts: Sequence[str]) -> np.ndarray:
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text):
+                col, sign = _hash_feature(feature, self.dim)
+                rows.append(row)
+                cols.append(col)
+                values.append(sign * weight)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(values, dtype=np.float32))
+        return normalize_rows(matrix)
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        # 数千件では数百ミリ秒かかるため、イベントループを止めないよう別スレッドで計算する
+        return await asyncio.to_thread(self.embed_sync, texts)
+
+
+class OpenAIEmbedder:
+    """OpenAIの埋め込みAPI（batch_size 件ずつまとめて呼び出す）"""
+
+    name = "openai"
+
+    def __init__(self, model: str = "text-embedding-3-small", batch_size: int = 256):
+        self.model = model
+        self.batch_size = batch_size
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [text or " " for text in texts[start:start + self.batch_size]]
+            response = await llm.embeddings(model=self.model, input=batch)
+            vectors.extend(item.embedding for item in response.data)
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+
+def create_embedder(backend: str, *, dim: int = 512, model: str = "text-embedding-3-small"):
+    """設定値から埋め込みの実装を選ぶ（hashing / openai）"""
+    if backend == "openai":
+        return OpenAIEmbedder(model)
+    return HashingEmbedder(dim)
+
+
+def label_scores(
+    queries: np.ndarray,
+    examples: np.ndarray,
+    example_labels: np.ndarray,
+    n_labels: int,
+    *,
+    example_owners: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    各クエリの各ラベルに対するスコア（そのラベルの例との類似度の最大値）を返す
+    queries: (クエリ数, 次元)  examples: (例の数, 次元)  どちらも正規化済み
+    example_labels: 各例のラベル番号（0〜n_labels-1）
+    example_owners: 各例の元になったクエリ番号（-1 はラベル名など）。自分自身は比較対象から除く
+    戻り値: (クエリ数, n_labels) の float32 行列。例のないラベルは -1
+    """
+    scores = np.full((len(queries), n_labels), -1.0, dtype=np.float32)
+    if len(queries) == 0 or len(examples) == 0:
+        return scores
+
+    # ラベル順に並べ替え、ラベルごとの最大値を reduceat でまとめて求める
+    order = np.argsort(example_labels, kind="stable")
+    sorted_examples = examples[order]
+    sorted_labels = example_labels[order]
+    present, starts = np.unique(sorted_labels, return_index=True)
+    owners = example_owners[order] if example_owners is not None else None
+
+    for start in range(0, len(queries), _BLOCK_SIZE):
+        block = queries[start:start + _BLOCK_SIZE]
+        similarities = block @ sorted_examples.T
+        if owners is not None:
+            columns = np.nonzero((owners >= start) & (owners < start + len(block)))[0]
+            similarities[owners[columns] - start, columns] = -1.0
+        scores[start:start + len(block), present] = np.maximum.reduceat(similarities, starts, axis=1)
+    return scores
+
+
+def best_with_margin(scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """各行の最大スコアのラベル番号、そのスコア、2位との差を返す"""
+    if scores.shape[1] == 0:
+        empty = np.zeros(len(scores), dtype=np.float32)
+        return np.full(len(scores), -1), empty, empty
+    best = np.argmax(scores, axis=1)
+    rows = np.arange(len(scores))
+    best_scores = scores[rows, best]
+    if scores.shape[1] == 1:
+        return best, best_scores, best_scores + 1.0
+    second = np.partition(scores, -2, axis=1)[:, -2]
+    return best, best_scores, best_scores - second
+
+
+async def classify(
+    embedder,
+    query_texts: Sequence[str],
+    labels: Sequence[str],
+    *,
+    labeled_queries: Sequence[Tuple[int, str]] = (),
+    query_vectors: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    クエリのテキストをラベルに対して採点する
+    labeled_queries: (クエリ番号, ラベル) — すでにラベルが付いているクエリ。他のクエリの例として使う
+    query_vectors: 計算済みのクエリのベクトル（ベクトルインデックスから取得したもの）。指定時は query_texts を埋め込まない
+    戻り値: (クエリ数, ラベル数) のスコア行列
+    """
+    label_index = {label: i for i, label in enumerate(labels)}
+    known = [(query, label_index[label]) for query, label in labeled_queries if label in label_index]
+
+    if query_vectors is not None:
+        queries = query_vectors
+        label_vectors = await embedder.embed([label_text(label) for label in labels])
+    else:
+        vectors = await embedder.embed(list(query_texts) + [label_text(label) for label in labels])
+        queries, label_vectors = vectors[:len(query_texts)], vectors[len(query_texts):]
+
+    owners = np.array([query for query, _ in known], dtype=np.int64)
+    examples = np.concatenate([label_vectors, queries[owners]]) if known else label_vectors
+    example_labels = np.concatenate([
+        np.arange(len(labels)),
+        np.array([label for _, label in known], dtype=np.int64),
+    ]) if known else np.arange(len(labels))
+    example_owners = np.concatenate([np.full(len(labels), -1), owners]) if known else None
+    return label_scores(queries, examples, example_labels, len(labels), example_owners=example_owners)
@@ -0,0 +1,71 @@
+"""
+並行ファンアウト実行
+
+複数のアイテムに同じ非同期処理を並行して適用する。
+- 同時実行数はセマフォで制限
+- アイテムごとにタイムアウト
+- 1件の失敗が他のアイテムに影響しない（エラーは on_error で結果に変換）
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def fan_out(
+    items: Sequence[T],
+    worker: Callable[[T], Awaitable[R]],
+    *,
+    concurrency: int,
+    timeout: Optional[float] = None,
+    on_error: Callable[[T, BaseException], R],
+) -> List[R]:
+    """
+    items の各要素に worker を並行適用し、入力と同じ順序で結果を返す
+    worker が例外を送出した場合（タイムアウトを含む）は on_error(item, error) の戻り値を結果とする
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            try:
+                if timeout:
+                    return await asyncio.wait_for(worker(item), timeout)
+                return await worker(item)
+            except Exception as e:
+                return on_error(item, e)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+async def fan_out_iter(
+    items: Sequence[T],
+    worker: Callable[[T], Awaitable[R]],
+    *,
+    concurrency: int,
+    timeout: Optional[float] = None,
+    on_error: Callable[[T, BaseException], R],
+) -> AsyncIterator[Tuple[int, R]]:
+    """
+    fan_out と同じだが、完了した順に (入力のインデックス, 結果) を返す
+    途中で反復をやめた場合、未完了の処理はキャンセルされる
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index: int, item: T) -> Tuple[int, R]:
+        async with semaphore:
+            try:
+                if timeout:
+                    return index, await asyncio.wait_for(worker(item), timeout)
+                return index, await worker(item)
+            except Exception as e:
+                return index, on_error(item, e)
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,233 @@
+"""
+フォルダ階層
+
+フォルダは {name, parent(親フォルダ名)} の組で表される（クライアントの current_folders や
+LLMの suggested_folders と同じ形）。FolderTree は親名 -> 子の索引を持ち、
+- 階層表示・フルパスを O(フォルダ数) で求める
+- 親子関係が循環していても（LLMの出力など）無限ループしない
+- 既存の構成との差分（new / existing / to_remove / moved）と統合計画を求める
+
+フォルダの識別子は (親名, 名前) の組（FolderKey）。
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+FolderKey = Tuple[str, str]  # (親フォルダ名, フォルダ名)
+
+
+def _clean(value) -> str:
+    return str(value or "").strip()
+
+
+class FolderTree:
+    """
+    使い方:
+        tree = FolderTree.from_folders(result["suggested_folders"])
+        print(tree.render())
+        diff = tree.diff(FolderTree.from_folders(request.current_folders), protected={"未分類"})
+        final_structure = diff.final_structure()
+    """
+
+    def __init__(self):
+        self.nodes: Dict[FolderKey, dict] = {}  # キー -> フォルダ（追加順）
+        self.children: Dict[str, List[FolderKey]] = {}  # 親フォルダ名 -> 子のキー
+        self.by_name: Dict[str, List[FolderKey]] = {}  # フォルダ名 -> キー（同名のフォルダは複数ありうる）
+
+    @classmethod
+    def from_folders(cls, folders: Optional[Iterable]) -> "FolderTree":
+        """[{name, parent, ...}] またはフォルダ名のリストから作る（名前が空のもの・重複は除く）"""
+        tree = cls()
+        for item in folders or []:
+            if isinstance(item, dict):
+                tree.add(item.get("name"), item.get("parent"), **{k: v for k, v in item.items() if k not in ("name", "parent")})
+            else:
+                tree.add(item)
+        return tree
+
+    def add(self, name, parent="", **attributes) -> Optional[FolderKey]:
+        name, parent = _clean(name), _clean(parent)
+        if not name:
+            return None
+        key = (parent, name)
+        if key in self.nodes:
+            return key
+        self.nodes[key] = {"name": name, "parent": parent, **attributes}
+        self.children.setdefault(parent, []).append(key)
+        self.by_name.setdefault(name, []).append(key)
+        return key
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, key) -> bool:
+        return key in self.nodes
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.nodes.values())
+
+    def parent_of(self, key: FolderKey) -> Optional[FolderKey]:
+        """親フォルダのキー（トップレベル・親が存在しない場合は None。同名の親が複数あれば最初のもの）"""
+        parent = key[0]
+        candidates = self.by_name.get(parent) if parent else None
+        return candidates[0] if candidates else None
+
+    def roots(self) -> List[FolderKey]:
+        """トップレベルのフォルダと、親が存在しないフォルダ"""
+        return [key for key in self.nodes if not key[0] or key[0] not in self.by_name]
+
+    def walk(self) -> Iterator[Tuple[int, FolderKey]]:
+        """
+        (深さ, キー) を深さ優先の前順で返す（各フォルダは1回だけ）
+        循環していてルートから辿れないフォルダは、最後に循環の中の1つをルートとして辿る
+        """
+        visited = set()
+
+        def visit(root):
+            stack = [(0, root)]
+            while stack:
+                depth, key = stack.pop()
+                if key in visited:
+                    continue
+                visited.add(key)
+                yield depth, key
+                children = self.children.get(key[1], ())
+                stack.extend((depth + 1, child) for child in reversed(children) if child not in visited)
+
+        for root in self.roots():
+            yield from visit(root)
+        for key in self.nodes:
+            if key not in visited:
+                yield from visit(key)
+
+    def path(self, key: FolderKey, separator: str = "/") -> str:
+        """ルートからのフルパス（循環していれば循環に入る手前まで）"""
+        parts = [key[1]]
+        seen = {key}
+        current = self.parent_of(key)
+        while current is not None and current not in seen:
+            seen.add(current)
+            parts.append(current[1])
+            current = self.parent_of(current)
+        if current is None and key[0] and key[0] not in self.by_name:
+            parts.append(key[0])  # 親が一覧にない場合も親名はパスに含める
+        return separator.join(reversed(parts))
+
+    def cycle_keys(self) -> set:
+        """親を辿ると自分に戻るフォルダ（親は高々1つなので O(フォルダ数)）"""
+        started_from: Dict[FolderKey, FolderKey] = {}
+        on_cycle = set()
+        for start in self.nodes:
+            chain = []
+            key = start
+            while key is not None and key not in started_from:
+                started_from[key] = start
+                chain.append(key)
+                key = self.parent_of(key)
+            if key is not None and started_from[key] == start:
+                on_cycle.update(chain[chain.index(key):])
+        return on_cycle
+
+    def paths(self, separator: str = "/") -> Dict[FolderKey, str]:
+        """
+        全フォルダのフルパス（walk の順に親のパスを使い回すので O(フォルダ数)）
+        循環の中のフォルダは path と同じく、同じフォルダが2回現れる手前までにする
+        """
+        paths: Dict[FolderKey, str] = {}
+        on_cycle = self.cycle_keys()
+        for _, key in self.walk():
+            parent = self.parent_of(key)
+            if parent is not None and parent in paths and key[0] and key not in on_cycle:
+                paths[key] = f"{paths[parent]}{separator}{key[1]}"
+            else:
+                paths[key] = self.path(key, separator)
+        return paths
+
+    def render(self) -> str:
+        """階層をインデント付きのテキストにする"""
+        return "\n".join(
+            ("  " * depth + "├─ " if depth > 0 else "") + key[1]
+            for depth, key in self.walk()
+        )
+
+    def diff(self, current: "FolderTree", *, protected: Iterable[str] = ()) -> "FolderDiff":
+        """
+        このツリー（提案）と既存のツリーの差分
+        new: 既存にないフォルダ / existing: 既存と同じ場所にあるフォルダ
+        to_remove: 提案にない既存フォルダ（保護フォルダを除く）
+        moved: 同名の既存フォルダが別の親の下にあり、そこからは消えるもの（新しいキー -> 既存のキー）
+        merges: 統合先のキー -> 統合元の既存フォルダのキー（merge_from と移動から。提案に残るフォルダは除く）
+        """
+        protected = set(protected)
+        existing = [key for key in self.nodes if key in current.nodes]
+        new = [key for key in self.nodes if key not in current.nodes]
+        to_remove = [key for key in current.nodes if key not in self.nodes and key[1] not in protected]
+
+        removed = set(to_remove)
+        moved: Dict[FolderKey, FolderKey] = {}
+        claimed = set()
+        for key in new:
+            for old in current.by_name.get(key[1], ()):
+                if old in removed and old not in claimed:
+                    moved[key] = old
+                    claimed.add(old)
+                    break
+
+        merges: Dict[FolderKey, List[FolderKey]] = {}
+        for key, folder in self.nodes.items():
+            sources = [
+                old
+                for name in folder.get("merge_from") or ()
+                for old in current.by_name.get(_clean(name), ())
+                if old != key and old not in self.nodes
+            ]
+            if key in moved:
+                sources.insert(0, moved[key])
+            if sources:
+                merges[key] = list(dict.fromkeys(sources))
+
+        return FolderDiff(new=new, existing=existing, to_remove=to_remove, moved=moved, merges=merges, suggested=self, current=current)
+
+
+@dataclass
+class FolderDiff:
+    new: List[FolderKey]
+    existing: List[FolderKey]
+    to_remove: List[FolderKey]
+    moved: Dict[FolderKey, FolderKey] = field(default_factory=dict)
+    merges: Dict[FolderKey, List[FolderKey]] = field(default_factory=dict)
+    suggested: FolderTree = field(default_factory=FolderTree, repr=False)
+    current: FolderTree = field(default_factory=FolderTree, repr=False)
+
+    def merge_plan(self) -> Dict[FolderKey, FolderKey]:
+        """統合元の既存フォルダのキー -> 統合先のキー（統合元が複数の統合先に挙がっていれば最初のもの）"""
+        plan: Dict[FolderKey, FolderKey] = {}
+        for target, sources in self.merges.items():
+            for source in sources:
+                plan.setdefault(source, target)
+        return plan
+
+    def final_structure(self) -> List[dict]:
+        """
+        最終的なフォルダ構成（提案フォルダを new / existing、提案にない既存フォルダを to_remove）
+        別の親から移動するフォルダには moved_from（元の親フォルダ名）を付ける
+        """
+        statuses = dict.fromkeys(self.new, "new")
+        statuses.update(dict.fromkeys(self.existing, "existing"))
+        final = []
+        for key, folder in self.suggested.nodes.items():
+            item = {
+                "name": key[1],
+                "parent": key[0],
+                "status": statuses[key],
+                "description": folder.get("description", ""),
+                "merge_from": folder.get("merge_from", []),
+            }
+            if key in self.moved:
+                item["moved_from"] = self.moved[key][0]
+            final.append(item)
+        for parent, name in self.to_remove:
+            final.append({"name": name, "parent": parent, "status": "to_remove", "description": "", "merge_from": []})
+        return final
+
+    def removed_names(self) -> List[str]:
+        return list(dict.fromkeys(name for _, name in self.to_remove))
@@ -0,0 +1,270 @@
+"""
+OpenAIへの送信量の制御
+
+全エンドポイント・全ワーカーのLLM呼び出しで1つを共有する。
+- リクエスト数/分・トークン数/分: トークンバケットで送信前に待つ
+  （上限と残りは応答ヘッダ x-ratelimit-* から更新する。ヘッダが来るまでは LLM_RPM_LIMIT / LLM_TPM_LIMIT）
+- 429・5xx・接続エラー: ジッター付きの指数バックオフで再試行（Retry-After があればそれに従う）
+- 同時実行数: 成功するたびに少しずつ増やし（加算）、429・5xx で半分にする（乗算）AIMD
+
+使い方:
+    result = await governor.run(lambda: call(), estimated_tokens=1200)
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from typing import Awaitable, Callable, Dict, Mapping, Optional
+
+import openai
+
+logger = logging.getLogger("tag_suggestion_api")
+
+# 同時実行数（初期値・下限・上限）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_CONCURRENCY_CEILING = int(os.getenv("LLM_CONCURRENCY_CEILING", str(LLM_MAX_CONCURRENCY * 2)))
+
+# 応答ヘッダが来るまでの上限（0: 制限しない）
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+
+# 再試行の回数と待ち時間（秒）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+
+_DECREASE_FACTOR = 0.5
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """x-ratelimit-reset-* の値（"1s", "6m0s", "20ms" など）を秒にする"""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _DURATION_SECONDS[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """1分あたり capacity まで補充されるバケット（capacity が 0 なら制限しない）"""
+
+    def __init__(self, capacity: float = 0):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now <= self._updated:  # reset 待ちの間は補充しない
+            return
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount を取り出せるまでの秒数（すぐ取り出せれば 0）"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)  # 上限より大きい呼び出しも満杯になれば通す
+        if self.level >= amount:
+            return 0.0
+        return max(0.0, self._updated - time.monotonic()) + (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+    def update(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]):
+        """応答ヘッダの上限・残りで更新する"""
+        if limit:
+            self.capacity = float(limit)
+        if remaining is None or self.capacity <= 0:
+            return
+        self._refill()
+        # 残りはサーバーの値を正とする（実行中の呼び出しの分はサーバー側でも数えられている）
+        self.level = float(remaining)
+        if reset_seconds is not None and remaining <= 0:
+            # 残りが 0 のときは reset までは補充されない
+            self._updated = time.monotonic() + reset_seconds
+
+
+class AdaptiveLimit:
+    """AIMD で上限を変える同時実行数の制限"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.active = 0
+        self._condition = asyncio.Condition()
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        async with self._condition:
+            while self.active >= int(self.limit):
+                await self._condition.wait()
+            self.active += 1
+
+    async def release(self):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    async def increase(self):
+        """成功: 上限まで埋まっている間は、上限1周分の成功で1増やす"""
+        if self.active < int(self.limit):
+            return
+        before = int(self.limit)
+        self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+        if int(self.limit) > before:
+            async with self._condition:
+                self._condition.notify(int(self.limit) - before)
+
+    def decrease(self, started: float) -> bool:
+        """
+        429・5xx: 上限を半分にする
+        前回減らす前に送った呼び出しの失敗では減らさない（同時に失敗した呼び出しでまとめて減らさないため）
+        """
+        if started < self._last_decrease:
+            return False
+        self._last_decrease = time.monotonic()
+        self.limit = max(float(self.minimum), self.limit * _DECREASE_FACTOR)
+        return True
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[str]:
+    try:
+        return headers.get(name)
+    except AttributeError:
+        return None
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """エラー応答の Retry-After（retry-after-ms / retry-after）の秒数"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    milliseconds = _number(_header(headers, "retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000.0
+    return _number(_header(headers, "retry-after"))
+
+
+def classify(error: Exception):
+    """(再試行するか, 同時実行数を減らすか)"""
+    if isinstance(error, openai.RateLimitError):
+        # 利用枠の不足は待っても回復しない
+        return getattr(error, "code", None) != "insufficient_quota", True
+    if isinstance(error, openai.InternalServerError):
+        return True, True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409), False
+    if isinstance(error, openai.APIConnectionError):  # APITimeoutError を含む
+        return True, False
+    return False, False
+
+
+class Governor:
+    def __init__(self):
+        self.concurrency = AdaptiveLimit(LLM_MAX_CONCURRENCY, LLM_MIN_CONCURRENCY, LLM_CONCURRENCY_CEILING)
+        self.requests = TokenBucket(LLM_RPM_LIMIT)
+        self.tokens = TokenBucket(LLM_TPM_LIMIT)
+        self._stats = {"retries": 0, "throttled": 0, "waited_seconds": 0.0}
+
+    async def _wait_for_budget(self, estimated_tokens: int):
+        while True:
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+            if delay <= 0:
+                self.requests.take(1)
+                self.tokens.take(estimated_tokens)
+                return
+            self._stats["waited_seconds"] += delay
+            await asyncio.sleep(delay)
+
+    def observe(self, headers: Optional[Mapping[str, str]]):
+        """応答ヘッダ x-ratelimit-* でバケットを更新する"""
+        if headers is None:
+            return
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _number(_header(headers, f"x-ratelimit-limit-{kind}"))
+            remaining = _number(_header(headers, f"x-ratelimit-remaining-{kind}"))
+            if limit is None and remaining is None:
+                continue
+            bucket.update(limit, remaining, parse_duration(_header(headers, f"x-ratelimit-reset-{kind}")))
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """再試行までの秒数（Retry-After があればそれ、なければ full jitter の指数バックオフ）"""
+        after = retry_after(error)
+        if after is not None:
+            return min(LLM_RETRY_MAX_SECONDS, after) + random.uniform(0, LLM_RETRY_BASE_SECONDS)
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * (2 ** attempt)))
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable],
+        *,
+        estimated_tokens: int = 0,
+        can_retry: Callable[[], bool] = lambda: True,
+    ):
+        """
+        送信量の制限を守って call() を実行し、一時的なエラーは再試行する
+        can_retry() が False を返す場合（ストリームの途中まで受け取った場合など）は再試行しない
+        """
+        attempt = 0
+        while True:
+            error = None
+            await self.concurrency.acquire()
+            try:
+                await self._wait_for_budget(estimated_tokens)
+                started = time.monotonic()
+                result = await call()
+            except Exception as e:
+                retryable, throttle = classify(e)
+                if throttle:
+                    self._stats["throttled"] += 1
+                    if self.concurrency.decrease(started):
+                        logger.warning("🚦 OpenAIの制限により同時実行数を %s に下げます（%s）", int(self.concurrency.limit), type(e).__name__)
+                if not retryable or attempt >= LLM_MAX_RETRIES or not can_retry():
+                    raise
+                error = e
+            else:
+                await self.concurrency.increase()
+                return result
+            finally:
+                await self.concurrency.release()
+
+            delay = self.backoff(attempt, error)
+            attempt += 1
+            self._stats["retries"] += 1
+            logger.warning("🔁 OpenAI呼び出しを %.1f秒後に再試行します（%s/%s回目: %s）", delay, attempt, LLM_MAX_RETRIES, type(error).__name__)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "concurrency_limit": int(self.concurrency.limit),
+            "active": self.concurrency.active,
+            "requests_per_minute": int(self.requests.capacity),
+            "tokens_per_minute": int(self.tokens.capacity),
+            "retries": self._stats["retries"],
+            "throttled": self._stats["throttled"],
+            "waited_seconds": round(self._stats["waited_seconds"], 2),
+        }
@@ -0,0 +1,104 @@
+"""
+OpenAIへのHTTP接続プール
+
+OpenAIクライアントが使う httpx.AsyncClient を1つだけ作り、全呼び出しで共有する。
+- 接続数の上限は governor の同時実行数の上限、保持する接続数は同時実行数の初期値に合わせる
+  （同時に送る分だけ接続を使い回し、TLSハンドシェイクをやり直さない）
+- h2 パッケージがあれば HTTP/2 を使う（1本の接続で複数のリクエストを多重化する）
+- 接続・読み取りのタイムアウトを明示する
+- 接続数・待機中の接続数・新しく張った接続の数を PooledTransport.stats() で返す（/health の llm_calls.http_pool）
+"""
+import importlib.util
+import logging
+import os
+from typing import Dict, Optional
+
+import httpx
+
+import governor
+
+logger = logging.getLogger("tag_suggestion_api")
+
+# HTTP/2 を使うか（h2 パッケージがない場合は HTTP/1.1）
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 接続数の上限・保持する接続数・使われていない接続を閉じるまでの秒数
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", str(governor.LLM_CONCURRENCY_CEILING)))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", str(governor.LLM_MAX_CONCURRENCY)))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+
+# タイムアウト秒数（接続 / 読み取り。読み取りは推論の長い応答を待てる長さにする）
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "600"))
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """接続プールの利用状況を数える transport"""
+
+    def __init__(self, *, http2: bool = False, **kwargs):
+        super().__init__(http2=http2, **kwargs)
+        self.http2 = http2
+        self._seen = set()  # これまでに使った接続（新しく張った接続を数えるため）
+        self._stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "opened_connections": 0}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+        try:
+            response = await super().handle_async_request(request)
+        finally:
+            self._stats["in_flight"] -= 1
+            self._count_new_connections()
+        return response
+
+    def _count_new_connections(self):
+        connections = self._pool.connections
+        current = {id(connection) for connection in connections}
+        self._stats["opened_connections"] += len(current - self._seen)
+        # 閉じた接続は忘れる（id が使い回されても数えられるように）
+        self._seen = current
+
+    def stats(self) -> Dict[str, object]:
+        connections = list(self._pool.connections)
+        return dict(
+            self._stats,
+            http2_enabled=self.http2,
+            connections=len(connections),
+            idle=sum(1 for connection in connections if connection.is_idle()),
+            http2=sum(1 for connection in connections if "HTTP/2" in connection.info()),
+        )
+
+
+def create_transport(
+    *,
+    http2: Optional[bool] = None,
+    max_connections: int = LLM_POOL_MAX_CONNECTIONS,
+    max_keepalive: int = LLM_POOL_MAX_KEEPALIVE,
+    keepalive_expiry: float = LLM_POOL_KEEPALIVE_EXPIRY,
+) -> PooledTransport:
+    """設定どおりの接続プール"""
+    if http2 is None:
+        http2 = LLM_HTTP2 and HTTP2_AVAILABLE
+    return PooledTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+
+
+def create_client(transport: httpx.AsyncBaseTransport) -> httpx.AsyncClient:
+    """transport を使う httpx.AsyncClient（OpenAIクライアントの http_client に渡す）"""
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+if LLM_HTTP2 and not HTTP2_AVAILABLE:
+    logger.info("🔌 h2 パッケージがないため、OpenAIへの接続は HTTP/1.1 を使います")
@@ -0,0 +1,273 @@
+"""
+バックグラウンドジョブ
+
+時間のかかる処理（フォルダ構成分析など）をジョブとして非同期に実行する。
+クライアントはジョブIDを受け取り、HTTP接続を保持せずに状態をポーリングできる。
+
+- JobManager: プロセス内のワーカープール（同時実行数を制限）
+- InMemoryJobStore: メモリ上に保存（再起動で消える）
+- SQLiteJobStore: SQLiteに保存（再起動後も参照でき、中断したジョブは再実行される）
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("tag_suggestion_api")
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+# 実行中のジョブID（report_progress がどのジョブの進捗かを判定する）
+_current_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job_id", default=None)
+_current_manager: contextvars.ContextVar[Optional["JobManager"]] = contextvars.ContextVar("current_job_manager", default=None)
+
+
+def current_job_id() -> Optional[str]:
+    """実行中のジョブID（ジョブ外なら None）"""
+    return _current_job_id.get()
+
+
+def report_progress(stage: str, partial: Any = None, **counts) -> None:
+    """
+    実行中のジョブに進捗（段階名・途中結果・件数など）を記録する
+    ジョブ外（通常のHTTPリクエスト）から呼ばれた場合は何もしない
+    """
+    job_id = _current_job_id.get()
+    manager = _current_manager.get()
+    if job_id is None or manager is None:
+        return
+    progress = {"stage": stage, **counts}
+    if partial is not None:
+        progress["partial"] = partial
+    manager.store.update(job_id, progress=progress)
+
+
+class JobStore:
+    """ジョブの保存先のインターフェース"""
+
+    def create(self, job: dict) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> None:
+        raise NotImplementedError
+
+    def list_unfinished(self) -> List[dict]:
+        raise NotImplementedError
+
+    def purge_finished(self, older_than: float) -> int:
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """メモリ上のジョブストア"""
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+
+    def create(self, job: dict) -> None:
+        self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.update(fields, updated_at=time.time())
+
+    def list_unfinished(self) -> List[dict]:
+        return [dict(job) for job in self._jobs.values() if job["status"] not in FINISHED_STATUSES]
+
+    def purge_finished(self, older_than: float) -> int:
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATUSES and job["updated_at"] < older_than
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """SQLiteのジョブストア（サーバー再起動後もジョブを参照できる）"""
+
+    _JSON_FIELDS = ("payload", "progress", "result")
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    def _encode(self, fields: dict) -> dict:
+        return {
+            key: json.dumps(value, ensure_ascii=False) if key in self._JSON_FIELDS and value is not None else value
+            for key, value in fields.items()
+        }
+
+    def _decode(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for key in self._JSON_FIELDS:
+            if job.get(key) is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+    def create(self, job: dict) -> None:
+        encoded = self._encode(job)
+        columns = ", ".join(encoded)
+        placeholders = ", ".join("?" for _ in encoded)
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", list(encoded.values()))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def update(self, job_id: str, **fields) -> None:
+        encoded = self._encode({**fields, "updated_at": time.time()})
+        assignments = ", ".join(f"{key} = ?" for key in encoded)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*encoded.values(), job_id])
+
+    def list_unfinished(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def purge_finished(self, older_than: float) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+                (SUCCEEDED, FAILED, CANCELLED, older_than),
+            )
+        return cursor.rowcount
+
+
+class UnknownJobKind(Exception):
+    pass
+
+
+class JobManager:
+    """
+    ジョブの投入・実行・キャンセルを管理する
+    handlers: ジョブ種別 -> 非同期関数（payload を受け取り、JSON化できる結果を返す）
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: Dict[str, Callable[[dict], Awaitable[Any]]],
+        *,
+        max_workers: int = 4,
+        ttl_seconds: float = 24 * 60 * 60,
+        error_message: Callable[[BaseException], str] = str,
+    ):
+        self.store = store
+        self.handlers = handlers
+        self.ttl_seconds = ttl_seconds
+        self.error_message = error_message
+        self._workers = asyncio.Semaphore(max(1, max_workers))
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, kind: str, payload: dict) -> dict:
+        """ジョブを登録してバックグラウンドで実行を開始する"""
+        if kind not in self.handlers:
+            raise UnknownJobKind(kind)
+        self.store.purge_finished(time.time() - self.ttl_seconds)
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": QUEUED,
+            "payload": payload,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.store.create(job)
+        self._start(job["id"], kind, payload)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """実行待ち・実行中のジョブをキャンセルする（終了済みのジョブはそのまま返す）"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        self.store.update(job_id, status=CANCELLED)
+        return self.store.get(job_id)
+
+    def resume_unfinished(self) -> int:
+        """前回のプロセスで終了しなかったジョブを再実行する（SQLiteストア向け）"""
+        jobs = self.store.list_unfinished()
+        for job in jobs:
+            if job["kind"] not in self.handlers:
+                self.store.update(job["id"], status=FAILED, error=f"不明なジョブ種別: {job['kind']}")
+                continue
+            self.store.update(job["id"], status=QUEUED, progress=None)
+            self._start(job["id"], job["kind"], job["payload"])
+        return len(jobs)
+
+    def _start(self, job_id: str, kind: str, payload: dict) -> None:
+        task = asyncio.get_running_loop().create_task(self._run(job_id, kind, payload))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str, kind: str, payload: dict) -> None:
+        async with self._workers:
+            _current_job_id.set(job_id)
+            _current_manager.set(self)
+            self.store.update(job_id, status=RUNNING)
+            started = time.time()
+            logger.info("🧵 ジョブ開始: %s (%s)", kind, job_id)
+            try:
+                result = await self.handlers[kind](payload)
+            except asyncio.CancelledError:
+                self.store.update(job_id, status=CANCELLED)
+                logger.info("🛑 ジョブキャンセル: %s (%s)", kind, job_id)
+                raise
+            except Exception as e:
+                self.store.update(job_id, status=FAILED, error=self.error_message(e))
+                logger.error("❌ ジョブ失敗: %s (%s): %s", kind, job_id, e)
+            else:
+                self.store.update(job_id, status=SUCCEEDED, result=result)
+                logger.info("✅ ジョブ完了: %s (%s) 処理時間: %.2f秒", kind, job_id, time.time() - started)
@@ -0,0 +1,97 @@
+"""
+ストリーミング応答の逐次JSON解析
+
+LLMがストリーミングで返すJSON（{"assignments": [{...}, {...}, ...]}）から、
+配列の要素が1つ閉じるたびにその要素だけを取り出す。
+応答が途中で切れても、それまでに閉じた要素は失われない。
+"""
+import json
+import re
+from typing import List
+
+
+class JsonArrayStreamParser:
+    """
+    指定したキーの配列要素（オブジェクト）を逐次取り出すパーサー
+
+    使い方:
+        parser = JsonArrayStreamParser("assignments")
+        for text in deltas:
+            for item in parser.feed(text):
+                ...
+    """
+
+    def __init__(self, key: str):
+        self._key_pattern = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self._buffer = ""
+        self._pos = 0  # 次に読む位置
+        self._in_array = False
+        self._depth = 0  # 配列要素内のネストの深さ
+        self._in_string = False
+        self._escape = False
+        self._start = None  # 現在の要素の開始位置
+        self.closed = False  # 配列の閉じ括弧まで読んだか
+        self.count = 0  # 取り出した要素数
+        self.invalid = 0  # JSONとして解析できなかった要素数
+
+    def feed(self, text: str) -> List[dict]:
+        """テキストの差分を追加し、新たに完成した配列要素を返す"""
+        self._buffer += text
+        items: List[dict] = []
+
+        if not self._in_array:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return items
+            self._in_array = True
+            self._pos = match.end()
+
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and not self.closed:
+            ch = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._start = pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # 配列自体の閉じ括弧
+                    self.closed = ch == "]"
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._start is not None:
+                        item = self._parse(buffer[self._start:pos + 1])
+                        if item is not None:
+                            items.append(item)
+                        self._start = None
+            pos += 1
+        self._pos = pos
+
+        # 解析済みの部分は捨てて、バッファが応答全体の長さまで伸びないようにする
+        keep_from = self._start if self._start is not None else self._pos
+        self._buffer = buffer[keep_from:]
+        self._pos -= keep_from
+        if self._start is not None:
+            self._start = 0
+        return items
+
+    def _parse(self, text: str):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            self.invalid += 1
+            return None
+        if not isinstance(item, dict):
+            return None
+        self.count += 1
+        return item
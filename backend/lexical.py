@@ -0,0 +1,168 @@
+"""
+ローカルの字句マッチングによるタグ候補のスコアリング
+
+LLMを呼ばずに、既存タグとブックマーク（タイトル・URL・メモ）の字句的な一致を採点する。
+- 英数字: 単語単位で一致を判定（"go" が "google" に一致しないように境界を見る）
+- 日本語: 文字種（ひらがな・カタカナ・漢字）の切れ目での一致と、文字bigramの重なり（表記の一部違いを拾う）
+  単語の途中での一致（「コンテスト」の中の「テスト」、「日本語」の中の「日本」）は部分一致として扱う
+- URL: ホスト名とパスを単語に分解して一致を判定（例: /python-async → python, async）
+
+スコアは 0〜1。タイトルでの完全一致が最も高く、URL・メモの順に低くなる。
+部分一致のスコアは完全一致より必ず低く、confident_tags は部分一致だけのタグを確定させない。
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+# 英数字の語（c++, c#, node.js のような記号入りの語も1語として扱う）
+_ASCII_WORD = re.compile(r"[a-z0-9](?:[a-z0-9+#.]*[a-z0-9+#])?")
+# ひらがな・カタカナ・漢字の連続
+_JAPANESE_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\u30fc\u3005]+")
+# 単語の切れ目とみなす文字種の境界（同じ文字種が続く間は1語とみなす）
+_SCRIPT_CLASSES = {
+    "hiragana": r"\u3040-\u309f",
+    "katakana": r"\u30a0-\u30ff",  # 長音符「ー」を含む
+    "kanji": r"\u3400-\u9fff\uf900-\ufaff\u3005",
+    "alnum": r"a-z0-9",
+}
+# URLのホスト名から除く語
+_URL_STOPWORDS = frozenset({"www", "com", "net", "org", "jp", "co", "io", "html", "htm", "php", "index", "https", "http"})
+
+# フィールドごとの重み（完全一致したときのスコア）
+FIELD_WEIGHTS = {"title": 1.0, "url": 0.8, "excerpt": 0.7}
+# bigramの一致率がこの値未満なら部分一致とみなさない
+MIN_NGRAM_COVERAGE = 0.5
+# 部分一致のスコアは完全一致より低くする（メモでの完全一致 0.7 より低い値にする）
+PARTIAL_MATCH_FACTOR = 0.6
+# 完全一致とみなすタグの最短の文字数（1文字のタグはどこにでも現れるため部分一致扱い）
+MIN_EXACT_LENGTH = 2
+
+
+def normalize(text: str) -> str:
+    """NFKC正規化して小文字にする（全角英数字・半角カナの違いを吸収）"""
+    return unicodedata.normalize("NFKC", text or "").casefold()
+
+
+def char_ngrams(text: str, n: int = 2) -> FrozenSet[str]:
+    """日本語部分の文字n-gram（1文字しかない部分はその文字）"""
+    grams = set()
+    for run in _JAPANESE_RUN.findall(text):
+        if len(run) < n:
+            grams.add(run)
+        else:
+            grams.update(run[i:i + n] for i in range(len(run) - n + 1))
+    return frozenset(grams)
+
+
+def _script_class(char: str) -> Optional[str]:
+    for characters in _SCRIPT_CLASSES.values():
+        if re.match(f"[{characters}]", char):
+            return characters
+    return None
+
+
+def tokenize(text: str) -> List[str]:
+    """正規化済みのテキストを英数字の語と日本語の連続に分ける"""
+    return _ASCII_WORD.findall(text) + _JAPANESE_RUN.findall(text)
+
+
+def url_tokens(url: str) -> FrozenSet[str]:
+    """URLのホスト名とパスを語に分解する"""
+    try:
+        parts = urlsplit(normalize(unquote(url or "")))
+    except ValueError:
+        return frozenset()
+    words = set(parts.hostname.split(".")) if parts.hostname else set()
+    words.update(tokenize(re.sub(r"[-_/.]+", " ", parts.path)))
+    return frozenset(word for word in words if word and word not in _URL_STOPWORDS)
+
+
+class _TagFeatures:
+    __slots__ = ("tag", "normalized", "ascii_pattern", "word_pattern", "ngrams")
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.normalized = normalize(tag).strip()
+        # 英数字で始まり英数字で終わるタグは、前後が英数字でない位置でだけ一致させる
+        self.ascii_pattern = None
+        if self.normalized and self.normalized.isascii():
+            self.ascii_pattern = re.compile(
+                r"(?<![a-z0-9])" + re.escape(self.normalized) + r"(?![a-z0-9])"
+            )
+        # それ以外は、前後が先頭・末尾と同じ文字種でない位置（単語の切れ目）でだけ一致させる
+        self.word_pattern = None
+        if self.normalized:
+            before = _script_class(self.normalized[0])
+            after = _script_class(self.normalized[-1])
+            self.word_pattern = re.compile(
+                (f"(?<![{before}])" if before else "")
+                + re.escape(self.normalized)
+                + (f"(?![{after}])" if after else "")
+            )
+        self.ngrams = char_ngrams(self.normalized)
+
+
+@lru_cache(maxsize=4096)
+def _tag_features(tag: str) -> _TagFeatures:
+    return _TagFeatures(tag)
+
+
+class _FieldText:
+    __slots__ = ("text", "ngrams", "tokens")
+
+    def __init__(self, text: str, tokens: FrozenSet[str] = frozenset()):
+        self.text = text
+        self.ngrams = char_ngrams(text)
+        self.tokens = tokens
+
+
+def _field_score(features: _TagFeatures, field: _FieldText) -> float:
+    """1つのフィールドに対するタグの一致度（0〜1）"""
+    if not features.normalized or not field.text:
+        return 0.0
+    exact = len(features.normalized) >= MIN_EXACT_LENGTH
+    if features.ascii_pattern is not None:
+        if features.normalized in field.tokens or features.ascii_pattern.search(field.text):
+            return 1.0 if exact else PARTIAL_MATCH_FACTOR
+        return 0.0
+    if features.word_pattern.search(field.text):
+        return 1.0 if exact else PARTIAL_MATCH_FACTOR
+    if not features.ngrams:
+        return 0.0
+    coverage = len(features.ngrams & field.ngrams) / len(features.ngrams)
+    return coverage * PARTIAL_MATCH_FACTOR if coverage >= MIN_NGRAM_COVERAGE else 0.0
+
+
+def score_tags(tags: Sequence[str], *, title: str = "", url: str = "", excerpt: str = "") -> List[Tuple[str, float]]:
+    """
+    各タグのスコアを高い順に返す（同点は元の順序）
+    スコア = フィールドの重み × 一致度 の最大値
+    """
+    url_words = url_tokens(url)
+    fields: Dict[str, _FieldText] = {
+        "title": _FieldText(normalize(title)),
+        "url": _FieldText(" ".join(sorted(url_words)), url_words),
+        "excerpt": _FieldText(normalize(excerpt)),
+    }
+    scored = []
+    for tag in dict.fromkeys(tags):
+        features = _tag_features(tag)
+        score = max(
+            FIELD_WEIGHTS[name] * _field_score(features, field)
+            for name, field in fields.items()
+        )
+        scored.append((tag, score))
+    scored.sort(key=lambda item: -item[1])
+    return scored
+
+
+def confident_tags(scored: Sequence[Tuple[str, float]], threshold: float, limit: int = 3) -> List[str]:
+    """スコアが閾値以上で、いずれかのフィールドに完全一致したタグ（最大 limit 個）"""
+    return [tag for tag, score in scored if score >= threshold and score > PARTIAL_MATCH_FACTOR][:limit]
+
+
+def narrow_candidates(scored: Sequence[Tuple[str, float]], limit: int) -> List[str]:
+    """LLMに渡す候補をスコアの高い順に limit 個に絞る"""
+    return [tag for tag, _ in scored[:limit]]
@@ -0,0 +1,246 @@
+"""
+OpenAI 呼び出しの非同期レイヤー
+
+全エンドポイントはこのモジュール経由でLLMを呼び出す。
+AsyncOpenAI を使うため、LLMの応答待ちの間もイベントループはブロックされない。
+
+同じ内容のリクエストが同時に実行中の場合は、OpenAIへの呼び出しを1回にまとめ
+（single-flight）、全員が同じ結果を受け取る。
+送信量の制限・再試行・同時実行数の調整は governor.py が行う。
+応答時間・トークン数・途中で切れた応答の数はここで metrics.py に記録する。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+import governor as governor_module
+import http_pool
+import metrics
+import tokens
+
+# 環境変数の読み込み
+load_dotenv()
+
+logger = logging.getLogger("tag_suggestion_api")
+
+# 実行中の同一リクエストをまとめるか
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+# OpenAI クライアントの初期化（再試行は governor で行うため、クライアント側では再試行しない）
+# HTTP接続は全呼び出しで1つのプールを共有する
+transport = http_pool.create_transport()
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=0,
+    http_client=http_pool.create_client(transport),
+)
+
+# 全呼び出しで共有する送信量の制御
+governor = governor_module.Governor()
+
+# 呼び出し回数（upstream: OpenAIへ実際に送った回数 / coalesced: 実行中の呼び出しにまとめた回数）
+_stats = {"upstream_calls": 0, "coalesced_calls": 0}
+
+
+def stats() -> Dict[str, int]:
+    """LLM呼び出しの統計"""
+    return dict(_stats, in_flight=len(_in_flight), governor=governor.stats(), http_pool=transport.stats())
+
+
+class _Flight:
+    """実行中の呼び出し（待っている呼び出し元の数を数え、全員いなくなったらキャンセルする）"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+_in_flight: Dict[str, _Flight] = {}
+
+
+def _request_key(kind: str, kwargs: dict) -> str:
+    encoded = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{kind}:{encoded}".encode("utf-8")).hexdigest()
+
+
+async def _single_flight(key: str, call: Callable[[], Awaitable]):
+    """
+    同じキーの呼び出しが実行中ならその結果を待ち、なければ call() を実行する
+    呼び出し元の1人がキャンセルされても、他に待っている呼び出し元がいれば処理は続く
+    """
+    flight = _in_flight.get(key)
+    if flight is None:
+        flight = _Flight(asyncio.ensure_future(call()))
+        _in_flight[key] = flight
+
+        def forget(_):
+            if _in_flight.get(key) is flight:
+                del _in_flight[key]
+
+        flight.task.add_done_callback(forget)
+    else:
+        _stats["coalesced_calls"] += 1
+        logger.info("🔗 実行中の同一リクエストに合流しました（合流数: %s）", _stats['coalesced_calls'])
+
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+
+
+def _estimated_tokens(kwargs) -> int:
+    """トークン数/分の制限で数える量（OpenAI と同じくプロンプト + 応答の上限）"""
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0
+    return tokens.estimate_messages(kwargs.get("messages") or []) + int(completion)
+
+
+async def _send(create, *, parse=True, **kwargs):
+    """1回分の呼び出し（応答ヘッダで送信量の制限を更新し、本体を返す。parse=False なら生の応答）"""
+    _stats["upstream_calls"] += 1
+    raw = await create(**kwargs)
+    governor.observe(raw.headers)
+    return raw.parse() if parse else raw
+
+
+async def _create(**kwargs):
+    async with metrics.llm_call("chat", kwargs) as call:
+        response = await governor.run(
+            lambda: _send(client.chat.completions.with_raw_response.create, **kwargs),
+            estimated_tokens=_estimated_tokens(kwargs),
+        )
+        call.record(response)
+    _calibrate(kwargs, getattr(response, "usage", None))
+    return response
+
+
+def _calibrate(kwargs, usage):
+    """実際のプロンプトのトークン数でトークン数の見積もりを補正する"""
+    if usage is not None and kwargs.get("messages"):
+        tokens.calibrate(kwargs["messages"], getattr(usage, "prompt_tokens", None))
+
+
+async def chat_completion(**kwargs):
+    """
+    chat.completions.create の非同期ラッパー
+    送信量を governor で制御し、実行中の同一リクエストはまとめる
+    """
+    async with metrics.waiting_on_llm():
+        if not LLM_SINGLE_FLIGHT:
+            return await _create(**kwargs)
+        return await _single_flight(_request_key("chat", kwargs), lambda: _create(**kwargs))
+
+
+async def embeddings(**kwargs):
+    """embeddings.create の非同期ラッパー（送信量の制限は chat と共有）"""
+    inputs = kwargs.get("input") or []
+    estimated = tokens.estimate_tokens(inputs) if isinstance(inputs, str) else sum(tokens.estimate_tokens(str(text)) for text in inputs)
+    async with metrics.waiting_on_llm(), metrics.llm_call("embeddings", kwargs) as call:
+        response = await governor.run(
+            lambda: _send(client.embeddings.with_raw_response.create, **kwargs),
+            estimated_tokens=estimated,
+        )
+        call.record(response)
+    return response
+
+
+async def chat_completion_stream(on_delta: Callable[[str], None], **kwargs):
+    """
+    chat.completions.create をストリーミングで呼び出す
+    本文の差分を受け取るたびに on_delta(テキスト) を呼び、
+    最後に通常の応答と同じ形（choices[0].message.content / finish_reason / usage）の結果を返す
+    実行中の同一リクエストに合流した場合は、完了後に本文全体を1回で on_delta に渡す
+    """
+    if not LLM_SINGLE_FLIGHT:
+        async with metrics.waiting_on_llm():
+            return await _stream(on_delta, **kwargs)
+
+    leader = []
+
+    async def call():
+        leader.append(True)
+        return await _stream(on_delta, **kwargs)
+
+    async with metrics.waiting_on_llm():
+        response = await _single_flight(_request_key("stream", kwargs), call)
+    if not leader and response.choices[0].message.content:
+        on_delta(response.choices[0].message.content)
+    return response
+
+
+async def _iter_sse(response: httpx.Response):
+    """
+    SSE の data を JSON で順に返す
+    SDK のストリームは [DONE] で読むのをやめて応答を閉じるため、HTTP/1.1 では接続が捨てられる。
+    ここでは [DONE] の後も最後まで読むので、接続はプールに戻って次の呼び出しで使い回される
+    """
+    try:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data and data != "[DONE]":
+                yield json.loads(data)
+    except httpx.TimeoutException as e:
+        raise openai.APITimeoutError(request=response.request) from e
+    except httpx.TransportError as e:
+        raise openai.APIConnectionError(request=response.request) from e
+    finally:
+        await response.aclose()
+
+
+async def _stream(on_delta: Callable[[str], None], **kwargs):
+    parts = []
+    finish_reason = None
+    usage = None
+
+    async def attempt():
+        nonlocal finish_reason, usage
+        raw = await _send(
+            client.chat.completions.with_raw_response.create,
+            parse=False,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        async for chunk in _iter_sse(raw.http_response):
+            if chunk.get("error"):
+                error = chunk["error"]
+                message = error.get("message") if isinstance(error, dict) else None
+                raise openai.APIError(message or "An error occurred during streaming", raw.http_response.request, body=error)
+            if chunk.get("usage"):
+                usage = SimpleNamespace(**chunk["usage"])
+            if not chunk.get("choices"):
+                continue
+            choice = chunk["choices"][0]
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                parts.append(text)
+                on_delta(text)
+
+    async with metrics.llm_call("stream", kwargs) as call:
+        # 本文を受け取り始めた後のエラーは再試行しない（on_delta に渡した分を取り消せないため）
+        await governor.run(attempt, estimated_tokens=_estimated_tokens(kwargs), can_retry=lambda: not parts)
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(
+                message=SimpleNamespace(content="".join(parts)),
+                finish_reason=finish_reason,
+            )],
+            usage=usage,
+        )
+        call.record(response)
+    _calibrate(kwargs, usage)
+    return response
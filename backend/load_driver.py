@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+5つのエンドポイントの負荷テスト（オフライン）
+
+ローカルの偽OpenAIサーバー（openai_stub.py）を起動し、OpenAIクライアントの接続先をそこに向けて、
+実際のブックマークに近いリクエストを各エンドポイントに同時に送る。
+OpenAIクライアント・送信量の制御（governor）・接続プールは本番と同じものを通る。
+エンドポイントごとに RPS・p50/p95/p99 の応答時間・OpenAIへの呼び出し回数を表示する。
+APIキーやネットワークは不要（CIで実行できる）。
+
+使い方:
+    python load_driver.py
+    python load_driver.py --requests 50 --concurrency 16 --latency 0.2 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+import openai
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-load-driver")
+
+import governor  # noqa: E402
+import http_pool  # noqa: E402
+import llm  # noqa: E402
+import openai_stub  # noqa: E402
+from main import app  # noqa: E402
+
+# フォルダ -> (タグ, タイトルの語)
+TOPICS = {
+    "プログラミング / Python": (["Python", "プログラミング", "機械学習"], ["Python", "Django", "FastAPI", "pandas", "非同期処理"]),
+    "プログラミング / JavaScript": (["JavaScript", "Web開発", "フロントエンド"], ["React", "TypeScript", "Node.js", "Vue", "CSS"]),
+    "AI": (["AI", "機械学習", "LLM"], ["ChatGPT", "プロンプト", "画像生成", "ファインチューニング", "RAG"]),
+    "料理": (["料理", "レシピ", "時短"], ["カレー", "パスタ", "作り置き", "お弁当", "スイーツ"]),
+    "旅行": (["旅行", "ホテル", "観光"], ["京都", "北海道", "温泉", "格安航空券", "沖縄"]),
+    "仕事 / 生産性": (["仕事", "生産性", "ツール"], ["タスク管理", "Notion", "ショートカット", "会議", "メール術"]),
+    "デザイン": (["デザイン", "UI", "配色"], ["Figma", "フォント", "アイコン", "ロゴ", "レイアウト"]),
+    "その他": (["メモ"], ["あとで読む", "まとめ", "気になる記事"]),
+}
+FORMATS = ["{word}入門", "{word}の使い方まとめ", "【2024年版】{word}の基本", "{word}で作るサンプル", "初心者向け{word}ガイド", "{word} tips and tricks"]
+
+
+def make_bookmarks(rng, count, *, with_id=True):
+    bookmarks = []
+    for i in range(count):
+        folder = rng.choice(list(TOPICS))
+        tags, words = TOPICS[folder]
+        word = rng.choice(words)
+        bookmark = {
+            "title": rng.choice(FORMATS).format(word=word),
+            "url": f"https://example.com/{rng.randrange(10 ** 6)}",
+            "excerpt": f"{word}について解説した記事です。" * rng.randint(0, 3),
+            "current_tags": rng.sample(tags, rng.randint(0, len(tags))),
+            "current_folder": folder.split(" / ")[-1],
+        }
+        if with_id:
+            bookmark["id"] = f"bm-{i}"
+        bookmarks.append(bookmark)
+    return bookmarks
+
+
+def all_tags():
+    return sorted({tag for tags, _ in TOPICS.values() for tag in tags})
+
+
+def current_folders():
+    folders = []
+    for path in TOPICS:
+        parts = path.split(" / ")
+        for depth, name in enumerate(parts):
+            folder = {"name": name, "parent": parts[depth - 1] if depth else ""}
+            if folder not in folders:
+                folders.append(folder)
+    return folders
+
+
+# エンドポイント -> リクエストボディを作る関数（リクエストごとに内容を変え、応答キャッシュに当たらないようにする）
+SCENARIOS = {
+    "/suggest-tags": lambda rng: (lambda bm: {
+        "title": bm["title"], "url": bm["url"], "excerpt": bm["excerpt"], "existing_tags": all_tags(),
+    })(make_bookmarks(rng, 1)[0]),
+    "/analyze-tag-structure": lambda rng: {"bookmarks": make_bookmarks(rng, 200, with_id=False), "current_tags": all_tags()},
+    "/bulk-assign-tags": lambda rng: {"bookmarks": make_bookmarks(rng, 50), "available_tags": all_tags()},
+    "/analyze-folder-structure": lambda rng: {"bookmarks": make_bookmarks(rng, 300, with_id=False), "current_folders": current_folders()},
+    "/bulk-assign-folders": lambda rng: {"bookmarks": make_bookmarks(rng, 100), "available_folders": list(TOPICS) + ["未分類"]},
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_endpoint(client, stub, path, *, requests, concurrency, seed):
+    rng = random.Random(seed)
+    payloads = [SCENARIOS[path](rng) for _ in range(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], Counter()
+    calls_before, faults_before = stub.calls, Counter(stub.faults)
+
+    async def one(payload):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(payload) for payload in payloads])
+    elapsed = time.perf_counter() - started
+    return {
+        "path": path,
+        "requests": requests,
+        "ok": statuses[200],
+        "statuses": dict(statuses),
+        "rps": requests / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "upstream_calls": stub.calls - calls_before,
+        "faults": dict(Counter(stub.faults) - faults_before),
+    }
+
+
+async def run(args):
+    stub = openai_stub.StubOpenAI(
+        args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    async with openai_stub.serve(stub):
+        # 本番と同じクライアント・接続プール・送信量の制御で偽サーバーに送る
+        llm.transport = http_pool.create_transport()
+        llm.client = openai.AsyncOpenAI(
+            api_key="sk-load-driver", base_url=stub.base_url, max_retries=0,
+            http_client=http_pool.create_client(llm.transport),
+        )
+        llm.governor = governor.Governor()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-driver", timeout=600) as client:
+            results = []
+            for path in args.endpoints:
+                results.append(await run_endpoint(
+                    client, stub, path, requests=args.requests, concurrency=args.concurrency, seed=args.seed,
+                ))
+        await llm.client.close()
+    return results, stub.stats(), llm.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="偽OpenAIサーバーに対する5エンドポイントの負荷テスト")
+    parser.add_argument("--requests", type=int, default=20, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に送るリクエスト数")
+    parser.add_argument("--latency", type=float, default=0.05, help="偽OpenAIの応答時間の中央値（秒）")
+    parser.add_argument("--jitter", type=float, default=0.5, help="応答時間のばらつき（対数正規分布のσ）")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="429を返す割合")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="応答を途中で切る割合")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="壊れたJSONを返す割合")
+    parser.add_argument("--min-success", type=float, default=0.95, help="成功率（HTTP 200）がこれを下回ると終了コード1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--endpoints", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args(argv)
+
+    results, stub_stats, llm_stats = asyncio.run(run(args))
+    success = sum(result["ok"] for result in results) / max(1, sum(result["requests"] for result in results))
+
+    if args.json:
+        print(json.dumps({"results": results, "stub": stub_stats, "llm": llm_stats, "success": success}, ensure_ascii=False, indent=2))
+    else:
+        print("=" * 96)
+        print(f"🧪 負荷テスト（偽OpenAI: 中央値 {args.latency * 1000:.0f}ms / 429 {args.error_rate:.0%} / "
+              f"途中切れ {args.truncate_rate:.0%} / 壊れたJSON {args.malformed_rate:.0%}、同時{args.concurrency}件）")
+        print("=" * 96)
+        print(f"{'エンドポイント':<28}{'成功':>8}{'RPS':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'OpenAI呼び出し':>16}")
+        for result in results:
+            print(
+                f"{result['path']:<28}{result['ok']:>4}/{result['requests']:<3}{result['rps']:>9.1f}"
+                f"{result['p50'] * 1000:>8.0f}ms{result['p95'] * 1000:>8.0f}ms{result['p99'] * 1000:>8.0f}ms{result['upstream_calls']:>16}"
+            )
+            if result["faults"] or set(result["statuses"]) - {200}:
+                print(f"{'':<28}ステータス: {result['statuses']} / 偽OpenAIの障害: {result['faults']}")
+        print(f"\n📡 呼び出し内訳: {stub_stats['calls_by_kind']} / 障害: {stub_stats['faults']}")
+        print(f"🚦 governor: {llm_stats['governor']}")
+        print(f"🔌 接続プール: 接続 {llm_stats['http_pool']['opened_connections']}本 / リクエスト {llm_stats['http_pool']['requests']}件")
+        print(f"\n{'✅' if success >= args.min_success else '❌'} 成功率 {success:.1%}（基準 {args.min_success:.0%}）")
+    return 0 if success >= args.min_success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
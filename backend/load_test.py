@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+"""
+同時リクエストの負荷テストスクリプト
+
+OpenAIクライアントを一定時間スリープする偽物に差し替え、
+複数のリクエストが直列ではなく並行して処理されることを確認する。
+APIキーやネットワークは不要。
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+
+import logging
+import tempfile
+
+import httpx
+import openai
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+
+import folder_tree  # noqa: E402
+import governor  # noqa: E402
+import http_pool  # noqa: E402
+import llm  # noqa: E402
+import logging_setup  # noqa: E402
+import main as api  # noqa: E402
+import mece  # noqa: E402
+import openai_stub  # noqa: E402
+from main import app  # noqa: E402
+
+FAKE_LATENCY = 1.0  # 偽LLMの応答時間（秒）
+CONCURRENT_REQUESTS = 10
+
+
+class FakeCompletions:
+    """chat.completions.create の代わりに一定時間待ってから応答する"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.headers = {}
+
+    @property
+    def with_raw_response(self):
+        """with_raw_response.create の代わり（応答ヘッダ・parse()・ストリーミングでは SSE の http_response を持つ）"""
+        async def create(**kwargs):
+            result = await self.create(**kwargs)
+            http_response = None
+            if kwargs.get("stream"):
+                request = httpx.Request("POST", "http://fake-openai/v1/chat/completions")
+                http_response = httpx.Response(200, content=result, request=request)
+            return SimpleNamespace(headers=self.headers, parse=lambda: result, http_response=http_response)
+        return SimpleNamespace(create=create)
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        content = "Python, プログラミング"
+        if kwargs.get("response_format"):
+            # JSONモード: プロンプト中のブックマークIDすべてに割り当てを返す
+            prompt = kwargs["messages"][-1]["content"]
+            content = json.dumps({"assignments": [
+                {"bookmark_id": bookmark_id, "suggested_tags": ["Python"], "suggested_folder": "未分類"}
+                for bookmark_id in re.findall(r"ID:([^ |]+) \|", prompt)
+            ]}, ensure_ascii=False)
+        if kwargs.get("stream"):
+            return self._sse(content, {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110})
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=10, total_tokens=110)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(
+                message=SimpleNamespace(content=content),
+                finish_reason="stop",
+            )],
+            usage=usage,
+        )
+
+    def _sse(self, content, usage, piece_size=40):
+        """ストリーミング応答のSSE: 本文を少しずつ送り、最後にusageだけのチャンクと [DONE] を送る"""
+        chunks = [
+            {"choices": [{
+                "delta": {"content": content[start:start + piece_size]},
+                "finish_reason": "stop" if start + piece_size >= len(content) else None,
+            }]}
+            for start in range(0, len(content), piece_size)
+        ]
+        chunks.append({"choices": [], "usage": usage})
+        lines = [f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n" for chunk in chunks] + ["data: [DONE]\n\n"]
+        return "".join(lines).encode("utf-8")
+
+
+async def run_load_test():
+    completions = FakeCompletions(FAKE_LATENCY)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    payload = {
+        "title": "Pythonの非同期プログラミング入門",
+        "url": "https://example.com/python-async",
+        "excerpt": "asyncioを使った非同期処理の基礎を学ぶ",
+        "existing_tags": ["Python", "プログラミング", "AI", "Web開発"],
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as http:
+        async def timed_health():
+            # LLM待ちの最中に /health が即座に返るかを測る
+            await asyncio.sleep(FAKE_LATENCY / 2)
+            started = time.perf_counter()
+            await http.get("/health")
+            return time.perf_counter() - started
+
+        # LLM呼び出しの並行性を測るため、字句一致による事前判定は止める
+        lexical_enabled, api.SUGGEST_TAGS_LEXICAL = api.SUGGEST_TAGS_LEXICAL, False
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            # 同一リクエストはまとめられるため、タイトルを変えて別々のリクエストにする
+            *[http.post("/suggest-tags", json=dict(payload, title=f"{payload['title']} {i}")) for i in range(CONCURRENT_REQUESTS)],
+            timed_health(),
+        )
+        elapsed = time.perf_counter() - started
+        api.SUGGEST_TAGS_LEXICAL = lexical_enabled
+
+    responses, health_latency = results[:-1], results[-1]
+    return {
+        "elapsed": elapsed,
+        "serial_estimate": FAKE_LATENCY * CONCURRENT_REQUESTS,
+        "status_codes": [r.status_code for r in responses],
+        "max_in_flight": completions.max_in_flight,
+        "health_latency": health_latency,
+    }
+
+
+async def run_bulk_tags_test(bookmark_count=20):
+    """/bulk-assign-tags のファンアウトで総処理時間が短縮されるかを測る"""
+    completions = FakeCompletions(FAKE_LATENCY)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    payload = {
+        "bookmarks": [
+            {"id": str(i), "title": f"Python記事 {i}", "url": f"https://example.com/{i}", "current_tags": []}
+            for i in range(bookmark_count)
+        ],
+        "available_tags": ["Python", "プログラミング", "AI", "Web開発"],
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as http:
+        # LLMへのファンアウトを測るため、埋め込みによる事前割り当ては止める
+        embedding_enabled, api.ASSIGN_BY_EMBEDDING = api.ASSIGN_BY_EMBEDDING, False
+        started = time.perf_counter()
+        response = await http.post("/bulk-assign-tags", json=payload)
+        elapsed = time.perf_counter() - started
+        api.ASSIGN_BY_EMBEDDING = embedding_enabled
+
+    ids = [s["bookmark_id"] for s in response.json()["suggestions"]]
+    return {
+        "elapsed": elapsed,
+        "serial_estimate": FAKE_LATENCY * bookmark_count,
+        "max_in_flight": completions.max_in_flight,
+        "upstream_calls": completions.calls,
+        "ordered": ids == [str(i) for i in range(bookmark_count)],
+    }
+
+
+async def run_coalescing_test():
+    """同一内容の同時リクエストがOpenAIへの1回の呼び出しにまとめられるかを確かめる"""
+    completions = FakeCompletions(FAKE_LATENCY)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    coalesced_before = llm.stats()["coalesced_calls"]
+
+    payload = {
+        "title": "同時に送られた同じブックマーク",
+        "url": "https://example.com/same",
+        "excerpt": "",
+        "existing_tags": ["Python", "プログラミング"],
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as http:
+        responses = await asyncio.gather(
+            *[http.post("/suggest-tags", json=payload) for _ in range(CONCURRENT_REQUESTS)]
+        )
+
+    return {
+        "status_codes": [r.status_code for r in responses],
+        "upstream_calls": completions.calls,
+        "coalesced": llm.stats()["coalesced_calls"] - coalesced_before,
+    }
+
+
+async def run_lexical_test(request_count=200):
+    """タイトルに既存タグが含まれるブックマークはLLMを呼ばずに返るかを測る"""
+    completions = FakeCompletions(FAKE_LATENCY)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    tags = ["Python", "JavaScript", "機械学習", "デザイン", "AI", "Web開発"]
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    sources = set()
+    # 字句一致による事前判定はデフォルトで無効なため、この計測の間だけ有効にする
+    lexical_enabled, api.SUGGEST_TAGS_LEXICAL = api.SUGGEST_TAGS_LEXICAL, True
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as http:
+        for i in range(request_count):
+            payload = {
+                "title": f"{tags[i % len(tags)]}の入門記事 その{i}",
+                "url": f"https://example.com/articles/{i}",
+                "excerpt": "",
+                "existing_tags": tags,
+            }
+            started = time.perf_counter()
+            response = await http.post("/suggest-tags", json=payload)
+            latencies.append(time.perf_counter() - started)
+            sources.add(response.headers.get("X-Suggestion-Source"))
+    api.SUGGEST_TAGS_LEXICAL = lexical_enabled
+
+    latencies.sort()
+    return {
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "upstream_calls": completions.calls,
+        "sources": sources,
+    }
+
+
+async def run_embedding_test(bookmark_count=3000):
+    """/bulk-assign-folders で、似たブックマークが埋め込みだけで割り当てられるかを測る"""
+    completions = FakeCompletions(FAKE_LATENCY)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    topics = [
+        ("プログラミング / Python", ["Python", "Django", "pandas", "FastAPI", "NumPy"], "python"),
+        ("プログラミング / JavaScript", ["JavaScript", "React", "Node.js", "TypeScript", "Vue"], "javascript"),
+        ("デザイン / UI", ["UIデザイン", "Figma", "配色", "タイポグラフィ", "ワイヤーフレーム"], "design"),
+        ("料理 / レシピ", ["パスタ", "カレー", "和食", "お弁当", "スイーツ"], "recipe"),
+    ]
+    suffixes = ["入門", "まとめ", "チュートリアル", "のコツ", "ベストプラクティス", "徹底解説", "メモ"]
+    hosts = ["qiita.com", "zenn.dev", "note.com", "medium.com", "dev.to"]
+
+    def bookmark(i):
+        folder, words, slug = topics[i % len(topics)]
+        return {
+            "id": str(i),
+            "title": f"{words[i % len(words)]}{suffixes[i % len(suffixes)]} {words[(i // 7) % len(words)]}",
+            "url": f"https://{hosts[i % len(hosts)]}/{slug}/{i}",
+            "current_folder": folder if i % 3 else "未分類",
+        }
+
+    payload = {
+        "bookmarks": [bookmark(i) for i in range(bookmark_count)],
+        "available_folders": [topic[0] for topic in topics] + ["未分類"],
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as http:
+        embedding_enabled, api.ASSIGN_BY_EMBEDDING = api.ASSIGN_BY_EMBEDDING, True
+        started = time.perf_counter()
+        response = await http.post("/bulk-assign-folders", json=payload)
+        elapsed = time.perf_counter() - started
+        api.ASSIGN_BY_EMBEDDING = embedding_enabled
+
+    suggestions = response.json()["suggestions"]
+    correct = sum(
+        s["suggested_folder"] == topics[int(s["bookmark_id"]) % len(topics)][0] for s in suggestions
+    )
+    return {
+        "elapsed": elapsed,
+        "count": len(suggestions),
+        "correct": correct,
+        "upstream_calls": completions.calls,
+    }
+
+
+def _legacy_hierarchy_view(folders):
+    """以前の階層表示（ノードごとに全フォルダを走査する O(n²) の実装。比較用）"""
+    lines = []
+
+    def add(folder, indent=0):
+        lines.append(("  " * indent + "├─ " if indent > 0 else "") + folder["name"])
+        for child in [f for f in folders if f.get("parent") == folder["name"]]:
+            add(child, indent + 1)
+
+    for folder in [f for f in folders if not f.get("parent")]:
+        add(folder)
+    return "\n".join(lines)
+
+
+def run_folder_tree_test(node_count=10000, legacy_count=2000):
+    """フォルダ階層の表示・フルパス・差分の計算時間を測る（循環を含むツリーで終了することも確認）"""
+    def random_tree(count, seed):
+        rng = random.Random(seed)
+        folders = []
+        for i in range(count):
+            parent = folders[rng.randrange(len(folders))]["name"] if folders and rng.random() < 0.9 else ""
+            folders.append({"name": f"フォルダ{i}", "parent": parent})
+        return folders
+
+    current = random_tree(node_count, 0)
+    # 提案: 1割の親を付け替え、1割を削除、新規を1割追加し、循環を1つ作る
+    rng = random.Random(1)
+    suggested = [dict(folder) for folder in current if rng.random() >= 0.1]
+    for folder in rng.sample(suggested, len(suggested) // 10):
+        folder["parent"] = suggested[rng.randrange(len(suggested))]["name"]
+    suggested.extend({"name": f"新規{i}", "parent": ""} for i in range(node_count // 10))
+    suggested.extend([{"name": "循環A", "parent": "循環B"}, {"name": "循環B", "parent": "循環A"}])
+
+    started = time.perf_counter()
+    tree = folder_tree.FolderTree.from_folders(suggested)
+    current_tree = folder_tree.FolderTree.from_folders(current)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rendered = tree.render()
+    paths = tree.paths()
+    traverse = time.perf_counter() - started
+
+    started = time.perf_counter()
+    diff = tree.diff(current_tree, protected=mece.PROTECTED_FOLDERS)
+    final_structure = diff.final_structure()
+    plan = diff.merge_plan()
+    diff_time = time.perf_counter() - started
+
+    legacy_folders = random_tree(legacy_count, 2)
+    started = time.perf_counter()
+    _legacy_hierarchy_view(legacy_folders)
+    legacy = time.perf_counter() - started
+    started = time.perf_counter()
+    folder_tree.FolderTree.from_folders(legacy_folders).render()
+    indexed = time.perf_counter() - started
+
+    return {
+        "count": len(tree),
+        "build": build,
+        "traverse": traverse,
+        "diff": diff_time,
+        "complete": rendered.count("\n") + 1 == len(tree) == len(paths),
+        "final_count": len(final_structure),
+        "new": len(diff.new),
+        "moved": len(diff.moved),
+        "to_remove": len(diff.to_remove),
+        "plan": len(plan),
+        "legacy_count": legacy_count,
+        "legacy": legacy,
+        "indexed": indexed,
+    }
+
+
+class RateLimitedCompletions(FakeCompletions):
+    """同時に capacity 件を超えると 429（Retry-After 付き）を返す偽LLM"""
+
+    def __init__(self, latency, capacity):
+        super().__init__(latency)
+        self.capacity = capacity
+        self.rejected = 0
+
+    async def create(self, **kwargs):
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            request = httpx.Request("POST", "http://fake-openai/v1/chat/completions")
+            response = httpx.Response(429, request=request, headers={"retry-after-ms": str(int(self.latency * 1000))})
+            raise openai.RateLimitError("Rate limit reached", response=response, body=None)
+        return await super().create(**kwargs)
+
+
+async def run_governor_test(request_count=400, capacity=8, latency=0.05):
+    """
+    同時実行数の上限がある偽LLMに一斉に送り、429 を再試行・同時実行数の調整で吸収できるかを確かめる
+    理想の処理時間（上限いっぱいで処理し続けた場合）と比べたスループットを測る
+    """
+    completions = RateLimitedCompletions(latency, capacity)
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    original = llm.governor
+    llm.governor = governor.Governor()
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[
+            llm.chat_completion(model="fake", messages=[{"role": "user", "content": f"質問{i}"}])
+            for i in range(request_count)
+        ], return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        stats = llm.governor.stats()
+    finally:
+        llm.governor = original
+    return {
+        "count": request_count,
+        "failed": sum(isinstance(result, Exception) for result in results),
+        "elapsed": elapsed,
+        "ideal": request_count / capacity * latency,
+        "rejected": completions.rejected,
+        "retries": stats["retries"],
+        "concurrency_limit": stats["concurrency_limit"],
+        "capacity": capacity,
+    }
+
+
+async def run_http_pool_test(request_count=160, concurrency=16, latency=0.1, handshake=0.05):
+    """
+    ローカルの偽OpenAIサーバーに同時 concurrency 件で送り、接続を使い回さない場合と共有プールを比べる
+    新しい接続には handshake 秒（TLSハンドシェイクの代わり）がかかる
+    """
+    async def drive(stub, transport):
+        client = openai.AsyncOpenAI(
+            api_key="sk-load-test", base_url=stub.base_url, max_retries=0,
+            http_client=http_pool.create_client(transport),
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                await client.chat.completions.create(model="stub", messages=[{"role": "user", "content": f"質問{i}"}])
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(request_count)])
+        elapsed = time.perf_counter() - started
+        await client.close()
+        latencies.sort()
+        return {
+            "elapsed": elapsed,
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[int(len(latencies) * 0.95)],
+            "connections": transport.stats()["opened_connections"],
+        }
+
+    async with openai_stub.serve(latency=latency, handshake=handshake) as stub:
+        no_reuse = await drive(stub, http_pool.create_transport(max_keepalive=0))
+        pooled = await drive(stub, http_pool.create_transport())
+    return {"count": request_count, "concurrency": concurrency, "handshake": handshake, "no_reuse": no_reuse, "pooled": pooled}
+
+
+class SlowStream:
+    """1回の書き込みに write_latency 秒かかる出力（詰まったパイプ・コンテナのログドライバの代わり）"""
+
+    def __init__(self, stream, write_latency):
+        self.stream = stream
+        self.write_latency = write_latency
+        self.name = stream.name
+
+    def write(self, text):
+        time.sleep(self.write_latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+async def run_logging_test(rounds=15, requests_per_round=4, folder_count=1000, bookmark_count=100, write_latency=0.0002):
+    """
+    /analyze-folder-structure 1件あたりのログのコストを測る（ログを止めた場合との差）
+    以前の設定: イベントループ上で出力に書き、フォルダ一覧などの大きな内容も出す（このアプリのロガーは DEBUG）
+    キュー: 書き込みは別スレッド、大きな内容は INFO では組み立てない
+    マシンの負荷の揺れを打ち消すため、3つの設定を交互に測る
+    """
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(0)))
+    payload = {
+        "bookmarks": [
+            {"title": f"記事{i}", "url": f"https://example.com/{i}", "current_folder": f"フォルダ{i % 50}"}
+            for i in range(bookmark_count)
+        ],
+        "current_folders": [{"name": f"フォルダ{i}", "parent": f"フォルダ{i // 10}" if i >= 10 else ""} for i in range(folder_count)],
+    }
+    root = logging.getLogger()
+    timings = {"disabled": [], "sync": [], "queued": []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        sync_stream = open(os.path.join(directory, "sync.log"), "w", encoding="utf-8")
+        queued_path = os.path.join(directory, "queued.log")
+        queued_stream = open(queued_path, "w", encoding="utf-8")
+        sync_handler = logging.StreamHandler(SlowStream(sync_stream, write_latency))
+        sync_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+        def use(mode):
+            logging_setup.shutdown()
+            logging.disable(logging.CRITICAL if mode == "disabled" else logging.NOTSET)
+            api.logger.setLevel(logging.DEBUG if mode == "sync" else logging.NOTSET)
+            if mode == "sync":
+                root.handlers[:] = [sync_handler]
+                root.setLevel(logging.INFO)
+            elif mode == "queued":
+                logging_setup.configure(level="INFO", stream=SlowStream(queued_stream, write_latency))
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-test") as http:
+            async def measure(mode):
+                use(mode)
+                for _ in range(requests_per_round):
+                    started = time.perf_counter()
+                    response = await http.post("/analyze-folder-structure", json=payload)
+                    timings[mode].append(time.perf_counter() - started)
+                    assert response.status_code == 200, response.text
+
+            await measure("disabled")  # ウォームアップ
+            timings["disabled"].clear()
+            for _ in range(rounds):
+                for mode in timings:
+                    await measure(mode)
+
+        use("disabled")
+        logging.disable(logging.NOTSET)
+        sync_stream.close()
+        queued_stream.close()
+        with open(queued_path, encoding="utf-8") as written:
+            records = [json.loads(line) for line in written]
+
+    logging_setup.configure()
+    median = {mode: sorted(values)[len(values) // 2] for mode, values in timings.items()}
+    return {
+        "count": rounds * requests_per_round,
+        "folders": folder_count,
+        "write_latency": write_latency,
+        "disabled": median["disabled"],
+        "sync_overhead": median["sync"] - median["disabled"],
+        "queued_overhead": median["queued"] - median["disabled"],
+        "records": len(records),
+        "with_request_id": sum(1 for record in records if record.get("request_id")),
+    }
+
+
+def main():
+    print("=" * 60)
+    print("🧪 同時リクエスト負荷テスト")
+    print("=" * 60)
+    print(f"📝 偽LLM応答時間: {FAKE_LATENCY:.1f}秒 × {CONCURRENT_REQUESTS}リクエスト")
+
+    result = asyncio.run(run_load_test())
+
+    print(f"\n⏱️  総処理時間: {result['elapsed']:.2f}秒（直列なら約{result['serial_estimate']:.1f}秒）")
+    print(f"🔀 LLM同時実行数（最大）: {result['max_in_flight']}")
+    print(f"🏥 LLM待機中の /health 応答時間: {result['health_latency'] * 1000:.1f}ms")
+    print(f"📊 ステータスコード: {result['status_codes']}")
+
+    bulk = asyncio.run(run_bulk_tags_test())
+    print(f"\n📦 /bulk-assign-tags: {bulk['elapsed']:.2f}秒（直列なら約{bulk['serial_estimate']:.1f}秒）")
+    print(f"🔀 LLM同時実行数（最大）: {bulk['max_in_flight']}")
+    print(f"📡 LLM呼び出し回数: {bulk['upstream_calls']}")
+    print(f"🔢 入力順を維持: {'✅' if bulk['ordered'] else '❌'}")
+
+    coalescing = asyncio.run(run_coalescing_test())
+    print(f"\n🔗 同一リクエスト {CONCURRENT_REQUESTS}件の同時送信")
+    print(f"📡 LLM呼び出し回数: {coalescing['upstream_calls']}（合流: {coalescing['coalesced']}件）")
+    print(f"📊 ステータスコード: {coalescing['status_codes']}")
+
+    lexical = asyncio.run(run_lexical_test())
+    print(f"\n🔎 字句一致による提案: p50 {lexical['p50'] * 1000:.1f}ms / p95 {lexical['p95'] * 1000:.1f}ms")
+    print(f"📡 LLM呼び出し回数: {lexical['upstream_calls']}（提案元: {', '.join(sorted(map(str, lexical['sources'])))}）")
+
+    embedding = asyncio.run(run_embedding_test())
+    print(f"\n🧭 埋め込みによるフォルダ割り当て: {embedding['count']}件 {embedding['elapsed']:.2f}秒")
+    print(f"🎯 正解: {embedding['correct']}/{embedding['count']}件 / 📡 LLM呼び出し回数: {embedding['upstream_calls']}")
+
+    tree = run_folder_tree_test()
+    print(f"\n🌲 フォルダ階層 {tree['count']}件: 構築 {tree['build'] * 1000:.1f}ms / 階層表示+フルパス {tree['traverse'] * 1000:.1f}ms / 差分 {tree['diff'] * 1000:.1f}ms")
+    print(f"📊 新規 {tree['new']}（うち移動 {tree['moved']}） / 削除 {tree['to_remove']} / 統合計画 {tree['plan']}件 / 全件を1回ずつ表示: {'✅' if tree['complete'] else '❌'}")
+    print(f"⚖️  {tree['legacy_count']}件の階層表示: 以前の実装 {tree['legacy'] * 1000:.1f}ms → 索引 {tree['indexed'] * 1000:.1f}ms")
+
+    governed = asyncio.run(run_governor_test())
+    print(f"\n🚦 同時{governed['capacity']}件までの偽LLMへ {governed['count']}件: {governed['elapsed']:.2f}秒（理想 {governed['ideal']:.2f}秒 / 効率 {governed['ideal'] / governed['elapsed']:.0%}）")
+    print(f"🔁 429: {governed['rejected']}回 / 再試行: {governed['retries']}回 / 失敗: {governed['failed']}件 / 同時実行数の上限: {governed['concurrency_limit']}")
+
+    pool = asyncio.run(run_http_pool_test())
+    print(f"\n🔌 偽OpenAIサーバーへ {pool['count']}件（同時{pool['concurrency']}件、新しい接続はハンドシェイク {pool['handshake'] * 1000:.0f}ms）")
+    for label, key in (("接続を使い回さない", "no_reuse"), ("共有プール", "pooled")):
+        item = pool[key]
+        print(f"   {label}: {item['elapsed']:.2f}秒 / p50 {item['p50'] * 1000:.1f}ms / p95 {item['p95'] * 1000:.1f}ms / 接続 {item['connections']}本")
+
+    logged = asyncio.run(run_logging_test())
+    print(f"\n📝 /analyze-folder-structure（既存フォルダ {logged['folders']}件）1件あたりのログのコスト（中央値、ログなし {logged['disabled'] * 1000:.1f}ms との差、出力への書き込み {logged['write_latency'] * 1000:.1f}ms/回）")
+    print(f"   以前の設定（同期書き込み・大きな内容も出力）: {logged['sync_overhead'] * 1000:.2f}ms")
+    print(f"   キュー（別スレッドで書き込み・INFO）: {logged['queued_overhead'] * 1000:.2f}ms")
+    print(f"   JSONレコード {logged['records']}件（リクエストID付き: {logged['with_request_id']}件）")
+
+    overlapped = (
+        result["elapsed"] < result["serial_estimate"] / 2 and result["max_in_flight"] > 1
+        and bulk["elapsed"] < bulk["serial_estimate"] / 2 and bulk["ordered"]
+        and (coalescing["upstream_calls"] == 1 or not llm.LLM_SINGLE_FLIGHT)
+        and lexical["upstream_calls"] == 0
+        and tree["complete"]
+        and governed["failed"] == 0
+        and pool["pooled"]["connections"] <= pool["concurrency"]
+        and logged["queued_overhead"] < logged["sync_overhead"]
+    )
+    print("\n" + "=" * 60)
+    print("✅ リクエストは並行処理されています" if overlapped else "❌ リクエストが直列に処理されています")
+    print("=" * 60)
+    return 0 if overlapped else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+"""
+ログの出力設定
+
+リクエストの処理中（イベントループ上）にはログの整形・書き込みをしない。
+- QueueHandler: レコードをキューに入れるだけ（本文の組み立ては引数が変更可能なオブジェクトの場合のみ）
+- QueueListener: 別スレッドでJSON（または text）に整形して標準エラー出力に書く
+- 各レコードにリクエストID（X-Request-ID）と実行中のジョブIDを付ける
+- キューが一杯のときは待たずに捨て、捨てた件数を stats() で返す（/health の logging）
+
+ログの呼び出しは logger.info("...: %s", value) の形で書き、レベルが無効なら本文を組み立てない。
+プロンプト・応答の本文などの大きな内容は logger.debug で出す（LOG_LEVEL=DEBUG のときだけ出力される）。
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+import jobs
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json / text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REQUEST_ID_HEADER = "x-request-id"
+
+# 実行中のHTTPリクエストのID
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+# 後から変更されないため、本文の組み立てをリスナーのスレッドに任せられる引数の型
+_IMMUTABLE = (str, int, float, bool, type(None))
+
+
+class ContextQueueHandler(QueueHandler):
+    """リクエストID・ジョブIDを付けてキューに入れる（キューが一杯なら捨てる）"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # contextvar は呼び出し元のスレッドでしか読めないため、ここで付ける
+        record.request_id = request_id.get()
+        record.job_id = jobs.current_job_id()
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE) for arg in args)):
+            # dict・list などはキューで待つ間に変更されうるため、この時点の内容で本文を組み立てる
+            record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "job_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """人が読む形式（ローカルでの開発用）"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.request_id = getattr(record, "request_id", None) or getattr(record, "job_id", None) or "-"
+        return super().format(record)
+
+
+def create_formatter(log_format: str = LOG_FORMAT) -> logging.Formatter:
+    return TextFormatter() if log_format == "text" else JsonFormatter()
+
+
+_handler: Optional[ContextQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def configure(
+    *,
+    level: str = LOG_LEVEL,
+    log_format: str = LOG_FORMAT,
+    stream=None,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> None:
+    """ルートロガーの出力をキュー経由に切り替える（すでに設定済みなら置き換える）"""
+    global _handler, _listener
+    shutdown()
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(create_formatter(log_format))
+    _handler = ContextQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+
+def shutdown() -> None:
+    """キューに残っているレコードを書き出してリスナーを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
+
+
+def stats() -> Dict[str, object]:
+    return {
+        "level": logging.getLevelName(logging.getLogger().level),
+        "format": LOG_FORMAT,
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+    }
+
+
+class RequestIdMiddleware:
+    """
+    リクエストごとにIDを決めてログに付け、応答ヘッダ X-Request-ID で返す
+    クライアントが X-Request-ID を送った場合はそれを使う（不正な値なら新しく作る）
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                incoming = value.decode("latin-1")
+                break
+        current = incoming if incoming and _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        token = request_id.set(current)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), current.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
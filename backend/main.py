@@ -1,21 +1,46 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Union
 import os
+import asyncio
 from dotenv import load_dotenv
-from openai import OpenAI
 import logging
 import time
 import json
+from collections import Counter
+
+import numpy as np
+
+import llm
+import metrics
+from fanout import fan_out_iter
+from batching import pack_by_token_budget
+from chunking import ChunkError, iter_chunked
+from jsonstream import JsonArrayStreamParser
+import cache
+import clustering
+import embeddings
+import folder_tree
+import jobs
+import lexical
+import logging_setup
+import mece
+import move_plan
+import prompts
+import sampling
+import vector_index
+from memo import TagMemo
+import tokens
 
 # 環境変数の読み込み
 load_dotenv()
 
 app = FastAPI(title="Bookmark Tag Suggestion API")
 
-# ログ設定
-logging.basicConfig(level=logging.INFO)
+# ログ設定（書き込みは別スレッド。LOG_LEVEL / LOG_FORMAT）
+logging_setup.configure()
 logger = logging.getLogger("tag_suggestion_api")
 
 # reasoning_effortの環境変数（デフォルト値: "low"）
@@ -25,6 +50,144 @@ REASONING_EFFORT_BULK_ASSIGN_TAGS = os.getenv("REASONING_EFFORT_BULK_ASSIGN_TAGS
 REASONING_EFFORT_ANALYZE_FOLDER_STRUCTURE = os.getenv("REASONING_EFFORT_ANALYZE_FOLDER_STRUCTURE", "low")
 REASONING_EFFORT_BULK_ASSIGN_FOLDERS = os.getenv("REASONING_EFFORT_BULK_ASSIGN_FOLDERS", "low")
 
+# 一括タグ割り当ての並行実行設定
+BULK_ASSIGN_TAGS_MODEL = "gpt-5-mini"
+BULK_ASSIGN_TAGS_CONCURRENCY = int(os.getenv("BULK_ASSIGN_TAGS_CONCURRENCY", "8"))
+BULK_ASSIGN_TAGS_ITEM_TIMEOUT = float(os.getenv("BULK_ASSIGN_TAGS_ITEM_TIMEOUT", "60"))
+
+# 一括タグ割り当てのモード（batched: 複数件を1リクエストにまとめる / single: 1件ずつ）
+BULK_ASSIGN_TAGS_MODE = os.getenv("BULK_ASSIGN_TAGS_MODE", "batched")
+BULK_ASSIGN_TAGS_BATCH_TOKEN_BUDGET = int(os.getenv("BULK_ASSIGN_TAGS_BATCH_TOKEN_BUDGET", "6000"))
+BULK_ASSIGN_TAGS_MAX_BATCH_SIZE = int(os.getenv("BULK_ASSIGN_TAGS_MAX_BATCH_SIZE", "25"))
+BULK_ASSIGN_TAGS_BATCH_TIMEOUT = float(os.getenv("BULK_ASSIGN_TAGS_BATCH_TIMEOUT", "120"))
+BULK_ASSIGN_TAGS_BATCH_RETRIES = int(os.getenv("BULK_ASSIGN_TAGS_BATCH_RETRIES", "1"))
+
+# 一括フォルダ割り当てのチャンク設定
+BULK_ASSIGN_FOLDERS_CHUNK_TOKEN_BUDGET = int(os.getenv("BULK_ASSIGN_FOLDERS_CHUNK_TOKEN_BUDGET", "8000"))
+BULK_ASSIGN_FOLDERS_MAX_CHUNK_SIZE = int(os.getenv("BULK_ASSIGN_FOLDERS_MAX_CHUNK_SIZE", "50"))
+BULK_ASSIGN_FOLDERS_CONCURRENCY = int(os.getenv("BULK_ASSIGN_FOLDERS_CONCURRENCY", "4"))
+BULK_ASSIGN_FOLDERS_CHUNK_TIMEOUT = float(os.getenv("BULK_ASSIGN_FOLDERS_CHUNK_TIMEOUT", "180"))
+BULK_ASSIGN_FOLDERS_CHUNK_RETRIES = int(os.getenv("BULK_ASSIGN_FOLDERS_CHUNK_RETRIES", "2"))
+
+# プロンプトに入れるタイトル・メモのトークン数の上限（超える分は短縮）
+PROMPT_TITLE_MAX_TOKENS = int(os.getenv("PROMPT_TITLE_MAX_TOKENS", "80"))
+PROMPT_EXCERPT_MAX_TOKENS = int(os.getenv("PROMPT_EXCERPT_MAX_TOKENS", "150"))
+
+# /suggest-tags の応答キャッシュ（memory / sqlite / off）
+SUGGEST_TAGS_MODEL = "gpt-5-mini"
+SUGGEST_TAGS_CACHE = os.getenv("SUGGEST_TAGS_CACHE", "memory")
+SUGGEST_TAGS_CACHE_DB_PATH = os.getenv("SUGGEST_TAGS_CACHE_DB_PATH", "suggest_tags_cache.sqlite3")
+SUGGEST_TAGS_CACHE_TTL_SECONDS = float(os.getenv("SUGGEST_TAGS_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+SUGGEST_TAGS_CACHE_MAX_ENTRIES = int(os.getenv("SUGGEST_TAGS_CACHE_MAX_ENTRIES", "10000"))
+
+suggest_tags_cache = cache.create_cache(
+    SUGGEST_TAGS_CACHE,
+    SUGGEST_TAGS_CACHE_DB_PATH,
+    ttl_seconds=SUGGEST_TAGS_CACHE_TTL_SECONDS,
+    max_entries=SUGGEST_TAGS_CACHE_MAX_ENTRIES,
+)
+
+# /suggest-tags の字句一致による事前判定
+# スコア（0〜1）が閾値以上のタグがあればLLMを呼ばずに返す。なければLLMに渡す候補を上位 MAX_CANDIDATES 個に絞る
+# 字句一致したタグしか返さず、LLMとは提案が変わるため、明示的に有効にした場合だけ使う
+SUGGEST_TAGS_LEXICAL = os.getenv("SUGGEST_TAGS_LEXICAL", "false").lower() in ("1", "true", "yes")
+SUGGEST_TAGS_LEXICAL_THRESHOLD = float(os.getenv("SUGGEST_TAGS_LEXICAL_THRESHOLD", "0.9"))
+SUGGEST_TAGS_MAX_CANDIDATES = int(os.getenv("SUGGEST_TAGS_MAX_CANDIDATES", "50"))
+
+# ブックマーク単位のタグ提案メモ（/suggest-tags と /bulk-assign-tags で共有。memory / sqlite / off）
+TAG_MEMO = os.getenv("TAG_MEMO", "memory")
+TAG_MEMO_DB_PATH = os.getenv("TAG_MEMO_DB_PATH", "tag_memo.sqlite3")
+TAG_MEMO_TTL_SECONDS = float(os.getenv("TAG_MEMO_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+TAG_MEMO_MAX_ENTRIES = int(os.getenv("TAG_MEMO_MAX_ENTRIES", "100000"))
+
+if TAG_MEMO in ("memory", "sqlite"):
+    tag_memo = TagMemo(
+        cache.create_cache(
+            TAG_MEMO, TAG_MEMO_DB_PATH,
+            ttl_seconds=TAG_MEMO_TTL_SECONDS, max_entries=TAG_MEMO_MAX_ENTRIES, table="tag_memo",
+        ),
+        cache.create_cache(
+            TAG_MEMO, TAG_MEMO_DB_PATH,
+            ttl_seconds=TAG_MEMO_TTL_SECONDS, max_entries=1000, table="tag_vocabularies",
+        ),
+    )
+else:
+    tag_memo = None
+
+# 埋め込みベクトルによる事前割り当て（/bulk-assign-folders, /bulk-assign-tags）
+# スコアと2位との差が閾値以上のブックマークはLLMを呼ばずに割り当て、残りだけをLLMに送る
+# 割り当て結果が変わるため、明示的に有効にした場合だけ使う
+ASSIGN_BY_EMBEDDING = os.getenv("ASSIGN_BY_EMBEDDING", "false").lower() in ("1", "true", "yes")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")  # hashing / openai
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+EMBEDDING_MIN_SCORE = float(os.getenv("EMBEDDING_MIN_SCORE", "0.35"))
+EMBEDDING_MIN_MARGIN = float(os.getenv("EMBEDDING_MIN_MARGIN", "0.15"))
+
+embedder = embeddings.create_embedder(EMBEDDING_BACKEND, dim=EMBEDDING_DIM, model=EMBEDDING_MODEL)
+
+# ライブラリごとのベクトルインデックス（リクエストに library_id がある場合に使う）
+# 埋め込みをディスクに保存し、内容が変わったブックマークだけを再計算する
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+library_indexes = vector_index.LibraryIndexes(VECTOR_INDEX_DIR, embedder)
+
+# タグ構成分析でLLMに渡すブックマークの件数（タグ・フォルダで層別して選ぶ）
+ANALYZE_TAG_SAMPLE_SIZE = int(os.getenv("ANALYZE_TAG_SAMPLE_SIZE", "50"))
+
+# フォルダ構成分析: この件数を超えたらブックマークをクラスタに分け、クラスタの要約だけをLLMに渡す
+ANALYZE_FOLDER_DIGEST_THRESHOLD = int(os.getenv("ANALYZE_FOLDER_DIGEST_THRESHOLD", "200"))
+ANALYZE_FOLDER_MAX_CLUSTERS = int(os.getenv("ANALYZE_FOLDER_MAX_CLUSTERS", "40"))
+
+# フォルダ構成分析の最終チェック
+# 第1段階の提案はローカルのルール（重複・別名・循環・曖昧なフォルダ・件数の少ないフォルダ）で検証・修正し、
+# ルールで決められない点が残った場合だけLLMで最終調整する（auto / always / off）
+ANALYZE_FOLDER_REVIEW = os.getenv("ANALYZE_FOLDER_REVIEW", "auto")
+FOLDER_MIN_BOOKMARKS = int(os.getenv("FOLDER_MIN_BOOKMARKS", "3"))
+FOLDER_ALIASES_PATH = os.getenv("FOLDER_ALIASES_PATH")  # 別名辞書の追加分（JSON）
+
+mece_validator = mece.MeceValidator(mece.load_aliases(FOLDER_ALIASES_PATH), min_bookmarks=FOLDER_MIN_BOOKMARKS)
+
+# フォルダ構成分析で、移動先が統合・移動から決まらないブックマークを埋め込み・LLMで割り当てるか
+# false の場合は unresolved_bookmarks として返す（クライアントが /bulk-assign-folders で割り当てる）
+ANALYZE_FOLDER_ASSIGN_AMBIGUOUS = os.getenv("ANALYZE_FOLDER_ASSIGN_AMBIGUOUS", "true").lower() in ("1", "true", "yes")
+
+# Prometheus形式のメトリクス（/metrics）
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _cache_metrics():
+    """キャッシュのヒット数・ヒット率（/metrics の出力時に読む）"""
+    caches = [("suggest_tags", suggest_tags_cache), ("tag_memo", tag_memo)]
+    stats = [(name, c.stats()) for name, c in caches if c is not None]
+    index = library_indexes.stats()
+    yield "cache_hits_total", "counter", "Cache hits", [({"cache": name}, s["hits"]) for name, s in stats]
+    yield "cache_misses_total", "counter", "Cache misses", [({"cache": name}, s["misses"]) for name, s in stats]
+    yield "cache_hit_ratio", "gauge", "Cache hit ratio since start", [({"cache": name}, s["hit_rate"]) for name, s in stats]
+    yield "vector_index_embeddings_total", "counter", "Bookmark embeddings computed or reused from the vector index", [
+        ({"outcome": "embedded"}, index["embedded"]), ({"outcome": "reused"}, index["reused"]),
+    ]
+
+
+def _llm_metrics():
+    """送信量の制御・接続プール・合流した呼び出し（/metrics の出力時に読む）"""
+    stats = llm.stats()
+    yield "llm_coalesced_calls_total", "counter", "LLM calls merged into an identical in-flight call", [({}, stats["coalesced_calls"])]
+    yield "llm_concurrency_limit", "gauge", "Adaptive upstream concurrency limit", [({}, stats["governor"]["concurrency_limit"])]
+    yield "llm_retries_total", "counter", "Upstream retries", [({}, stats["governor"]["retries"])]
+    yield "llm_throttled_total", "counter", "Upstream 429/5xx responses", [({}, stats["governor"]["throttled"])]
+    yield "llm_http_connections", "gauge", "Pooled upstream HTTP connections", [
+        ({"state": "open"}, stats["http_pool"]["connections"]), ({"state": "idle"}, stats["http_pool"]["idle"]),
+    ]
+
+
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.register_collector(_cache_metrics)
+    metrics.register_collector(_llm_metrics)
+
+# ログにリクエストIDを付ける（応答ヘッダ X-Request-ID でも返す）
+app.add_middleware(logging_setup.RequestIdMiddleware)
+
 # CORS設定（Flutterアプリからのアクセスを許可）
 app.add_middleware(
     CORSMiddleware,
@@ -34,9 +197,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# OpenAI クライアントの初期化
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 
 # リクエスト/レスポンスモデル
 class TagSuggestionRequest(BaseModel):
@@ -54,6 +214,7 @@ class TagSuggestionResponse(BaseModel):
 class OptimalTagStructureRequest(BaseModel):
     bookmarks: List[dict]  # {title, url, excerpt, current_tags}
     current_tags: List[str]  # 現在存在する全タグ
+    library_id: Optional[str] = None  # ベクトルインデックスのライブラリID（英数字・-・_）
 
 
 class OptimalTagStructureResponse(BaseModel):
@@ -65,6 +226,13 @@ class OptimalTagStructureResponse(BaseModel):
 class BulkTagAssignmentRequest(BaseModel):
     bookmarks: List[dict]  # {id, title, url, excerpt, current_tags}
     available_tags: List[str]  # 利用可能な全タグリスト
+    library_id: Optional[str] = None  # ベクトルインデックスのライブラリID（英数字・-・_）
+
+
+class FailedChunk(BaseModel):
+    chunk_index: int  # 失敗したチャンクの番号（0始まり）
+    bookmark_ids: List[str]  # 処理できなかったブックマークID（再送用）
+    reason: str
 
 
 class BookmarkTagSuggestion(BaseModel):
@@ -77,12 +245,20 @@ class BulkTagAssignmentResponse(BaseModel):
     suggestions: List[BookmarkTagSuggestion]
     total_processed: int
     overall_reasoning: str
+    failed_chunks: List[FailedChunk] = []  # 処理できなかったチャンク
+
+
+class BookmarkFolderSuggestion(BaseModel):
+    bookmark_id: str
+    suggested_folder: str
+    reasoning: Optional[str] = None
 
 
 class OptimalFolderStructureRequest(BaseModel):
     bookmarks: List[dict]  # {title, url, excerpt, current_folder}
     current_folders: Union[List[str], List[dict]]  # フラットリストまたは階層情報付き [{name, parent}]
     instruction: Optional[str] = None  # ユーザーからの追加指示
+    library_id: Optional[str] = None  # ベクトルインデックスのライブラリID（英数字・-・_）
 
 
 class OptimalFolderStructureResponse(BaseModel):
@@ -90,24 +266,23 @@ class OptimalFolderStructureResponse(BaseModel):
     folders_to_remove: List[str]  # 削除を推奨するフォルダ
     overall_reasoning: str
     final_structure: Optional[List[dict]] = None  # 最終的なフォルダ構成（階層表示用）
+    bookmark_moves: Optional[List[BookmarkFolderSuggestion]] = None  # 移動が必要なブックマークと移動先（フォルダパス）
+    unresolved_bookmarks: List[str] = []  # 移動先を決められなかったブックマーク（/bulk-assign-folders で割り当てる）
 
 
 class BulkFolderAssignmentRequest(BaseModel):
     bookmarks: List[dict]  # {id, title, url, excerpt, current_folder}
     available_folders: List[str]  # 利用可能な全フォルダリスト
     instruction: Optional[str] = None  # ユーザーからの追加指示
+    library_id: Optional[str] = None  # ベクトルインデックスのライブラリID（英数字・-・_）
 
 
-class BookmarkFolderSuggestion(BaseModel):
-    bookmark_id: str
-    suggested_folder: str
-    reasoning: Optional[str] = None
-
 
 class BulkFolderAssignmentResponse(BaseModel):
     suggestions: List[BookmarkFolderSuggestion]
     total_processed: int
     overall_reasoning: str
+    failed_chunks: List[FailedChunk] = []  # 処理できなかったチャンク
 
 
 @app.get("/")
@@ -122,11 +297,29 @@ async def root():
 
 
 @app.post("/suggest-tags", response_model=TagSuggestionResponse)
-async def suggest_tags(request: TagSuggestionRequest):
+async def suggest_tags(request: TagSuggestionRequest, response: Response):
     """
     ブックマークの情報から既存のタグリストの中から適切なタグを自動提案する
+    同じ内容のリクエストはキャッシュから返す（X-Cache ヘッダーに HIT / MISS を設定）
+    """
+    result, headers = await _suggest_tags(request)
+    response.headers.update(headers)
+    return result
+
+
+async def _suggest_tags_job(request: TagSuggestionRequest):
+    """ジョブ用の /suggest-tags（応答ヘッダーはない）"""
+    result, _ = await _suggest_tags(request)
+    return result
+
+
+async def _suggest_tags(request: TagSuggestionRequest):
+    """
+    キャッシュ・字句一致・LLMの順にタグを提案する
+    戻り値: (TagSuggestionResponse, 応答ヘッダー X-Cache / X-Suggestion-Source)
     """
     start_time = time.time()
+    headers = {}
     
     try:
         # OpenAI API キーのチェック
@@ -141,60 +334,73 @@ async def suggest_tags(request: TagSuggestionRequest):
             return TagSuggestionResponse(
                 suggested_tags=[],
                 reasoning="既存のタグがないため、タグを提案できません。"
+            ), headers
+
+        cache_key = cache.make_key(
+            title=request.title,
+            url=request.url,
+            excerpt=request.excerpt,
+            existing_tags=request.existing_tags,
+            model=SUGGEST_TAGS_MODEL,
+            reasoning_effort=REASONING_EFFORT_SUGGEST_TAGS,
+        )
+        memo_options = {"model": SUGGEST_TAGS_MODEL, "reasoning_effort": REASONING_EFFORT_SUGGEST_TAGS}
+        cached = await suggest_tags_cache.aget(cache_key) if suggest_tags_cache is not None else None
+        if cached is None and tag_memo is not None:
+            # 一括割り当てなどで同じブックマークを処理済みならその結果を使う
+            memo_tags = await tag_memo.get(request.dict(), request.existing_tags, **memo_options)
+            if memo_tags is not None:
+                cached = {
+                    "suggested_tags": memo_tags,
+                    "reasoning": f"AIが分析した結果、{len(memo_tags)}個のタグを提案しました。",
+                }
+        if suggest_tags_cache is not None or tag_memo is not None:
+            headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+        if cached is not None:
+            logger.info("📊 [suggest-tags] キャッシュヒット（処理時間: %.3f秒）", time.time() - start_time)
+            return TagSuggestionResponse(**cached), headers
+
+        # 字句的な一致でタグを採点し、確信度が高ければLLMを呼ばずに返す
+        candidate_tags = request.existing_tags
+        if SUGGEST_TAGS_LEXICAL:
+            scored = lexical.score_tags(
+                request.existing_tags, title=request.title, url=request.url, excerpt=request.excerpt
             )
-
-        # プロンプトの作成
-        prompt = f"""あなたはブックマーク管理アシスタントです。
-以下のブックマーク情報を分析し、既存のタグリストから最も適切なタグを選んでください。
-
-【重要】タグとフォルダの使い分け
-- **フォルダ**: カテゴリや分類（例: 仕事、趣味、プロジェクト名など）
-- **タグ**: コンテンツの特徴や属性を表すキーワード
-  - そのブックマークの特徴・属性（技術スタック、テーマ、形式など）
-  - 検索・フィルタリングで使うキーワード
-  - 横断的な分類（複数のフォルダにまたがる特徴）
-
-【ブックマーク情報】
-タイトル: {request.title}
-URL: {request.url}
-メモ: {request.excerpt}
-
-【既存のタグリスト】
-{', '.join(request.existing_tags)}
-
-【指示】
-1. このブックマークの**特徴・属性**を表すタグを既存リストから1〜3個選んでください
-2. 検索やフィルタリングで使いやすいキーワードを優先してください
-3. 既存のタグリストに適切なものがない場合は、空のリストを返してください
-4. タグ名のみをカンマ区切りで返してください（説明は不要）
-
-良い例: 
-- 技術記事 → タグ: Python, AI, チュートリアル
-- デザイン参考 → タグ: UI/UX, レスポンシブ, モダン
-- ニュース記事 → タグ: テクノロジー, 最新動向, 2024年
-
-回答例: プログラミング, Python, AI"""
+            confident = lexical.confident_tags(scored, SUGGEST_TAGS_LEXICAL_THRESHOLD)
+            if confident:
+                headers["X-Suggestion-Source"] = "lexical"
+                logger.info("📊 [suggest-tags] 字句一致で提案（処理時間: %.3f秒）", time.time() - start_time)
+                logger.info("  ✅ 提案タグ数: %s", len(confident))
+                return TagSuggestionResponse(
+                    suggested_tags=confident,
+                    reasoning=f"タイトル・URL・メモとの一致から{len(confident)}個のタグを提案しました。"
+                ), headers
+            # 既存タグが多い場合は、LLMに渡す候補を関連しそうなものに絞る
+            candidate_tags = lexical.narrow_candidates(scored, SUGGEST_TAGS_MAX_CANDIDATES)
+            if len(candidate_tags) < len(request.existing_tags):
+                logger.info("  🔎 候補タグを絞り込み: %s → %s", len(request.existing_tags), len(candidate_tags))
+        headers["X-Suggestion-Source"] = "llm"
+
+        # プロンプトの作成（固定の指示文の後ろにタグリストとブックマーク情報を付ける）
+        prompt = prompts.SUGGEST_TAGS.render(
+            tags=', '.join(candidate_tags),
+            title=request.title,
+            url=request.url,
+            excerpt=request.excerpt,
+        )
+        logger.info("  🧮 %s", prompt.describe())
 
         # OpenAI APIを呼び出し
-        response = client.chat.completions.create(
-            model="gpt-5-mini",  # コスト効率の良いモデルを使用
-            messages=[
-                {
-                    "role": "system",
-                    "content": "あなたは正確で簡潔なタグ提案を行うアシスタントです。必ず既存のタグリストの中からのみ選択してください。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+        completion = await llm.chat_completion(
+            model=SUGGEST_TAGS_MODEL,  # コスト効率の良いモデルを使用
+            messages=prompt.messages,
             # reasoning_effort="medium",  # Render.comの古いopenaiライブラリではサポートされていないためコメントアウト
             max_completion_tokens=2000,
             reasoning_effort=REASONING_EFFORT_SUGGEST_TAGS,
         )
 
         # レスポンスからタグを抽出
-        suggested_text = response.choices[0].message.content.strip()
+        suggested_text = completion.choices[0].message.content.strip()
         
         # カンマ区切りのタグを分割
         suggested_tags = [
@@ -211,39 +417,99 @@ URL: {request.url}
 
         # 処理時間とトークン数をログ
         elapsed_time = time.time() - start_time
-        usage = response.usage
-        logger.info(f"📊 [suggest-tags] 処理完了")
-        logger.info(f"  ⏱️  処理時間: {elapsed_time:.2f}秒")
-        logger.info(f"  🔢 入力トークン: {usage.prompt_tokens}")
-        logger.info(f"  🔢 出力トークン: {usage.completion_tokens}")
-        logger.info(f"  🔢 合計トークン: {usage.total_tokens}")
-        logger.info(f"  ✅ 提案タグ数: {len(valid_tags)}")
-
-        return TagSuggestionResponse(
+        usage = completion.usage
+        logger.info("📊 [suggest-tags] 処理完了")
+        logger.info("  ⏱️  処理時間: %.2f秒", elapsed_time)
+        logger.info("  🔢 入力トークン: %s", usage.prompt_tokens)
+        logger.info("  🔢 出力トークン: %s", usage.completion_tokens)
+        logger.info("  🔢 合計トークン: %s", usage.total_tokens)
+        logger.info("  ✅ 提案タグ数: %s", len(valid_tags))
+
+        result = TagSuggestionResponse(
             suggested_tags=valid_tags,
             reasoning=f"AIが分析した結果、{len(valid_tags)}個のタグを提案しました。"
         )
+        if suggest_tags_cache is not None:
+            await suggest_tags_cache.aset(cache_key, result.dict())
+        if tag_memo is not None:
+            await tag_memo.set(request.dict(), request.existing_tags, valid_tags, **memo_options)
+        return result, headers
 
     except Exception as e:
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [suggest-tags] エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"タグAI自動提案エラー: {e}", exc_info=True)
+        logger.error("❌ [suggest-tags] エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("タグAI自動提案エラー: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"タグ提案の生成中にエラーが発生しました: {str(e)}"
         )
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus形式のメトリクス"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="メトリクスは無効です（METRICS_ENABLED=false）")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health_check():
     """ヘルスチェック用エンドポイント"""
     api_key_configured = bool(os.getenv("OPENAI_API_KEY"))
     return {
         "status": "healthy" if api_key_configured else "warning",
-        "openai_api_configured": api_key_configured
+        "openai_api_configured": api_key_configured,
+        "llm_calls": llm.stats(),
+        "vector_index": library_indexes.stats(),
+        "prompt_prefix_tokens": prompts.stats(),
+        "tokens": tokens.stats(),
+        "logging": logging_setup.stats()
     }
 
 
+async def _library_vectors(library_id, bookmarks, *, prune=False):
+    """
+    ブックマークをライブラリのベクトルインデックスに反映する
+    戻り値: bookmarks と同じ順のベクトル。library_id がない・不正な場合は None
+    """
+    if not library_id:
+        return None
+    if not vector_index.valid_library_id(library_id):
+        logger.warning("⚠️ 不正なライブラリIDのためインデックスを使いません: %r", library_id)
+        return None
+    started = time.time()
+    reused = library_indexes.reused
+    index, vectors = await library_indexes.sync(library_id, bookmarks, prune=prune)
+    logger.info(
+        "  🗂️ ベクトルインデックス[%s]: %s件（再利用: %s件、%.2f秒）",
+        library_id,
+        len(index),
+        library_indexes.reused - reused,
+        time.time() - started,
+    )
+    return vectors
+
+
+async def _bookmark_vectors(library_id, bookmarks, *, prune=False):
+    """ブックマークの埋め込み（library_id があればインデックスに保存済みのベクトルを使う）"""
+    vectors = await _library_vectors(library_id, bookmarks, prune=prune)
+    if vectors is not None:
+        return vectors
+    return await embedder.embed([embeddings.bookmark_text(bm) for bm in bookmarks])
+
+
+async def _folder_cluster_digest(library_id, bookmarks):
+    """ブックマークをクラスタに分け、プロンプト用の要約テキストを返す"""
+    started = time.time()
+    vectors = await _bookmark_vectors(library_id, bookmarks, prune=True)
+    k = clustering.suggest_cluster_count(len(bookmarks), max_clusters=ANALYZE_FOLDER_MAX_CLUSTERS)
+    # k-means は数万件で数百ミリ秒かかるため、イベントループを止めないよう別スレッドで実行する
+    digest = await asyncio.to_thread(clustering.cluster_digest, bookmarks, vectors, k)
+    logger.info("  🧩 クラスタ要約: %s件 → %sクラスタ（%.2f秒）", len(bookmarks), len(digest), time.time() - started)
+    return digest
+
+
 @app.post("/analyze-tag-structure", response_model=OptimalTagStructureResponse)
 async def analyze_tag_structure(request: OptimalTagStructureRequest):
     """
@@ -262,99 +528,37 @@ async def analyze_tag_structure(request: OptimalTagStructureRequest):
                 detail="OpenAI API key is not configured"
             )
 
-        # ブックマーク情報の要約
-        bookmark_summary = []
-        for i, bm in enumerate(request.bookmarks[:50]):  # 最初の50件を分析
-            bookmark_summary.append(
-                f"{i+1}. {bm.get('title', 'No title')} - タグ: {', '.join(bm.get('current_tags', []))}"
-            )
+        # タグの使用数は全件から正確に数え、ブックマーク一覧は現在のタグ・フォルダで層別した代表サンプルにする
+        # （library_id があればインデックスのベクトルで、層の中から互いに似ていないものを選ぶ）
+        sample_started = time.time()
+        usage = sampling.tag_usage(request.bookmarks)
+        vectors = None
+        if request.library_id and len(request.bookmarks) > ANALYZE_TAG_SAMPLE_SIZE:
+            vectors = await _library_vectors(request.library_id, request.bookmarks, prune=True)
+        sample = [
+            request.bookmarks[i]
+            for i in sampling.stratified_sample(request.bookmarks, ANALYZE_TAG_SAMPLE_SIZE, vectors=vectors, usage=usage)
+        ]
+        logger.info("  🎯 代表サンプル: %s件 → %s件（%.3f秒）", len(request.bookmarks), len(sample), time.time() - sample_started)
+        bookmark_summary = [
+            f"{bm.get('title', 'No title')} - タグ: {', '.join(bm.get('current_tags', []))}" for bm in sample
+        ]
 
         # プロンプトの作成
-        prompt = f"""あなたは熟練したブックマーク管理・情報整理の専門家です。
-以下のブックマーク一覧と現在のタグ構成を分析し、最適なタグ構成を提案してください。
-
-【重要】タグとフォルダの使い分け
-- **フォルダ**: 大分類・カテゴリ（例: 仕事、趣味、プロジェクト名）
-- **タグ**: コンテンツの特徴・属性を表すキーワード
-  - そのコンテンツの具体的な特徴（技術、テーマ、形式など）
-  - 検索・フィルタリング用のキーワード
-  - 横断的な分類（複数フォルダにまたがる特徴）
-
-【現在のタグ一覧】（全{len(request.current_tags)}個）
-{', '.join(request.current_tags) if request.current_tags else 'タグがありません'}
-
-【ブックマーク一覧】（全{len(request.bookmarks)}件、表示は最初の50件）
-{chr(10).join(bookmark_summary)}
-
-【分析と提案】
-以下の観点で分析し、改善案を提案してください：
-
-1. **新規タグの提案**
-   - コンテンツの**特徴・属性**を表すタグ
-   - **検索・フィルタリングで使いやすい**キーワード
-   - 各タグの説明と、なぜ必要かの理由（簡潔に）
-   - **重要：１つのブックマークにしか適用されないタグは提案しないでください**
-   - **重要：タグ名は基本的に日本語で提案してください。アルファベットは必要最小限にしてください**
-   - **重要：英語の固有名詞や専門用語を除き、できるだけ日本語表記を使用してください**
-   - **重要：タグは概念的・抽象的な単語に限定してください。詳細すぎる・具体的すぎるタグは避けてください**
-   - **良い例：「開発」「デザイン」「学習」「リファレンス」「チュートリアル」「ツール」**
-   - **悪い例：「React Hooks の使い方」「VSCode 拡張機能開発」「Python データ分析入門」（詳細すぎる）**
-   - **タグは2-5文字程度の簡潔な単語を推奨します**
-
-2. **タグの統合提案**
-   - 意味が重複している類似タグの統合案
-   - **統合元のタグが2個以上ある場合のみ提案**（1個だけの場合は統合不要）
-   - 例：「プログラミング」と「コーディング」→「プログラミング」に統合
-   - **統合後のタグ名も日本語を優先し、より概念的な単語を選んでください**
-
-3. **削除推奨タグ**
-   - ほとんど使われていないタグ
-   - 曖昧すぎるタグ、または大分類的なタグ（フォルダで管理すべきもの）
-   - 検索・フィルタリングに役立たないタグ
-   - **詳細すぎる・具体的すぎるタグ（「○○の使い方」「××入門」など）**
-   - **重要：１つのブックマークにしか使われていないタグは削除候補にしてください**
-
-【回答形式】
-JSON形式で以下の構造で返してください。overall_reasoningは100字以内で簡潔に：
-
-{{
-  "suggested_tags": [
-    {{
-      "name": "提案するタグ名（日本語優先）",
-      "description": "このタグの用途説明（30字以内）",
-      "reasoning": "なぜこのタグが必要か（50字以内）",
-      "merge_from": ["統合元のタグ1", "統合元のタグ2"]
-    }}
-  ],
-  "tags_to_remove": ["削除推奨タグ1", "削除推奨タグ2"],
-  "overall_reasoning": "全体的な分析結果と改善方針の説明（100字以内）"
-}}
-
-注意：
-- merge_fromは既存タグの統合時のみ使用（新規タグの場合は空配列）
-- **merge_fromには必ず2個以上のタグを含めること**（1個だけの場合は統合提案しない）
-- suggested_tagsには新規タグと統合後のタグの両方を含める
-- タグはコンテンツの**特徴・属性**や**検索キーワード**であることを意識
-- フォルダで管理すべき大分類的なタグは提案しない
-- **タグ名は日本語を基本とし、英語の固有名詞や広く使われている専門用語以外はアルファベットを避けてください**
-- **タグは概念的・抽象的な単語（2-5文字程度）に限定し、詳細すぎる・具体的すぎるタグは避けてください**
-- **複数の単語を組み合わせた長いタグや、文章のようなタグは作成しないでください**
-- 日本語で分かりやすく説明してください
-- 実用的で具体的な提案をしてください"""
+        prompt = prompts.ANALYZE_TAGS.render(
+            tag_count=len(request.current_tags),
+            tags=', '.join(request.current_tags) if request.current_tags else 'タグがありません',
+            bookmark_count=len(request.bookmarks),
+            usage=sampling.format_usage(usage, request.current_tags) or 'タグが使われていません',
+            sample_count=len(sample),
+            bookmarks=prompts.numbered(bookmark_summary),
+        )
+        logger.info("  🧮 %s", prompt.describe())
 
         # OpenAI APIを呼び出し
-        response = client.chat.completions.create(
+        response = await llm.chat_completion(
             model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "あなたは情報整理とタグ分類の専門家です。実用的で分かりやすいタグ構成を提案してください。必ずJSON形式で回答してください。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            messages=prompt.messages,
             # reasoning_effort="medium",  # Render.comの古いopenaiライブラリではサポートされていないためコメントアウト
             max_completion_tokens=10000,
             reasoning_effort=REASONING_EFFORT_ANALYZE_TAG_STRUCTURE,
@@ -362,14 +566,12 @@ JSON形式で以下の構造で返してください。overall_reasoningは100
         )
 
         # レスポンスを解析
-        import json
-        
         response_content = response.choices[0].message.content
         
         # 空の応答チェック
         if not response_content or response_content.strip() == "":
-            logger.error(f"OpenAI returned empty content. Finish reason: {response.choices[0].finish_reason}")
-            logger.error(f"Usage: {response.usage}")
+            logger.error("OpenAI returned empty content. Finish reason: %s", response.choices[0].finish_reason)
+            logger.error("Usage: %s", response.usage)
             raise HTTPException(
                 status_code=500,
                 detail="AIからの応答が空でした。トークン数が不足している可能性があります。"
@@ -380,13 +582,13 @@ JSON形式で以下の構造で返してください。overall_reasoningは100
         # 処理時間とトークン数をログ
         elapsed_time = time.time() - start_time
         usage = response.usage
-        logger.info(f"📊 [analyze-tag-structure] 処理完了")
-        logger.info(f"  ⏱️  処理時間: {elapsed_time:.2f}秒")
-        logger.info(f"  🔢 入力トークン: {usage.prompt_tokens}")
-        logger.info(f"  🔢 出力トークン: {usage.completion_tokens}")
-        logger.info(f"  🔢 合計トークン: {usage.total_tokens}")
-        logger.info(f"  ✅ 提案タグ数: {len(result.get('suggested_tags', []))}")
-        logger.info(f"  🗑️  削除推奨数: {len(result.get('tags_to_remove', []))}")
+        logger.info("📊 [analyze-tag-structure] 処理完了")
+        logger.info("  ⏱️  処理時間: %.2f秒", elapsed_time)
+        logger.info("  🔢 入力トークン: %s", usage.prompt_tokens)
+        logger.info("  🔢 出力トークン: %s", usage.completion_tokens)
+        logger.info("  🔢 合計トークン: %s", usage.total_tokens)
+        logger.info("  ✅ 提案タグ数: %s", len(result.get('suggested_tags', [])))
+        logger.info("  🗑️  削除推奨数: %s", len(result.get('tags_to_remove', [])))
 
         return OptimalTagStructureResponse(
             suggested_tags=result.get("suggested_tags", []),
@@ -395,23 +597,420 @@ JSON形式で以下の構造で返してください。overall_reasoningは100
         )
 
     except json.JSONDecodeError as e:
+        metrics.json_repair("failed")
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [analyze-tag-structure] JSON解析エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"JSON解析エラー: {e}", exc_info=True)
+        logger.error("❌ [analyze-tag-structure] JSON解析エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("JSON解析エラー: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail="AIからの応答をJSON形式で解析できませんでした"
         )
     except Exception as e:
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [analyze-tag-structure] エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"タグ構成分析エラー: {e}", exc_info=True)
+        logger.error("❌ [analyze-tag-structure] エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("タグ構成分析エラー: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"タグ構成分析中にエラーが発生しました: {str(e)}"
         )
 
 
+async def _iter_tags_single(bookmarks, available_tags):
+    """
+    1件ずつLLMに問い合わせてタグを提案する（並行実行、完了した順にイベントを返す）
+    イベントは _iter_tag_assignments と同じ
+    """
+    # タグリストは全ブックマークで同じなので1回だけ組み立てる
+    tags_text = ', '.join(available_tags)
+
+    async def suggest_for_bookmark(bookmark):
+        bookmark_id = bookmark.get('id', '')
+        current_tags = bookmark.get('current_tags', [])
+
+        # プロンプトの作成（既存の/suggest-tagsと同じ指示文）
+        prompt = prompts.SUGGEST_TAGS_WITH_CURRENT.render(
+            tags=tags_text,
+            title=bookmark.get('title', 'No title'),
+            url=bookmark.get('url', ''),
+            excerpt=bookmark.get('excerpt', ''),
+            current_tags=', '.join(current_tags) if current_tags else 'なし',
+        )
+
+        # OpenAI APIを呼び出し
+        response = await llm.chat_completion(
+            model=BULK_ASSIGN_TAGS_MODEL,
+            messages=prompt.messages,
+            max_completion_tokens=2000,
+            reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_TAGS,
+        )
+
+        # レスポンスからタグを抽出
+        suggested_text = response.choices[0].message.content.strip()
+
+        # カンマ区切りのタグを分割
+        suggested_tags = [
+            tag.strip() 
+            for tag in suggested_text.split(',') 
+            if tag.strip()
+        ]
+        
+        # 既存のタグリストに存在するもののみをフィルタリング
+        valid_tags = [
+            tag for tag in suggested_tags 
+            if tag in available_tags
+        ]
+
+        await _remember_tags([(bookmark, valid_tags)], available_tags)
+        suggestion = BookmarkTagSuggestion(
+            bookmark_id=bookmark_id,
+            suggested_tags=valid_tags,
+            reasoning=f"{len(valid_tags)}個のタグを提案"
+        )
+        return suggestion, response.usage, None
+
+    def on_bookmark_error(bookmark, e):
+        bookmark_id = bookmark.get('id', '')
+        if isinstance(e, asyncio.TimeoutError):
+            message = f"タイムアウト（{BULK_ASSIGN_TAGS_ITEM_TIMEOUT:.0f}秒）"
+        else:
+            message = str(e)
+        logger.error("ブックマーク %s のタグ提案エラー: %s", bookmark_id, message)
+        suggestion = BookmarkTagSuggestion(
+            bookmark_id=bookmark_id,
+            suggested_tags=[],
+            reasoning=f"エラー: {message}"
+        )
+        return suggestion, None, message
+
+    # 各ブックマークに対してタグを並行して提案
+    async for index, (suggestion, usage, error) in fan_out_iter(
+        bookmarks,
+        suggest_for_bookmark,
+        concurrency=BULK_ASSIGN_TAGS_CONCURRENCY,
+        timeout=BULK_ASSIGN_TAGS_ITEM_TIMEOUT,
+        on_error=on_bookmark_error,
+    ):
+        if usage is not None:
+            yield "usage", usage
+        yield "suggestion", suggestion
+        if error is not None:
+            # 1件ずつ処理するため、失敗したブックマーク1件を1チャンクとして報告する
+            yield "failed_chunk", {"chunk_index": index, "bookmark_ids": [str(suggestion.bookmark_id)], "reason": error}
+
+
+def _format_batch_tag_line(bookmark):
+    """一括プロンプト用のブックマーク1行（タイトル・メモは長すぎる場合に短縮）"""
+    title = tokens.truncate(str(bookmark.get('title', 'No title')), PROMPT_TITLE_MAX_TOKENS)
+    excerpt = tokens.truncate(str(bookmark.get('excerpt', '') or ''), PROMPT_EXCERPT_MAX_TOKENS)
+    current_tags = bookmark.get('current_tags', [])
+    return (
+        f"ID:{bookmark.get('id', '')} | タイトル:{title} | "
+        f"URL:{bookmark.get('url', '')} | メモ:{excerpt} | "
+        f"現在のタグ:{', '.join(current_tags) if current_tags else 'なし'}"
+    )
+
+
+def _build_batch_tag_prompt(bookmark_lines, available_tags):
+    """複数ブックマーク分のタグ提案プロンプトを作成する"""
+    return prompts.BATCH_TAGS.render(
+        tags=', '.join(available_tags),
+        count=len(bookmark_lines),
+        bookmarks=prompts.numbered(bookmark_lines),
+    )
+
+
+def _tag_output_tokens(bookmark, available_tags):
+    """1件分の応答（{"bookmark_id", "suggested_tags"}）のトークン数の見込み（長いタグ3個で見積もる）"""
+    longest = sorted(available_tags, key=len, reverse=True)[:3]
+    return tokens.estimate_tokens(json.dumps(
+        {"bookmark_id": str(bookmark.get('id', '')), "suggested_tags": longest}, ensure_ascii=False
+    )) + 4
+
+
+def _plan_tag_batches(bookmarks, available_tags, attempt=0):
+    """
+    タグ一覧の長さとトークン予算からバッチを決める
+    応答が max_completion_tokens の上限に収まる件数までにし、再試行のたびに最大件数を半分にする
+    """
+    fixed_tokens = _build_batch_tag_prompt([], available_tags).total_tokens
+    output_limit = tokens.output_capacity(
+        max((_tag_output_tokens(bm, available_tags) for bm in bookmarks), default=1), REASONING_EFFORT_BULK_ASSIGN_TAGS
+    )
+    return pack_by_token_budget(
+        bookmarks,
+        lambda bm: tokens.estimate_tokens(_format_batch_tag_line(bm)) + 5,
+        fixed_tokens=fixed_tokens,
+        budget=BULK_ASSIGN_TAGS_BATCH_TOKEN_BUDGET,
+        max_items=max(1, min(BULK_ASSIGN_TAGS_MAX_BATCH_SIZE, output_limit) >> attempt),
+    )
+
+
+async def _iter_tags_batched(bookmarks, available_tags):
+    """
+    複数のブックマークを1回のJSONモードのリクエストにまとめてタグを提案する
+    応答に含まれなかったブックマークだけを再試行する
+    イベントは _iter_tag_assignments と同じ
+    """
+    available_tag_set = set(available_tags)
+    bookmarks_by_id = {str(bm.get('id', '')): bm for bm in bookmarks}
+
+    async def assign_batch(batch, emit):
+        prompt = _build_batch_tag_prompt([_format_batch_tag_line(bm) for bm in batch], available_tags)
+        # 応答の見込み + 推論トークンの見込み（以前の固定値より小さくはしない）
+        output_tokens = sum(_tag_output_tokens(bm, available_tags) for bm in batch)
+        response = await llm.chat_completion(
+            model=BULK_ASSIGN_TAGS_MODEL,
+            messages=prompt.messages,
+            max_completion_tokens=max(
+                1000 + 60 * len(batch), tokens.completion_budget(output_tokens, REASONING_EFFORT_BULK_ASSIGN_TAGS)
+            ),
+            reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_TAGS,
+            response_format={"type": "json_object"}
+        )
+
+        content = response.choices[0].message.content or ""
+        try:
+            assignments = json.loads(content).get("assignments", []) if content.strip() else []
+        except json.JSONDecodeError as e:
+            metrics.json_repair("failed")
+            if response.choices[0].finish_reason == "length":
+                raise ChunkError("トークン数制限により応答が途中で切れました", response.usage)
+            raise ChunkError(f"AIからの応答をJSON形式で解析できませんでした: {e}", response.usage)
+
+        results = {}
+        for assignment in assignments:
+            if not isinstance(assignment, dict):
+                continue
+            suggested_tags = assignment.get("suggested_tags", [])
+            if isinstance(suggested_tags, str):
+                suggested_tags = [tag.strip() for tag in suggested_tags.split(',')]
+            results[str(assignment.get("bookmark_id", ""))] = [
+                tag for tag in suggested_tags
+                if isinstance(tag, str) and tag in available_tag_set
+            ]
+        return results, response.usage
+
+    def log_round(attempt, item_count, batch_count):
+        if attempt == 0:
+            logger.info("  📦 バッチ数: %s（%s件）", batch_count, item_count)
+        else:
+            logger.info("  🔁 欠けたブックマークを再試行: %s件（%sバッチ）", item_count, batch_count)
+
+    async for kind, value in iter_chunked(
+        bookmarks,
+        item_id=lambda bm: str(bm.get('id', '')),
+        plan_chunks=lambda items, attempt: _plan_tag_batches(items, available_tags, attempt),
+        process_chunk=assign_batch,
+        concurrency=BULK_ASSIGN_TAGS_CONCURRENCY,
+        timeout=BULK_ASSIGN_TAGS_BATCH_TIMEOUT,
+        retries=BULK_ASSIGN_TAGS_BATCH_RETRIES,
+        on_round=log_round,
+    ):
+        if kind == "results":
+            await _remember_tags(
+                [(bookmarks_by_id[bookmark_id], valid_tags) for bookmark_id, valid_tags in value.items()],
+                available_tags,
+            )
+            for bookmark_id, valid_tags in value.items():
+                yield "suggestion", BookmarkTagSuggestion(
+                    bookmark_id=bookmark_id,
+                    suggested_tags=valid_tags,
+                    reasoning=f"{len(valid_tags)}個のタグを提案"
+                )
+        elif kind == "failed_chunk":
+            for bookmark_id in value["bookmark_ids"]:
+                yield "suggestion", BookmarkTagSuggestion(
+                    bookmark_id=bookmark_id,
+                    suggested_tags=[],
+                    reasoning=f"エラー: {value['reason']}"
+                )
+            yield kind, value
+        else:
+            yield kind, value
+
+
+async def _remember_tags(results, available_tags):
+    """一括割り当ての結果（(ブックマーク, タグ) のリスト）をタグ提案メモにまとめて記録する"""
+    if tag_memo is not None:
+        await tag_memo.set_many(
+            results, available_tags,
+            model=BULK_ASSIGN_TAGS_MODEL, reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_TAGS,
+        )
+
+
+async def _assign_tags_by_embedding(bookmarks, available_tags, library_id=None):
+    """
+    埋め込みの類似度でタグを割り当てる
+    閾値以上のタグがあり、閾値付近の曖昧なタグがないブックマークだけを確定させる
+    戻り値: (確定した BookmarkTagSuggestion のリスト, LLMに回すブックマークのリスト)
+    """
+    started = time.time()
+    library_vectors = await _library_vectors(library_id, bookmarks)
+    scores = await embeddings.classify(
+        embedder,
+        [embeddings.bookmark_text(bm) for bm in bookmarks],
+        available_tags,
+        labeled_queries=[
+            (i, tag) for i, bm in enumerate(bookmarks) for tag in (bm.get('current_tags') or [])
+        ],
+        query_vectors=library_vectors,
+    )
+    selected = scores >= EMBEDDING_MIN_SCORE
+    ambiguous = (scores >= EMBEDDING_MIN_SCORE - EMBEDDING_MIN_MARGIN) & ~selected
+    confident = selected.any(axis=1) & ~ambiguous.any(axis=1)
+    ranking = np.argsort(-scores, axis=1)[:, :3]
+
+    local, pending = [], []
+    for i, bookmark in enumerate(bookmarks):
+        if not confident[i]:
+            pending.append(bookmark)
+            continue
+        tags = [available_tags[j] for j in ranking[i] if selected[i, j]]
+        local.append(BookmarkTagSuggestion(
+            bookmark_id=bookmark.get('id', ''),
+            suggested_tags=tags,
+            reasoning=f"類似度から{len(tags)}個のタグを提案"
+        ))
+    logger.info("  🧭 埋め込みで割り当て: %s件（LLMで処理: %s件、%.2f秒）", len(local), len(pending), time.time() - started)
+    return local, pending
+
+
+async def _iter_tag_assignments(bookmarks, available_tags, library_id=None):
+    """
+    一括タグ割り当てを実行し、完了した順にイベントを返す
+    - ("suggestion", BookmarkTagSuggestion)
+    - ("usage", usage)
+    - ("failed_chunk", {chunk_index, bookmark_ids, reason})
+    タグ提案メモに結果があるブックマークはLLMを呼ばずにすぐ返す
+    """
+    pending = []
+    memo_results = [None] * len(bookmarks)
+    if tag_memo is not None:
+        memo_results = await tag_memo.get_many(
+            bookmarks, available_tags,
+            model=BULK_ASSIGN_TAGS_MODEL, reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_TAGS,
+        )
+    for bookmark, memo_tags in zip(bookmarks, memo_results):
+        if memo_tags is None:
+            pending.append(bookmark)
+            continue
+        yield "suggestion", BookmarkTagSuggestion(
+            bookmark_id=bookmark.get('id', ''),
+            suggested_tags=memo_tags,
+            reasoning=f"{len(memo_tags)}個のタグを提案"
+        )
+
+    if len(pending) < len(bookmarks):
+        logger.info("  💾 メモから再利用: %s件（LLMで処理: %s件）", len(bookmarks) - len(pending), len(pending))
+
+    if ASSIGN_BY_EMBEDDING and pending:
+        local, pending = await _assign_tags_by_embedding(pending, available_tags, library_id)
+        for suggestion in local:
+            yield "suggestion", suggestion
+    if not pending:
+        return
+
+    if BULK_ASSIGN_TAGS_MODE == "single":
+        events = _iter_tags_single(pending, available_tags)
+    else:
+        events = _iter_tags_batched(pending, available_tags)
+    async for event in events:
+        yield event
+
+
+async def _collect_assignments(events, bookmarks):
+    """
+    一括割り当てのイベントをまとめる（ジョブ実行時は途中結果も記録する）
+    戻り値: (提案のリスト（入力順）, usageのリスト, 失敗したチャンクのリスト)
+    """
+    by_id = {}
+    usages = []
+    failed_chunks = []
+    partial_suggestions = []
+    last_report = 0.0
+
+    async for kind, value in events:
+        if kind == "suggestion":
+            by_id[str(value.bookmark_id)] = value
+            partial_suggestions.append(value.dict())
+            if time.time() - last_report >= JOB_PROGRESS_INTERVAL:
+                last_report = time.time()
+                jobs.report_progress(
+                    "assigning", partial=partial_suggestions,
+                    processed=len(partial_suggestions), total=len(bookmarks)
+                )
+        elif kind == "usage":
+            usages.append(value)
+        elif kind == "failed_chunk":
+            failed_chunks.append(value)
+
+    if partial_suggestions:
+        jobs.report_progress(
+            "assigning", partial=partial_suggestions,
+            processed=len(partial_suggestions), total=len(bookmarks)
+        )
+
+    suggestions = [
+        by_id[str(bm.get('id', ''))]
+        for bm in bookmarks
+        if str(bm.get('id', '')) in by_id
+    ]
+    return suggestions, usages, failed_chunks
+
+
+async def _stream_assignments(events, endpoint_name, target_label):
+    """
+    一括割り当てのイベントをNDJSON（1行1レコード）で送信する
+    - {"type": "suggestion", "data": {...}}: 1件の提案（完了した順）
+    - {"type": "failed_chunk", "data": {...}}: 処理できなかったチャンク
+    - {"type": "summary", "data": {...}}: 最後にトークン数などの集計
+    - {"type": "error", "detail": "..."}: 途中でエラーが発生した場合
+    提案はサーバー側でためずにそのまま送信する
+    """
+    start_time = time.time()
+    processed = 0
+    failed_chunk_count = 0
+    total_prompt_tokens = 0
+    total_completion_tokens = 0
+    total_tokens_sum = 0
+
+    def record(record_type, **fields):
+        return json.dumps({"type": record_type, **fields}, ensure_ascii=False) + "\n"
+
+    try:
+        async for kind, value in events:
+            if kind == "suggestion":
+                processed += 1
+                yield record("suggestion", data=value.dict())
+            elif kind == "usage":
+                total_prompt_tokens += value.prompt_tokens
+                total_completion_tokens += value.completion_tokens
+                total_tokens_sum += value.total_tokens
+            elif kind == "failed_chunk":
+                failed_chunk_count += 1
+                yield record("failed_chunk", data=value)
+    except Exception as e:
+        logger.error("❌ [%s/stream] エラー: %s", endpoint_name, e, exc_info=True)
+        yield record("error", detail=f"一括{target_label}割り当て中にエラーが発生しました: {str(e)}")
+        return
+
+    elapsed_time = time.time() - start_time
+    logger.info("📊 [%s/stream] 処理完了", endpoint_name)
+    logger.info("  ⏱️  処理時間: %.2f秒", elapsed_time)
+    logger.info("  🔢 合計トークン: %s", total_tokens_sum)
+    logger.info("  📝 処理ブックマーク数: %s", processed)
+
+    yield record("summary", data={
+        "total_processed": processed,
+        "total_prompt_tokens": total_prompt_tokens,
+        "total_completion_tokens": total_completion_tokens,
+        "total_tokens": total_tokens_sum,
+        "failed_chunks": failed_chunk_count,
+        "elapsed_seconds": round(elapsed_time, 3),
+        "overall_reasoning": f"{processed}件のブックマークに対して{target_label}を提案しました。",
+    })
+
+
 @app.post("/bulk-assign-tags", response_model=BulkTagAssignmentResponse)
 async def bulk_assign_tags(request: BulkTagAssignmentRequest):
     """
@@ -438,129 +1037,176 @@ async def bulk_assign_tags(request: BulkTagAssignmentRequest):
                 overall_reasoning="利用可能なタグがないため、提案できません。"
             )
 
-        suggestions = []
-        
-        # 各ブックマークに対してタグを提案
-        for bookmark in request.bookmarks[:100]:  # 最大100件まで処理
-            bookmark_id = bookmark.get('id', '')
-            title = bookmark.get('title', 'No title')
-            url = bookmark.get('url', '')
-            excerpt = bookmark.get('excerpt', '')
-            current_tags = bookmark.get('current_tags', [])
-
-            # プロンプトの作成（既存の/suggest-tagsと同じロジック）
-            prompt = f"""あなたはブックマーク管理アシスタントです。
-以下のブックマーク情報を分析し、既存のタグリストから最も適切なタグを選んでください。
-
-【重要】タグとフォルダの使い分け
-- **フォルダ**: カテゴリや分類（例: 仕事、趣味、プロジェクト名など）
-- **タグ**: コンテンツの特徴や属性を表すキーワード
-  - そのブックマークの特徴・属性（技術スタック、テーマ、形式など）
-  - 検索・フィルタリングで使うキーワード
-  - 横断的な分類（複数のフォルダにまたがる特徴）
-
-【ブックマーク情報】
-タイトル: {title}
-URL: {url}
-メモ: {excerpt}
-
-【既存のタグリスト】
-{', '.join(request.available_tags)}
-
-【現在のタグ】
-{', '.join(current_tags) if current_tags else 'なし'}
-
-【指示】
-1. このブックマークの**特徴・属性**を表すタグを既存リストから1〜3個選んでください
-2. 検索やフィルタリングで使いやすいキーワードを優先してください
-3. 既存のタグリストに適切なものがない場合は、空のリストを返してください
-4. タグ名のみをカンマ区切りで返してください（説明は不要）
-
-良い例: 
-- 技術記事 → タグ: Python, AI, チュートリアル
-- デザイン参考 → タグ: UI/UX, レスポンシブ, モダン
-- ニュース記事 → タグ: テクノロジー, 最新動向, 2024年
-
-回答例: プログラミング, Python, AI"""
-
-            try:
-                # OpenAI APIを呼び出し
-                response = client.chat.completions.create(
-                    model="gpt-5-mini",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "あなたは正確で簡潔なタグ提案を行うアシスタントです。必ず既存のタグリストの中からのみ選択してください。"
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    max_completion_tokens=2000,
-                    reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_TAGS,
-                )
-
-                # レスポンスからタグを抽出
-                suggested_text = response.choices[0].message.content.strip()
-                
-                # トークン数を集計
-                total_prompt_tokens += response.usage.prompt_tokens
-                total_completion_tokens += response.usage.completion_tokens
-                total_tokens_sum += response.usage.total_tokens
-                
-                # カンマ区切りのタグを分割
-                suggested_tags = [
-                    tag.strip() 
-                    for tag in suggested_text.split(',') 
-                    if tag.strip()
-                ]
-                
-                # 既存のタグリストに存在するもののみをフィルタリング
-                valid_tags = [
-                    tag for tag in suggested_tags 
-                    if tag in request.available_tags
-                ]
-
-                suggestions.append(BookmarkTagSuggestion(
-                    bookmark_id=bookmark_id,
-                    suggested_tags=valid_tags,
-                    reasoning=f"{len(valid_tags)}個のタグを提案"
-                ))
+        # 件数の上限なし（batchedモードはトークン予算ごとのチャンクに分けて並行処理）
+        suggestions, usages, failed_chunks = await _collect_assignments(
+            _iter_tag_assignments(request.bookmarks, request.available_tags, request.library_id),
+            request.bookmarks,
+        )
 
-            except Exception as e:
-                logger.error(f"ブックマーク {bookmark_id} のタグ提案エラー: {e}")
-                suggestions.append(BookmarkTagSuggestion(
-                    bookmark_id=bookmark_id,
-                    suggested_tags=[],
-                    reasoning=f"エラー: {str(e)}"
-                ))
+        # トークン数を集計
+        for usage in usages:
+            total_prompt_tokens += usage.prompt_tokens
+            total_completion_tokens += usage.completion_tokens
+            total_tokens_sum += usage.total_tokens
 
         # 処理時間とトークン数をログ
         elapsed_time = time.time() - start_time
-        logger.info(f"📊 [bulk-assign-tags] 処理完了")
-        logger.info(f"  ⏱️  処理時間: {elapsed_time:.2f}秒")
-        logger.info(f"  🔢 入力トークン合計: {total_prompt_tokens}")
-        logger.info(f"  🔢 出力トークン合計: {total_completion_tokens}")
-        logger.info(f"  🔢 合計トークン: {total_tokens_sum}")
-        logger.info(f"  📝 処理ブックマーク数: {len(suggestions)}")
+        logger.info("📊 [bulk-assign-tags] 処理完了")
+        logger.info("  ⏱️  処理時間: %.2f秒", elapsed_time)
+        logger.info("  🔢 入力トークン合計: %s", total_prompt_tokens)
+        logger.info("  🔢 出力トークン合計: %s", total_completion_tokens)
+        logger.info("  🔢 合計トークン: %s", total_tokens_sum)
+        logger.info("  📝 処理ブックマーク数: %s", len(suggestions))
+        if failed_chunks:
+            logger.warning("  ⚠️ 失敗したチャンク数: %s", len(failed_chunks))
 
         return BulkTagAssignmentResponse(
             suggestions=suggestions,
             total_processed=len(suggestions),
-            overall_reasoning=f"{len(suggestions)}件のブックマークに対してタグを提案しました。"
+            overall_reasoning=f"{len(suggestions)}件のブックマークに対してタグを提案しました。",
+            failed_chunks=failed_chunks
         )
 
     except Exception as e:
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [bulk-assign-tags] エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"一括タグ割り当てエラー: {e}", exc_info=True)
+        logger.error("❌ [bulk-assign-tags] エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("一括タグ割り当てエラー: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"一括タグ割り当て中にエラーが発生しました: {str(e)}"
         )
 
 
+def _parse_current_folders(current_folders):
+    """current_folders（フラットリストまたは [{name, parent}]）を [{name, parent}] にそろえる"""
+    items = []
+    for item in current_folders or []:
+        if isinstance(item, dict):
+            name = str(item.get('name', '')).strip()
+            parent = str(item.get('parent', '') or '').strip()
+        else:
+            name = str(item).strip()
+            parent = ''
+        if name:
+            items.append({'name': name, 'parent': parent})
+    return items
+
+
+async def _plan_bookmark_moves(bookmarks, diff, library_id=None):
+    """
+    フォルダ構成の変更に伴うブックマークの移動先を決める
+    統合・移動で行き先が決まるものはローカルで、曖昧なものだけ埋め込み・LLMで割り当てる
+    戻り値: (BookmarkFolderSuggestion のリスト, 移動先を決められなかったブックマークIDのリスト)
+    ブックマークに id がなければ、リクエスト内の番号をIDとして使う
+    """
+    started = time.time()
+    ids = [str(bm.get('id') or i) for i, bm in enumerate(bookmarks)]
+    plan = move_plan.plan_moves(bookmarks, diff)
+    moves = [
+        BookmarkFolderSuggestion(bookmark_id=ids[move["index"]], suggested_folder=move["to_folder"], reasoning=move["reason"])
+        for move in plan.moves
+    ]
+    logger.info(
+        "🚚 移動計画: 移動 %s件 / そのまま %s件 / 曖昧 %s件（%.2f秒）",
+        len(moves),
+        plan.unchanged,
+        len(plan.ambiguous),
+        time.time() - started,
+    )
+
+    unresolved = [ids[i] for i in plan.ambiguous]
+    available_folders = list(diff.suggested.paths(move_plan.PATH_SEPARATOR).values())
+    if not unresolved or not ANALYZE_FOLDER_ASSIGN_AMBIGUOUS or not available_folders:
+        return moves, unresolved
+
+    pending = [dict(bookmarks[i], id=ids[i]) for i in plan.ambiguous]
+    suggestions, _, failed_chunks = await _collect_assignments(
+        _iter_folder_assignments(pending, available_folders, library_id), pending
+    )
+    moves.extend(suggestions)
+    assigned = {suggestion.bookmark_id for suggestion in suggestions}
+    unresolved = [bookmark_id for bookmark_id in unresolved if bookmark_id not in assigned]
+    if failed_chunks:
+        logger.warning("⚠️ 移動先を割り当てられなかったブックマーク: %s件", len(unresolved))
+    return moves, unresolved
+
+
+async def _review_folder_structure(result, ambiguities):
+    """
+    提案されたフォルダ構成をLLMに俯瞰させて最終調整する（ローカル検証で決められない点が残った場合のみ）
+    戻り値: 調整後の結果（調整不要・失敗時は None）
+    """
+    # 提案されたフォルダ構成を階層的に整理
+    suggested = result.get("suggested_folders", [])
+    folders_to_remove = result.get("folders_to_remove", [])
+    
+    # 階層構造を文字列で表現（循環していても各フォルダを1回ずつ表示）
+    tree = folder_tree.FolderTree.from_folders(suggested)
+    hierarchy_view = tree.render()
+    logger.debug("提案フォルダ階層:\n%s", hierarchy_view)
+    
+    # サブフォルダの重複チェック用にフルパスの一覧も作成
+    subfolder_list = [path for (parent, _), path in tree.paths().items() if parent]
+    
+    subfolder_view = "\n".join(subfolder_list) if subfolder_list else "サブフォルダなし"
+    logger.debug("サブフォルダ一覧:\n%s", subfolder_view)
+    
+    # 最終調整用のプロンプト
+    review_data = {
+        "suggested_folders": suggested,
+        "folders_to_remove": folders_to_remove,
+        "overall_reasoning": result.get('overall_reasoning', ''),
+    }
+    review_prompt = prompts.REVIEW_FOLDERS.render(
+        data=json.dumps(review_data, ensure_ascii=False, indent=2),
+        hierarchy=hierarchy_view,
+        subfolders=subfolder_view,
+        folders_to_remove=', '.join(folders_to_remove) if folders_to_remove else 'なし',
+        ambiguities="\n".join(f"- {item}" for item in ambiguities) if ambiguities else 'なし',
+    )
+    logger.info("  🧮 %s", review_prompt.describe())
+
+    logger.info("最終調整用AIリクエスト送信中...")
+    
+    try:
+        review_response = await llm.chat_completion(
+            model="gpt-5-mini",
+            messages=review_prompt.messages,
+            max_completion_tokens=10000,
+            reasoning_effort="low",  # 最終チェックなので軽量に
+            response_format={"type": "json_object"}
+        )
+        
+        review_content = review_response.choices[0].message.content
+        logger.info("最終調整レスポンス受信: %s 文字", len(review_content) if review_content else 0)
+        
+        if review_content and review_content.strip():
+            review_result = json.loads(review_content)
+            
+            if review_result.get("needs_adjustment", False):
+                logger.info("🔧 最終調整実施（内部処理）")
+                
+                # データ形式を検証
+                suggested_folders = review_result.get("suggested_folders", [])
+                if suggested_folders and isinstance(suggested_folders, list):
+                    # 最初の要素が辞書かチェック
+                    if isinstance(suggested_folders[0], dict):
+                        # 調整後の結果を使用
+                        logger.info("✅ 最終調整結果を適用")
+                        return review_result
+                    else:
+                        logger.warning("⚠️  最終調整結果が不正な形式 - 元の結果を使用")
+                else:
+                    logger.warning("⚠️  suggested_foldersが不正 - 元の結果を使用")
+            else:
+                logger.info("✅ 最終チェック完了: 調整不要")
+        else:
+            logger.warning("⚠️  最終調整レスポンスが空 - 元の結果を使用")
+    except Exception as e:
+        logger.warning("⚠️  最終調整でエラー - 元の結果を使用: %s", e)
+    return None
+
+
 @app.post("/analyze-folder-structure", response_model=OptimalFolderStructureResponse)
 async def analyze_folder_structure(request: OptimalFolderStructureRequest):
     """
@@ -572,9 +1218,9 @@ async def analyze_folder_structure(request: OptimalFolderStructureRequest):
     start_time = time.time()
     
     logger.info("=== フォルダ構成分析API呼び出し ===")
-    logger.info(f"ブックマーク数: {len(request.bookmarks)}")
-    logger.info(f"現在のフォルダ数: {len(request.current_folders)}")
-    logger.info(f"現在のフォルダ: {request.current_folders}")
+    logger.info("ブックマーク数: %s", len(request.bookmarks))
+    logger.info("現在のフォルダ数: %s", len(request.current_folders))
+    logger.debug("現在のフォルダ: %s", request.current_folders)
     
     try:
         # OpenAI API キーのチェック
@@ -585,216 +1231,66 @@ async def analyze_folder_structure(request: OptimalFolderStructureRequest):
                 detail="OpenAI API key is not configured"
             )
 
-        # ブックマーク情報の要約（全件）
-        bookmark_summary = []
-        for i, bm in enumerate(request.bookmarks):
-            title = str(bm.get('title', 'No title'))
-            # タイトルは長すぎる場合に短縮
-            if len(title) > 120:
-                title = title[:117] + '...'
-            bookmark_summary.append(
-                f"{i+1}. {title} - フォルダ: {bm.get('current_folder', '未分類')}"
-            )
-
-        # プロンプトの作成
-        prompt = f"""あなたは熟練したブックマーク管理・情報整理の専門家です。
-以下のブックマーク一覧と現在のフォルダ構成を分析し、最適なフォルダ構成を提案してください。
-
-【フォルダ数の上限ルール】
-- 作成するフォルダの最大数は、以下の数式で決定してください：
-  - 最大フォルダ数 = min(15, max(3, floor(1.5 * sqrt(ブックマーク数))))
-  - 現在のブックマーク数: {len(request.bookmarks)}件
-- 例: 9件 → 4個, 100件 → 15個, 400件 → 15個（上限）
-- この上限を超えてフォルダを提案しないこと
-
-【フォルダ名の命名規則】
-- **フォルダ名は原則として日本語で付けてください**
-- アルファベットや英単語の使用は最低限にしてください
-- 例: ❌「Programming」「Web Design」 → ⭕「プログラミング」「ウェブデザイン」
-- 例: ❌「Python」「JavaScript」 → ⭕「Python学習」「JavaScript開発」（技術名は許容）
-
-【重要】フォルダとタグの使い分け
-- **フォルダ**: 大分類・カテゴリ（例: 仕事、趣味、プロジェクト名、テーマ別）
-  - 主要な分類軸となるカテゴリ
-  - ブックマークの所属先（1つのフォルダに所属）
-  - **階層構造で整理可能**（親フォルダ/子フォルダの関係）
-- **タグ**: コンテンツの特徴・属性を表すキーワード
-  - 横断的な分類（複数のフォルダにまたがる特徴）
-  - 検索・フィルタリング用
-
-【現在のフォルダ一覧】（全{len(request.current_folders) if request.current_folders else 0}個）
-{chr(10).join([f"{item['name']} (親: {item['parent'] or 'なし'})" if isinstance(item, dict) else item for item in (request.current_folders or [])]) if request.current_folders else 'フォルダがありません'}
-
-【ブックマーク一覧】（全{len(request.bookmarks)}件、表示は最初の50件）
-{chr(10).join(bookmark_summary)}
-
-【最重要原則：MECE（Mutually Exclusive, Collectively Exhaustive）】
-- **Mutually Exclusive（相互排他的）**: フォルダ間に重複・ダブりがないこと
-  - 同じブックマークが複数のフォルダに該当するような曖昧な分類は避ける
-  - 各フォルダの定義が明確で、境界が重ならないこと
-  - 類似した意味のフォルダは統合すること
-- **Collectively Exhaustive（網羅的）**: 全てのブックマークが適切なフォルダに分類できること
-  - 抜け漏れがなく、全てのブックマークがどこかのフォルダに所属できる
-  - 「その他」「未分類」を最小限に抑える
-
-【適切な粒度の原則】
-**ブックマーク数に対してフォルダを細分化しすぎないこと**
-- ブックマーク総数が**{len(request.bookmarks)}件**であることを常に意識する
-- **1フォルダあたり最低5〜10件のブックマーク**が入る粒度を目安にする
-- 目安：
-  * ブックマーク50件未満 → フォルダは5〜8個程度（第1階層のみ、または浅い階層）
-  * ブックマーク50〜200件 → フォルダは10〜15個程度（第2階層まで）
-  * ブックマーク200件以上 → フォルダは15〜25個程度（第3階層まで可）
-- **細かすぎる分類は避ける**：1〜2個のブックマークしか入らないフォルダは作らない
-- **粒度を揃える**：同じ階層のフォルダは同程度の粒度・規模にする
-
-【分析指示】
-現在のフォルダ一覧を見て、必ず以下の3つを提案してください：
-
-1. **新規・階層構造の提案（必須）**
-   - **【最重要】階層化できるものは必ず親フォルダとサブフォルダに構造化**
-   - **【最重要】同じ名前のフォルダは絶対に重複作成しない**
-     * ❌ 悪い例: トップレベル「旅行」とサブ「生活/旅行」の両方を提案
-     * ✅ 良い例: 「生活/旅行」のみを提案（トップレベルに「旅行」は作らない）
-     * ❌ 悪い例: 「エンタメ/ゲーム」を2回提案
-     * ✅ 良い例: 「エンタメ/ゲーム」を1回だけ提案
-   - **【最重要】提案する全フォルダを確認し、同じ名前が複数ないことを確認**
-   - **ブックマーク総数{len(request.bookmarks)}件に対して適切な粒度で提案**
-   - フォルダを細分化しすぎないこと（1フォルダあたり最低5〜10件を目安）
-   - 第1階層だけでなく、**第2階層、第3階層のフォルダも積極的に提案**してください
-     * ただし、ブックマーク数が少ない場合は階層を浅くする
-   - **【重要】現在フラット構造のフォルダを分析し、関連性のあるものは親子関係で階層化**
-     * 例: 「AI」「機械学習」「データサイエンス」→親「テクノロジー」の下に配置
-     * 例: 「旅行」「宿泊」「観光」→親「トラベル」の下に配置
-     * 例: 単独の「料理」→親「生活」の下にサブフォルダ「料理・レシピ」として配置
-   - 親子関係を活用した階層構造を作成してください
-   - 例: 親「プログラミング」→子「Python」「JavaScript」「Web開発」
-   - **重要：フォルダ名には親フォルダ名を含めないこと**
-     * 良い例: 親「プログラミング」、子「Python」
-     * 悪い例: 親「プログラミング」、子「プログラミング/Python」
-   - **MECE原則を遵守**：各フォルダの定義が明確で、重複しないこと
-   - **1〜2個のブックマークしか入らないフォルダは提案しない**
-   - **【必須】トップレベルに単独で存在するフォルダを減らし、より大きなカテゴリの下に配置**
-
-2. **フォルダ統合（必須：類似・重複フォルダを必ず探して提案）**
-   - **MECEの「相互排他的」を実現するため、重複・ダブりを徹底排除**
-   - **【最重要】類似・重複フォルダは統合ではなく削除推奨に含めてください**
-   - **【重要】「その他」「Others」などの曖昧フォルダは統合ではなく削除してください（MECE違反のため）**
-   - **現在のフォルダ一覧を注意深く見て、類似・重複しているフォルダを必ず見つけ出す**
-   - 第1階層だけでなく、**第2階層以降の子フォルダも必ずチェック**
-   - 統合すべきパターン（MECE違反）：
-     * 同じカテゴリの複数フォルダ（例: 「レシピ」「料理」「クッキング」→1つに統合、残りは削除推奨）
-     * 異なる親の下に同じ子フォルダ（例: 「A/Web」「B/Web」→「開発/Web」に統合）
-     * 表記違い（例: 「AI」「人工知能」→どちらか1つに統合して、もう1つは削除）
-     * 範囲重複（例: 「Web開発」「フロントエンド」「React」→「Web開発」に統合）
-   - **【重要】「未分類」フォルダは統合対象から除外してください**
-   - **統合提案は2個以上のフォルダをまとめる場合のみ**
-   - **類似フォルダは統合ではなく、削除推奨として提案してください**
-
-3. **削除推奨（必須：不要フォルダを必ず探して提案）**
-   - **【超重要】削除推奨フォルダは必ず現在のフォルダ一覧（current_folders）に存在するものから選んでください**
-   - **現在存在しないフォルダを削除推奨に含めないでください**
-   - **全階層（第1層、第2層、第3層以降）で不要なフォルダを必ず見つけ出す**
-   - **細分化しすぎているフォルダを積極的に削除**（ブックマーク数に対して粒度が細かすぎる）
-   - **【最重要】類似・重複フォルダを削除対象として優先的に提案**
-     * **【必須】「その他」「Others」などの曖昧なフォルダ（最優先で削除）**
-     * **【必須】親フォルダとサブフォルダで重複する名前（例: 「技術」の下に「技術関連」サブフォルダ）**
-     * **【必須】同じ階層で意味が重複（例: 「その他」と「雑多」、「メモ」と「ノート」）**
-     * 意味が近いフォルダ（例: 「開発」「プログラミング」「コーディング」）
-     * 表記違い（例: 「AI」「人工知能」、「Web」「ウェブ」）
-     * 英語・日本語の違い（例: 「Technology」「テクノロジー」）
-     * カテゴリが重複（例: 「料理」「レシピ」「クッキング」）
-     * 範囲が重複（例: 「Web開発」と「フロントエンド」が別々に存在）
-     * **【重要】サブフォルダ同士でも重複チェック（例: 親A/サブX、親B/サブXのように異なる親の下に同じ名前）**
-   - 削除すべきパターン：
-     * **【最優先】「その他」「Others」などの曖昧フォルダ（MECE違反のため必ず削除）**
-     * **【最優先】類似・重複フォルダ（意味・表記・階層の重複すべて含む）**
-     * 1〜2個のブックマークにしか使われていないフォルダ（必ず削除）
-     * ほとんど使われていないフォルダ（3〜4個以下）
-     * 曖昧すぎるフォルダ（例: 「メモ」「資料」「雑多」）→MECE違反
-     * 統合後に不要になるフォルダ
-     * 定義が不明確で分類しづらいフォルダ
-     * 他のフォルダと統合できる細かすぎるフォルダ
-   - **【重要】「未分類」フォルダは削除対象から除外してください**
-   - **類似フォルダが見つからない場合でも、最低2〜3件は削除候補を出してください**
-
-【回答形式】
-JSON形式で以下の構造で返してください。overall_reasoningは100字以内で簡潔に：
-
-{{
-  "suggested_folders": [
-    {{
-      "name": "フォルダ名（親フォルダ名を含めない！）",
-      "description": "このフォルダの用途説明（30字以内）",
-      "reasoning": "なぜこのフォルダが必要か（50字以内）",
-      "parent": "親フォルダ名（トップレベルの場合は空文字\"\"）",
-      "merge_from": ["統合元のフォルダ1", "統合元のフォルダ2"]
-    }}
-  ],
-  "folders_to_remove": ["削除推奨フォルダ1", "削除推奨フォルダ2"],
-  "overall_reasoning": "全体的な分析結果と改善方針の説明（100字以内）"
-}}
-
-【重要な注意事項】
-- **【階層化】フラット構造を避け、関連するフォルダは必ず親子関係で整理**
-  - 単独で存在するトップレベルフォルダを減らす
-  - 関連性のあるフォルダは共通の親フォルダの下にまとめる
-  - 例: 「料理」「レシピ」→親「生活」の下に「料理・レシピ」として配置
-  - 例: 「AI」「機械学習」→親「テクノロジー」の下に配置
-- **【粒度】ブックマーク総数{len(request.bookmarks)}件に対して適切な数・粒度のフォルダを提案**
-  - フォルダを細分化しすぎない（1フォルダあたり最低5〜10件を目安）
-  - 1〜2個のブックマークしか入らないフォルダは提案しない
-- **【最重要】nameには親フォルダ名を含めないこと**
-  - 良い例: {{"name": "Python", "parent": "プログラミング"}}
-  - 悪い例: {{"name": "プログラミング/Python", "parent": "プログラミング"}}
-- **MECE原則を徹底**
-  - Mutually Exclusive: フォルダ間に重複・ダブりがないこと
-  - Collectively Exhaustive: 全てのブックマークが適切に分類できること
-- **suggested_foldersには必ず5件以上提案してください**（新規フォルダ＋統合フォルダの合計）
-  - **第2階層、第3階層のフォルダも積極的に含める**（第1階層だけでなく）
-  - ただし、ブックマーク数が少ない場合は階層を浅く、数を減らす
-- **folders_to_removeには必ず2件以上提案してください**（不要・重複フォルダ）
-  - 特に細分化しすぎているフォルダを削除対象にする
-- parentで親フォルダを指定（階層構造）。**トップレベルの場合は空文字""**
-- **【超重要】nameには親フォルダ名を絶対に含めないこと**（例: ❌"プログラミング/Python" → ⭕"Python"）
-- merge_fromは統合時のみ使用（新規は空配列[]）。**2個以上のフォルダを含めること**
-- MECE原則を徹底し、重複のない明確なフォルダ構成を提案"""
+        # ブックマーク情報の要約
+        # 件数が多い場合はクラスタに分け、クラスタごとの件数・フォルダ・代表タイトルだけを渡す
+        # （プロンプトの長さはブックマーク数ではなくクラスタ数に比例する）
+        folder_usage = Counter(str(bm.get('current_folder') or '未分類') for bm in request.bookmarks)
+        if len(request.bookmarks) > ANALYZE_FOLDER_DIGEST_THRESHOLD:
+            digest = await _folder_cluster_digest(request.library_id, request.bookmarks)
+            bookmarks_section = f"""【ブックマークのクラスタ要約】（全{len(request.bookmarks)}件を内容の近さで{len(digest)}個のクラスタに分類。括弧内は件数）
+{clustering.format_digest(digest)}
+
+【現在のフォルダごとのブックマーク数】
+{', '.join(f"{name}({count})" for name, count in folder_usage.most_common())}"""
+        else:
+            bookmark_summary = []
+            for bm in request.bookmarks:
+                # タイトルは長すぎる場合に短縮
+                title = tokens.truncate(str(bm.get('title', 'No title')), PROMPT_TITLE_MAX_TOKENS)
+                bookmark_summary.append(f"{title} - フォルダ: {bm.get('current_folder', '未分類')}")
+            bookmarks_section = f"""【ブックマーク一覧】（全{len(request.bookmarks)}件）
+{prompts.numbered(bookmark_summary)}"""
+
+        # プロンプトの作成（固定の指示文の後ろにブックマーク数・フォルダ一覧・ブックマークを付ける）
+        folder_lines = [
+            f"{item['name']} (親: {item['parent'] or 'なし'})" if isinstance(item, dict) else item
+            for item in (request.current_folders or [])
+        ]
+        prompt = prompts.ANALYZE_FOLDERS.render(
+            bookmark_count=len(request.bookmarks),
+            folder_count=len(folder_lines),
+            folders="\n".join(folder_lines) if folder_lines else 'フォルダがありません',
+            bookmarks=bookmarks_section,
+        )
+        logger.info("  🧮 %s", prompt.describe())
 
         logger.info("OpenAI APIにリクエスト送信中...")
-        logger.info(f"使用モデル: gpt-5-mini")
+        logger.info("使用モデル: gpt-5-mini")
+        jobs.report_progress("first_pass")
         
         # OpenAI APIを呼び出し
-        response = client.chat.completions.create(
+        response = await llm.chat_completion(
             model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"あなたは情報整理とフォルダ分類の専門家です。ブックマーク総数{len(request.bookmarks)}件に対して適切な粒度でフォルダを提案してください。MECE原則（相互排他的かつ網羅的）を徹底してください。必ず以下を守ってください：1) 【超重要】同じ名前のフォルダは絶対に重複提案しない（例: トップレベル「旅行」とサブ「生活/旅行」を両方提案するのは禁止。「エンタメ/ゲーム」を2回提案するのも禁止）、2) 【最重要】階層化できるものは必ず親フォルダとサブフォルダに構造化（フラット構造を避け、関連フォルダは親子関係で整理。トップレベルに単独で存在するフォルダを減らす）、3) フォルダを細分化しすぎない（1フォルダあたり最低5〜10件、1〜2件しか入らないフォルダは提案しない）、4) suggested_foldersに5件以上提案（第2階層、第3階層のフォルダも積極的に含める。ただしブックマーク数が少ない場合は階層を浅く）、5) 【最重要】類似・重複フォルダを削除推奨に含める（例: 「その他」「Others」などの曖昧フォルダは最優先削除、「料理」「レシピ」「クッキング」は1つに統合して残りを削除、「AI」「人工知能」はどちらか削除、「Web」「ウェブ」はどちらか削除、親とサブで重複する名前も削除、異なる親の下に同じ名前のサブフォルダがあれば統合または削除）、6) folders_to_removeに2件以上提案（特に「その他」等の曖昧フォルダ、類似フォルダ、細分化しすぎているフォルダ。【超重要】削除推奨フォルダは必ずcurrent_foldersに存在するものから選ぶこと）、7) 【超重要】nameには親フォルダ名を含めない（例: ❌\"プログラミング/Python\" → ⭕\"Python\"でparent=\"プログラミング\"）、8) 【重要】「未分類」フォルダは統合・削除の対象外とする。必ずJSON形式で回答してください。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            messages=prompt.messages,
             max_completion_tokens=10000,
             reasoning_effort=REASONING_EFFORT_ANALYZE_FOLDER_STRUCTURE,
             response_format={"type": "json_object"}
         )
 
         logger.info("OpenAI APIからレスポンス受信")
-        logger.info(f"Finish reason: {response.choices[0].finish_reason}")
-        logger.info(f"Usage: {response.usage}")
+        logger.info("Finish reason: %s", response.choices[0].finish_reason)
+        logger.info("Usage: %s", response.usage)
         
         # レスポンスを解析
         response_content = response.choices[0].message.content
         
-        logger.info(f"レスポンス内容の長さ: {len(response_content) if response_content else 0} 文字")
-        logger.info(f"レスポンス内容（最初の500文字）: {response_content[:500] if response_content else 'None'}")
+        logger.info("レスポンス内容の長さ: %s 文字", len(response_content) if response_content else 0)
+        logger.debug("レスポンス内容（最初の500文字）: %.500s", response_content)
         
         # 空の応答チェック
         if not response_content or response_content.strip() == "":
-            logger.error(f"OpenAI returned empty content. Finish reason: {response.choices[0].finish_reason}")
-            logger.error(f"Usage: {response.usage}")
+            logger.error("OpenAI returned empty content. Finish reason: %s", response.choices[0].finish_reason)
+            logger.error("Usage: %s", response.usage)
             raise HTTPException(
                 status_code=500,
                 detail="AIからの応答が空でした。トークン数が不足している可能性があります。"
@@ -802,296 +1298,83 @@ JSON形式で以下の構造で返してください。overall_reasoningは100
         
         logger.info("JSON解析中...")
         result = json.loads(response_content)
-        logger.info(f"解析結果: 提案フォルダ数={len(result.get('suggested_folders', []))}, 削除推奨数={len(result.get('folders_to_remove', []))}")
+        logger.info("解析結果: 提案フォルダ数=%s, 削除推奨数=%s", len(result.get('suggested_folders', [])), len(result.get('folders_to_remove', [])))
 
-        # ===== 第2段階: 全体構成の俯瞰と最終調整（内部処理のみ） =====
+        # 第1段階の結果を途中結果として記録（ジョブ実行時のみ）
+        jobs.report_progress("review", partial={
+            "suggested_folders": result.get("suggested_folders", []),
+            "folders_to_remove": result.get("folders_to_remove", []),
+            "overall_reasoning": result.get("overall_reasoning", ""),
+        })
+
+        # ===== 第2段階: ローカルのMECE検証（ルールで決められない点が残った場合だけLLMで最終調整） =====
         logger.info("========== 第2段階: 全体構成の最終チェック ==========")
-        
-        # 提案されたフォルダ構成を階層的に整理
-        suggested = result.get("suggested_folders", [])
-        folders_to_remove = result.get("folders_to_remove", [])
-        
-        # 階層構造を文字列で表現
-        def build_hierarchy_view(folders):
-            hierarchy_lines = []
-            # トップレベルフォルダ
-            top_level = [f for f in folders if not f.get("parent") or f.get("parent").strip() == ""]
-            
-            def add_folder_tree(folder, indent=0):
-                prefix = "  " * indent + "├─ " if indent > 0 else ""
-                hierarchy_lines.append(f"{prefix}{folder['name']}")
-                # 子フォルダを探す
-                children = [f for f in folders if f.get("parent") == folder["name"]]
-                for child in children:
-                    add_folder_tree(child, indent + 1)
-            
-            for folder in top_level:
-                add_folder_tree(folder)
-            
-            return "\n".join(hierarchy_lines)
-        
-        hierarchy_view = build_hierarchy_view(suggested)
-        logger.info(f"提案フォルダ階層:\n{hierarchy_view}")
-        
-        # サブフォルダの重複チェック用にフラットリストも作成
-        subfolder_list = []
-        for folder in suggested:
-            parent = folder.get("parent", "")
-            name = folder.get("name", "")
-            if parent:  # サブフォルダのみ
-                subfolder_list.append(f"{parent}/{name}")
-        
-        subfolder_view = "\n".join(subfolder_list) if subfolder_list else "サブフォルダなし"
-        logger.info(f"サブフォルダ一覧:\n{subfolder_view}")
-        
-        # トップレベルとサブフォルダの重複を検出
-        top_level_names = {f.get("name") for f in suggested if not f.get("parent") or f.get("parent").strip() == ""}
-        subfolder_names = {f.get("name") for f in suggested if f.get("parent") and f.get("parent").strip() != ""}
-        duplicate_names = top_level_names & subfolder_names
-        
-        if duplicate_names:
-            logger.warning(f"⚠️  トップレベルとサブフォルダで重複検出: {duplicate_names}")
-            logger.warning("   → これらは最終調整で削除されるべきです")
-        
-        # 最終調整用のプロンプト
-        review_prompt = f"""
-以下は第1段階で提案されたフォルダ構成です。全体を俯瞰して最終調整を行ってください。
-
-【元のJSON形式のデータ】
-```json
-{{
-  "suggested_folders": {json.dumps(suggested, ensure_ascii=False, indent=2)},
-  "folders_to_remove": {json.dumps(folders_to_remove, ensure_ascii=False)},
-  "overall_reasoning": "{result.get('overall_reasoning', '')}"
-}}
-```
-
-【提案されたフォルダ構成】（階層表示）
-{hierarchy_view}
-
-【サブフォルダ一覧】（重複チェック用）
-{subfolder_view}
-↑この一覧で同じ名前のサブフォルダが異なる親の下にないか必ず確認してください
-
-【削除推奨フォルダ】
-{', '.join(folders_to_remove) if folders_to_remove else 'なし'}
-
-【最終チェック項目】
-1. **重複・類似チェック（全階層で徹底）**: 提案フォルダ内に類似名称や重複がないか
-   - **【最重要】トップレベルフォルダと同名のサブフォルダは削除**
-     * 例: トップレベル「旅行」とサブ「生活/旅行」→どちらか一方を削除（重複）
-     * 例: トップレベル「料理」とサブ「生活/料理」→どちらか一方を削除（重複）
-     * 例: トップレベル「AI」とサブ「技術/AI」→どちらか一方を削除（重複）
-     * **このパターンは100%削除対象！必ずチェックして削除してください**
-   - **【最重要】異なる親フォルダのサブフォルダ間でも重複チェック**
-     * 例: 「フォルダA/Web」と「フォルダB/Web」→どちらか一方の親に統合
-     * 例: 「生活/料理」と「趣味/料理」→意味的に重複しているので統合
-     * 例: 「技術/AI」と「仕事/AI」→用途が異なるか確認し、重複なら統合
-   - 同じ階層での重複
-     * 例: 「Web」と「ウェブ」、「AI」と「人工知能」など
-   - **全てのサブフォルダを網羅的にチェックし、重複があれば必ず統合または削除**
-   - 見つかった場合は1つに統合し、もう一方を削除推奨に追加
-
-2. **階層構造の妥当性**: 親子関係が論理的か
-   - 不自然な階層（例: 「技術/料理」のような関連性のない組み合わせ）
-   - トップレベルに単独で存在すべきでないフォルダ
-
-3. **MECE原則の再確認**: 相互排他的かつ網羅的か
-   - フォルダ間の境界が明確か
-   - 「その他」「未分類」以外の曖昧なフォルダがないか
-   - サブフォルダ間でも相互排他性を確認
-   - **トップレベルとサブフォルダで同名がないか再確認**
-
-4. **削除推奨の妥当性**: 削除推奨フォルダが適切か
-   - 「その他」「Others」などの曖昧フォルダが含まれているか
-   - 不要なフォルダが削除推奨に含まれているか
-   - サブフォルダの重複も削除推奨に含める
-   - **トップレベルとサブで同名の場合、必ずどちらかを削除推奨に含める**
-
-【重要】
-- suggested_foldersは必ず以下の形式の辞書の配列で返してください：
-  {{"name": "文字列", "description": "文字列", "reasoning": "文字列", "parent": "文字列", "merge_from": ["配列"]}}
-- フォルダ名だけの配列は不可！必ず完全な辞書形式で！
-
-【回答形式】
-元の提案に問題がなければ、元のデータをそのまま返してください（needs_adjustment: false）。
-調整が必要な場合は、修正後の構成を以下のJSON形式で返してください：
-
-{{
-  "needs_adjustment": true/false,
-  "suggested_folders": [
-    {{"name": "フォルダ名", "description": "説明", "reasoning": "理由", "parent": "親フォルダ名", "merge_from": []}},
-    ...
-  ],
-  "folders_to_remove": ["削除1", "削除2"],
-  "overall_reasoning": "修正後の全体説明（100字以内）"
-}}
-"""
-
-        logger.info("最終調整用AIリクエスト送信中...")
-        
-        try:
-            review_response = client.chat.completions.create(
-                model="gpt-5-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "あなたは情報整理の専門家です。フォルダ構成を俯瞰的にレビューし、重複・類似・MECE違反がないか最終チェックを行ってください。【最重要1】トップレベルフォルダと同名のサブフォルダは100%削除対象です（例: トップレベル「旅行」とサブ「生活/旅行」が両方存在する場合、必ずどちらかを削除）。【最重要2】異なる親フォルダのサブフォルダ間でも重複をチェックしてください（例: 「生活/料理」と「趣味/料理」は重複なので統合）。【超重要】suggested_foldersは必ず辞書の配列で返してください（フォルダ名だけの文字列配列は絶対に不可）。各フォルダは{{name, description, reasoning, parent, merge_from}}の完全な形式で返してください。必ずJSON形式で回答してください。"
-                    },
-                    {
-                        "role": "user",
-                        "content": review_prompt
-                    }
-                ],
-                max_completion_tokens=10000,
-                reasoning_effort="low",  # 最終チェックなので軽量に
-                response_format={"type": "json_object"}
-            )
-            
-            review_content = review_response.choices[0].message.content
-            logger.info(f"最終調整レスポンス受信: {len(review_content) if review_content else 0} 文字")
-            
-            if review_content and review_content.strip():
-                review_result = json.loads(review_content)
-                
-                if review_result.get("needs_adjustment", False):
-                    logger.info(f"🔧 最終調整実施（内部処理）")
-                    
-                    # データ形式を検証
-                    suggested_folders = review_result.get("suggested_folders", [])
-                    if suggested_folders and isinstance(suggested_folders, list):
-                        # 最初の要素が辞書かチェック
-                        if isinstance(suggested_folders[0], dict):
-                            # 調整後の結果を使用
-                            result = review_result
-                            logger.info("✅ 最終調整結果を適用")
-                        else:
-                            logger.warning("⚠️  最終調整結果が不正な形式 - 元の結果を使用")
-                    else:
-                        logger.warning("⚠️  suggested_foldersが不正 - 元の結果を使用")
-                else:
-                    logger.info("✅ 最終チェック完了: 調整不要")
-            else:
-                logger.warning("⚠️  最終調整レスポンスが空 - 元の結果を使用")
-        except Exception as e:
-            logger.warning(f"⚠️  最終調整でエラー - 元の結果を使用: {e}")
+        current_items = _parse_current_folders(request.current_folders)
+        validation = mece_validator.validate(
+            result.get("suggested_folders", []), result.get("folders_to_remove", []), current_items, folder_usage
+        )
+        for fix in validation.fixes:
+            logger.info("  🔧 %s", fix)
+        result = dict(result, suggested_folders=validation.suggested_folders, folders_to_remove=validation.folders_to_remove)
+
+        if ANALYZE_FOLDER_REVIEW == "always" or (ANALYZE_FOLDER_REVIEW == "auto" and validation.ambiguities):
+            for ambiguity in validation.ambiguities:
+                logger.info("  ❓ %s", ambiguity)
+            reviewed = await _review_folder_structure(result, validation.ambiguities)
+            if reviewed is not None:
+                # LLMの調整結果にもルールを適用する（残った曖昧な点はLLMの判断に任せる）
+                revalidated = mece_validator.validate(
+                    reviewed.get("suggested_folders", []), reviewed.get("folders_to_remove", []), current_items, folder_usage
+                )
+                result = dict(reviewed, suggested_folders=revalidated.suggested_folders, folders_to_remove=revalidated.folders_to_remove)
+        else:
+            logger.info("✅ ローカル検証で確定（LLMによる最終調整は省略）")
 
         # 処理時間とトークン数をログ
         elapsed_time = time.time() - start_time
         usage = response.usage
-        logger.info(f"📊 [analyze-folder-structure] 処理完了")
-        logger.info(f"  ⏱️  処理時間: {elapsed_time:.2f}秒")
-        logger.info(f"  🔢 入力トークン: {usage.prompt_tokens}")
-        logger.info(f"  🔢 出力トークン: {usage.completion_tokens}")
-        logger.info(f"  🔢 合計トークン: {usage.total_tokens}")
-        logger.info(f"  ✅ 提案フォルダ数: {len(result.get('suggested_folders', []))}")
-        logger.info(f"  🗑️  削除推奨数: {len(result.get('folders_to_remove', []))}")
-
-        # 最終的なフォルダ構成を計算（親|名前の複合キーで差分算出）
-        suggested_folders = result.get("suggested_folders", [])
-        raw_folders_to_remove = set(result.get("folders_to_remove", []))
-
-        logger.info(f"  📝 提案フォルダ数: {len(suggested_folders)}")
-        logger.info(f"  📝 削除推奨フォルダ数(元データ): {len(raw_folders_to_remove)}")
-
-        # 既存フォルダ（親名|フォルダ名）の集合
-        current_keys = set()
-        current_items = []  # [{'name':, 'parent':}]
-        if request.current_folders:
-            for item in request.current_folders:
-                if isinstance(item, dict):
-                    name = str(item.get('name', '')).strip()
-                    parent = str(item.get('parent', '') or '').strip()
-                    if name:
-                        key = f"{parent}|{name}"
-                        current_keys.add(key)
-                        current_items.append({'name': name, 'parent': parent})
-                        logger.info(f"  📁 既存: {key}")
-                else:
-                    name = str(item).strip()
-                    key = f"|{name}"  # 親なし
-                    current_keys.add(key)
-                    current_items.append({'name': name, 'parent': ''})
-                    logger.info(f"  📁 既存: {key}")
-
-        logger.info(f"  📊 既存フォルダ総数: {len(current_keys)}")
-
-        # 提案フォルダ（親名|フォルダ名）の集合
-        suggested_keys = set()
-        for f in suggested_folders:
-            name = str(f.get('name', '')).strip()
-            parent = str(f.get('parent', '') or '').strip()
-            if name:
-                suggested_keys.add(f"{parent}|{name}")
-
-        # 差分計算
-        new_keys = suggested_keys - current_keys
-        to_remove_keys = current_keys - suggested_keys
-
-        # 保護フォルダ（削除しない）
-        protected_names = {"未分類", "Uncategorized", "Inbox"}
-        to_remove_keys = {k for k in to_remove_keys if k.split('|', 1)[1] not in protected_names}
-
-        logger.info(f"  ➕ 新規作成数: {len(new_keys)}")
-        logger.info(f"  �️ 削除対象数: {len(to_remove_keys)}")
-
-        # 最終構成を組み立て
-        final_structure = []
-        added_keys = set()
-
-        # 1) 提案フォルダを反映（new/existing）
-        for folder in suggested_folders:
-            name = str(folder.get('name', '')).strip()
-            parent = str(folder.get('parent', '') or '').strip()
-            if not name:
-                continue
-            key = f"{parent}|{name}"
-            status = "new" if key in new_keys else "existing"
-            final_structure.append({
-                "name": name,
-                "parent": parent,
-                "status": status,
-                "description": folder.get("description", ""),
-                "merge_from": folder.get("merge_from", [])
-            })
-            added_keys.add(key)
-            logger.info(f"    + {key} (status: {status})")
-
-        # 2) 既存だが提案にないものを to_remove として追加
-        for key in to_remove_keys:
-            parent, name = key.split('|', 1)
-            if key in added_keys:
-                continue
-            final_structure.append({
-                "name": name,
-                "parent": parent,
-                "status": "to_remove",
-                "description": "",
-                "merge_from": []
-            })
-            added_keys.add(key)
-            logger.info(f"    - {key} (status: to_remove)")
-
-        logger.info(f"  📊 最終構成フォルダ数: {len(final_structure)}")
+        logger.info("📊 [analyze-folder-structure] 処理完了")
+        logger.info("  ⏱️  処理時間: %.2f秒", elapsed_time)
+        logger.info("  🔢 入力トークン: %s", usage.prompt_tokens)
+        logger.info("  🔢 出力トークン: %s", usage.completion_tokens)
+        logger.info("  🔢 合計トークン: %s", usage.total_tokens)
+        logger.info("  ✅ 提案フォルダ数: %s", len(result.get('suggested_folders', [])))
+        logger.info("  🗑️  削除推奨数: %s", len(result.get('folders_to_remove', [])))
+
+        # 最終的なフォルダ構成を計算（(親, 名前) のキーで既存の構成と差分をとる）
+        suggested_tree = folder_tree.FolderTree.from_folders(result.get("suggested_folders", []))
+        current_tree = folder_tree.FolderTree.from_folders(current_items)
+        diff = suggested_tree.diff(current_tree, protected=mece.PROTECTED_FOLDERS)
+        final_structure = diff.final_structure()
+
+        logger.info("  📊 既存フォルダ総数: %s", len(current_tree))
+        logger.info("  ➕ 新規作成数: %s（うち移動: %s）", len(diff.new), len(diff.moved))
+        logger.info("  🗑️ 削除対象数: %s", len(diff.to_remove))
+        logger.info("  📊 最終構成フォルダ数: %s", len(final_structure))
 
         # folders_to_remove は名称ベースで重複排除
-        folders_to_remove_names = list({key.split('|', 1)[1] for key in to_remove_keys} | raw_folders_to_remove)
+        folders_to_remove_names = list(dict.fromkeys(diff.removed_names() + list(result.get("folders_to_remove", []))))
+
+        bookmark_moves, unresolved_bookmarks = await _plan_bookmark_moves(request.bookmarks, diff, request.library_id)
 
         response_data = OptimalFolderStructureResponse(
             suggested_folders=result.get("suggested_folders", []),
             folders_to_remove=folders_to_remove_names,
             overall_reasoning=result.get("overall_reasoning", ""),
-            final_structure=final_structure
+            final_structure=final_structure,
+            bookmark_moves=bookmark_moves,
+            unresolved_bookmarks=unresolved_bookmarks
         )
         
         logger.info("=== フォルダ構成分析API完了 ===")
         return response_data
 
     except json.JSONDecodeError as e:
+        metrics.json_repair("failed")
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [analyze-folder-structure] JSON解析エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"JSON解析エラー: {e}", exc_info=True)
-        logger.error(f"解析しようとした内容: {response_content if 'response_content' in locals() else 'N/A'}")
+        logger.error("❌ [analyze-folder-structure] JSON解析エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("JSON解析エラー: %s", e, exc_info=True)
+        logger.debug("解析しようとした内容: %s", response_content if 'response_content' in locals() else 'N/A')
         raise HTTPException(
             status_code=500,
             detail="AIからの応答をJSON形式で解析できませんでした"
@@ -1101,25 +1384,210 @@ JSON形式で以下の構造で返してください。overall_reasoningは100
         raise
     except Exception as e:
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [analyze-folder-structure] エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"フォルダ構成分析エラー: {e}", exc_info=True)
-        logger.error(f"エラータイプ: {type(e).__name__}")
+        logger.error("❌ [analyze-folder-structure] エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("フォルダ構成分析エラー: %s", e, exc_info=True)
+        logger.error("エラータイプ: %s", type(e).__name__)
         raise HTTPException(
             status_code=500,
             detail=f"フォルダ構成分析中にエラーが発生しました: {str(e)}"
         )
 
 
+def _build_folder_assignment_prompt(bookmark_lines, available_folders):
+    """フォルダ一括割り当てのプロンプトを作成する（bookmark_linesは1チャンク分）"""
+    return prompts.ASSIGN_FOLDERS.render(
+        folders="\n".join(f"- {folder}" for folder in available_folders),
+        count=len(bookmark_lines),
+        bookmarks=prompts.numbered(bookmark_lines),
+    )
+
+
+def _format_folder_line(bm):
+    """プロンプト用のブックマーク1行（タイトルは長すぎる場合に短縮）"""
+    title = tokens.truncate(str(bm.get('title', 'No title')), PROMPT_TITLE_MAX_TOKENS)
+    return f"ID:{bm.get('id', '')} | タイトル:{title} | 現在のフォルダ:{bm.get('current_folder', '未分類')}"
+
+
+def _folder_output_tokens(bookmark, folder_tokens):
+    """1件分の応答（{"bookmark_id", "suggested_folder", "reasoning"}）のトークン数の見込み"""
+    # 固定部分（キー名・記号）と理由（20字程度）
+    return tokens.estimate_tokens(str(bookmark.get('id', ''))) + folder_tokens + 45
+
+
+def _plan_folder_chunks(bookmarks, available_folders, attempt=0):
+    """
+    フォルダ一覧の長さとトークン予算からチャンクを決める
+    応答が max_completion_tokens の上限に収まる件数までにし、再試行のたびに最大件数を半分にする
+    """
+    fixed_tokens = _build_folder_assignment_prompt([], available_folders).total_tokens
+    folder_tokens = max((tokens.estimate_tokens(folder) for folder in available_folders), default=1)
+    output_limit = tokens.output_capacity(
+        max((_folder_output_tokens(bm, folder_tokens) for bm in bookmarks), default=1), REASONING_EFFORT_BULK_ASSIGN_FOLDERS
+    )
+    return pack_by_token_budget(
+        bookmarks,
+        lambda bm: tokens.estimate_tokens(_format_folder_line(bm)) + 5,
+        fixed_tokens=fixed_tokens,
+        budget=BULK_ASSIGN_FOLDERS_CHUNK_TOKEN_BUDGET,
+        max_items=max(1, min(BULK_ASSIGN_FOLDERS_MAX_CHUNK_SIZE, output_limit) >> attempt),
+    )
+
+
+async def _assign_folders_chunk(chunk, available_folders, emit):
+    """
+    1チャンク分のブックマークをLLMでフォルダに割り当てる
+    応答はストリーミングで受け取り、割り当てが1件完成するたびに emit で確定させる
+    応答が途中で切れても確定済みの割り当ては失われず、残りのブックマークだけが再試行される
+    戻り値: (ブックマークID -> BookmarkFolderSuggestion, usage)
+    """
+    prompt = _build_folder_assignment_prompt([_format_folder_line(bm) for bm in chunk], available_folders)
+    folder_tokens = max((tokens.estimate_tokens(folder) for folder in available_folders), default=1)
+    output_tokens = sum(_folder_output_tokens(bm, folder_tokens) for bm in chunk)
+    parser = JsonArrayStreamParser("assignments")
+
+    def on_delta(text):
+        results = {}
+        for assignment in parser.feed(text):
+            bookmark_id = str(assignment.get("bookmark_id", ""))
+            results[bookmark_id] = BookmarkFolderSuggestion(
+                bookmark_id=bookmark_id,
+                suggested_folder=assignment.get("suggested_folder", "未分類"),
+                reasoning=assignment.get("reasoning", "")
+            )
+        if results:
+            emit(results)
+
+    # OpenAI APIを呼び出し
+    response = await llm.chat_completion_stream(
+        on_delta,
+        model="gpt-5-mini",
+        messages=prompt.messages,
+        # reasoning_effort="medium",  # Render.comの古いopenaiライブラリではサポートされていないためコメントアウト
+        # 応答の見込み + 推論トークンの見込み（以前の固定値より小さくはしない）
+        max_completion_tokens=max(10000, tokens.completion_budget(output_tokens, REASONING_EFFORT_BULK_ASSIGN_FOLDERS)),
+        reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_FOLDERS,
+        response_format={"type": "json_object"}
+    )
+
+    finish_reason = response.choices[0].finish_reason
+    response_content = response.choices[0].message.content
+
+    if not response_content or response_content.strip() == "":
+        logger.error("OpenAI returned empty content")
+        logger.error("Finish reason: %s", finish_reason)
+        logger.error("Usage: %s", response.usage)
+        raise ChunkError("AIからの応答が空でした。", response.usage)
+
+    # finish_reasonチェック
+    if finish_reason == "length":
+        logger.warning("⚠️ トークン数制限により応答が途中で切れました")
+        logger.warning("解析済みの割り当て %s/%s件を採用し、残りを再試行します", parser.count, len(chunk))
+        if parser.count == 0:
+            metrics.json_repair("failed")
+            raise ChunkError("トークン数制限により応答が途中で切れました", response.usage)
+        metrics.json_repair("salvaged")
+    elif parser.count == 0:
+        metrics.json_repair("failed")
+        logger.debug("レスポンス内容（最後の500文字）: %s", response_content[-500:])
+        raise ChunkError("AIからの応答をJSON形式で解析できませんでした", response.usage)
+    elif parser.count < len(chunk):
+        logger.warning("⚠️ 一部のブックマークに対する割り当てが欠けています")
+        logger.warning("期待: %s件、実際: %s件", len(chunk), parser.count)
+
+    if parser.invalid:
+        metrics.json_repair("salvaged")
+        logger.warning("⚠️ 解析できなかった割り当て: %s件", parser.invalid)
+
+    # 結果はすべて emit 済み
+    return {}, response.usage
+
+
+async def _assign_folders_by_embedding(bookmarks, available_folders, library_id=None):
+    """
+    埋め込みの類似度でフォルダを割り当てる
+    最も近いフォルダのスコアと2位との差が閾値以上のブックマークだけを確定させる
+    （「未分類」はLLMに判断させるため確定させない）
+    戻り値: (確定した BookmarkFolderSuggestion のリスト, LLMに回すブックマークのリスト)
+    """
+    started = time.time()
+    library_vectors = await _library_vectors(library_id, bookmarks)
+    scores = await embeddings.classify(
+        embedder,
+        [embeddings.bookmark_text(bm) for bm in bookmarks],
+        available_folders,
+        labeled_queries=[
+            (i, bm.get('current_folder')) for i, bm in enumerate(bookmarks)
+            if bm.get('current_folder') and bm.get('current_folder') != '未分類'
+        ],
+        query_vectors=library_vectors,
+    )
+    best, best_scores, margins = embeddings.best_with_margin(scores)
+    confident = (best_scores >= EMBEDDING_MIN_SCORE) & (margins >= EMBEDDING_MIN_MARGIN)
+
+    local, pending = [], []
+    for i, bookmark in enumerate(bookmarks):
+        folder = available_folders[best[i]] if confident[i] else None
+        if folder is None or folder == '未分類':
+            pending.append(bookmark)
+            continue
+        local.append(BookmarkFolderSuggestion(
+            bookmark_id=bookmark.get('id', ''),
+            suggested_folder=folder,
+            reasoning=f"類似度による分類（{best_scores[i]:.2f}）"
+        ))
+    logger.info("🧭 埋め込みで割り当て: %s件（LLMで処理: %s件、%.2f秒）", len(local), len(pending), time.time() - started)
+    return local, pending
+
+
+async def _iter_folder_assignments(bookmarks, available_folders, library_id=None):
+    """
+    一括フォルダ割り当てを実行し、完了した順にイベントを返す
+    - ("suggestion", BookmarkFolderSuggestion)
+    - ("usage", usage)
+    - ("failed_chunk", {chunk_index, bookmark_ids, reason})
+    """
+    def log_round(attempt, item_count, chunk_count):
+        if attempt == 0:
+            logger.info("OpenAI APIにリクエスト送信中...（%sチャンク）", chunk_count)
+        else:
+            logger.info("🔁 欠けたブックマークを再試行: %s件（%sチャンク）", item_count, chunk_count)
+
+    pending = bookmarks
+    if ASSIGN_BY_EMBEDDING and bookmarks:
+        local, pending = await _assign_folders_by_embedding(bookmarks, available_folders, library_id)
+        for suggestion in local:
+            yield "suggestion", suggestion
+    if not pending:
+        return
+
+    async for kind, value in iter_chunked(
+        pending,
+        item_id=lambda bm: str(bm.get('id', '')),
+        plan_chunks=lambda items, attempt: _plan_folder_chunks(items, available_folders, attempt),
+        process_chunk=lambda chunk, emit: _assign_folders_chunk(chunk, available_folders, emit),
+        concurrency=BULK_ASSIGN_FOLDERS_CONCURRENCY,
+        timeout=BULK_ASSIGN_FOLDERS_CHUNK_TIMEOUT,
+        retries=BULK_ASSIGN_FOLDERS_CHUNK_RETRIES,
+        on_round=log_round,
+    ):
+        if kind == "results":
+            for suggestion in value.values():
+                yield "suggestion", suggestion
+        else:
+            yield kind, value
+
+
 @app.post("/bulk-assign-folders", response_model=BulkFolderAssignmentResponse)
 async def bulk_assign_folders(request: BulkFolderAssignmentRequest):
     """
     全ブックマークに対してAIが適切なフォルダを一括で提案する
+    件数の上限はなく、トークン予算ごとのチャンクに分けて並行処理する
     """
     start_time = time.time()
     
     logger.info("=== フォルダ一括割り当てAPI呼び出し ===")
-    logger.info(f"ブックマーク数: {len(request.bookmarks)}")
-    logger.info(f"利用可能なフォルダ数: {len(request.available_folders)}")
+    logger.info("ブックマーク数: %s", len(request.bookmarks))
+    logger.info("利用可能なフォルダ数: %s", len(request.available_folders))
     
     try:
         # OpenAI API キーのチェック
@@ -1136,219 +1604,206 @@ async def bulk_assign_folders(request: BulkFolderAssignmentRequest):
                 overall_reasoning="利用可能なフォルダがないため、提案できません。"
             )
 
-        suggestions = []
-        
-        # ブックマーク情報を整形（最大100件まで処理）
-        bookmarks_summary = []
-        for i, bm in enumerate(request.bookmarks[:100]):
-            bookmarks_summary.append({
-                "id": bm.get('id', ''),
-                "title": bm.get('title', 'No title'),
-                "url": bm.get('url', ''),
-                "excerpt": bm.get('excerpt', ''),
-                "current_folder": bm.get('current_folder', '未分類')
-            })
-
-        # プロンプトの作成（一括処理）
-        prompt = f"""あなたはブックマーク管理アシスタントです。
-以下の各ブックマークを分析し、既存のフォルダリストから最も適切なフォルダを1つずつ選んでください。
-
-【重要】フォルダとタグの使い分け
-- **フォルダ**: 大分類・カテゴリ（例: 仕事、趣味、プロジェクト名、テーマ別）
-  - ブックマークの主要な分類軸
-  - 1つのブックマークは1つのフォルダに所属
-  - **階層構造を持つフォルダが利用可能**（例: 「プログラミング / Python」「開発 / Web開発」）
-- **タグ**: コンテンツの特徴・属性を表すキーワード
-  - 横断的な分類（複数のフォルダにまたがる特徴）
-
-【利用可能なフォルダリスト】（階層構造を含む）
-{chr(10).join([f"- {folder}" for folder in request.available_folders])}
-
-【ブックマーク一覧】（全{len(bookmarks_summary)}件）
-{chr(10).join([f"{i+1}. ID:{bm['id']} | タイトル:{bm['title']} | 現在のフォルダ:{bm['current_folder']}" for i, bm in enumerate(bookmarks_summary)])}
-
-【重要な選択ルール】
-1. **最も深い階層のフォルダを優先的に選択してください**
-   - ❌ 悪い例: 「プログラミング」（浅すぎる）
-   - ✅ 良い例: 「プログラミング / Python / Django」（具体的）
-   - ✅ 良い例: 「開発 / Web開発 / フロントエンド」（具体的）
-
-2. **階層が深いフォルダが複数ある場合は、最も適切なものを選ぶ**
-   - 利用可能なフォルダをよく見て、「/」が含まれる深い階層のフォルダを積極的に使用
-
-3. **第1階層（親フォルダのみ）は極力避ける**
-   - 第2階層、第3階層がある場合は、そちらを優先
-
-【指示】
-1. 各ブックマークの内容を詳しく分析してください
-2. 利用可能なフォルダリストから、**最も深い階層で最も具体的なフォルダ**を選んでください
-3. ブックマークの**主要なテーマ・カテゴリ**に基づいて判断してください
-4. **【超重要】「未分類」は極力避けてください**
-   - 必ず利用可能なフォルダの中から最も近い・関連するものを選んでください
-   - 完全一致でなくても、少しでも関連性があればそのフォルダに割り当ててください
-   - どうしても全く関連性がない場合のみ「未分類」を選んでください（最終手段）
-5. **フォルダ名は利用可能なフォルダリストから完全一致で選ぶこと**（階層構造も含めて）
-6. **全てのブックマークに対して提案してください**（現在のフォルダと同じでも構いません）
-7. 以下のJSON形式で回答してください（他の説明は不要）：
-
-{{
-  "assignments": [
-    {{
-      "bookmark_id": "ブックマークID",
-      "suggested_folder": "提案するフォルダ名",
-      "reasoning": "選択理由（20字以内）"
-    }}
-  ]
-}}
-
-注意：
-- **全てのブックマークに対して提案すること**
-- **suggested_folderは階層構造を含む完全なパスで指定**（例: 「プログラミング / Python」）
-- suggested_folderは必ず利用可能なフォルダリストから完全一致で選ぶこと
-- **【超重要】「未分類」は極力避けること**。少しでも関連性があればそのフォルダを選ぶこと
-- **第2階層、第3階層のフォルダを積極的に使用すること**（より詳細な分類）
-- reasoningは簡潔に（例: 「Python学習コンテンツ」「Webデザイン参考」）
-- 日本語で回答してください"""
-
-        logger.info("OpenAI APIにリクエスト送信中...")
-        
-        # OpenAI APIを呼び出し
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "あなたはブックマーク整理の専門家です。各ブックマークの内容を分析し、最も適切なフォルダに分類してください。階層の深いフォルダ（第2階層、第3階層）を積極的に使用して、より詳細で整理された分類を行ってください。【超重要】「未分類」は極力避け、少しでも関連性があればそのフォルダに割り当ててください。どうしても全く関連性がない場合のみ「未分類」を選んでください。必ずJSON形式で回答してください。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            # reasoning_effort="medium",  # Render.comの古いopenaiライブラリではサポートされていないためコメントアウト
-            max_completion_tokens=10000,
-            reasoning_effort=REASONING_EFFORT_BULK_ASSIGN_FOLDERS,
-            response_format={"type": "json_object"}
+        suggestions, usages, failed_chunks = await _collect_assignments(
+            _iter_folder_assignments(request.bookmarks, request.available_folders, request.library_id),
+            request.bookmarks,
         )
 
-        logger.info("OpenAI APIからレスポンス受信")
-        logger.info(f"Finish reason: {response.choices[0].finish_reason}")
-        
-        # finish_reasonチェック
-        if response.choices[0].finish_reason == "length":
-            logger.warning("⚠️ トークン数制限により応答が途中で切れました")
-            logger.warning(f"処理ブックマーク数: {len(bookmarks_summary)}件")
-            logger.warning("ブックマーク数を減らして再試行することを推奨します")
-        
-        # レスポンスを解析
-        import json
-        
-        response_content = response.choices[0].message.content
-        
-        if not response_content or response_content.strip() == "":
-            logger.error("OpenAI returned empty content")
-            logger.error(f"Finish reason: {response.choices[0].finish_reason}")
-            logger.error(f"Usage: {response.usage}")
-            raise HTTPException(
-                status_code=500,
-                detail="AIからの応答が空でした。"
-            )
-        
-        logger.info(f"レスポンス内容の長さ: {len(response_content)} 文字")
-        
-        try:
-            result = json.loads(response_content)
-            assignments = result.get("assignments", [])
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析エラー: {e}")
-            logger.error(f"レスポンス内容（最初の1000文字）: {response_content[:1000]}")
-            logger.error(f"レスポンス内容（最後の500文字）: {response_content[-500:]}")
-            
-            # JSON修復を試みる
-            try:
-                # 不完全なJSONの場合、最後の配列要素を補完
-                if response_content.strip().endswith('"'):
-                    # 最後のカンマやブラケットが欠けている可能性
-                    fixed_content = response_content.strip()
-                    if not fixed_content.endswith(']}'):
-                        # 配列の閉じ括弧を追加
-                        if not fixed_content.endswith(']'):
-                            fixed_content += ']'
-                        if not fixed_content.endswith('}'):
-                            fixed_content += '}'
-                    
-                    logger.info("JSON修復を試みます...")
-                    result = json.loads(fixed_content)
-                    assignments = result.get("assignments", [])
-                    logger.info(f"✅ JSON修復成功: {len(assignments)}件の割り当てを取得")
-                else:
-                    raise e
-            except Exception as repair_error:
-                logger.error(f"JSON修復失敗: {repair_error}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"AIからの応答をJSON形式で解析できませんでした: {str(e)}"
-                )
-        
-        logger.info(f"割り当て結果: {len(assignments)}件")
-        
-        if len(assignments) == 0:
-            logger.warning("⚠️ 割り当て結果が0件でした")
-            logger.warning(f"応答内容: {response_content[:500]}")
-        
-        if len(assignments) < len(bookmarks_summary):
-            logger.warning(f"⚠️ 一部のブックマークに対する割り当てが欠けています")
-            logger.warning(f"期待: {len(bookmarks_summary)}件、実際: {len(assignments)}件")
-        
-        # レスポンスを整形
-        for assignment in assignments:
-            suggestions.append(BookmarkFolderSuggestion(
-                bookmark_id=assignment.get("bookmark_id", ""),
-                suggested_folder=assignment.get("suggested_folder", "未分類"),
-                reasoning=assignment.get("reasoning", "")
-            ))
+        if failed_chunks:
+            logger.warning("⚠️ 失敗したチャンク: %s", len(failed_chunks))
+            for chunk in failed_chunks:
+                logger.warning("  チャンク%s: %s件 - %s", chunk['chunk_index'], len(chunk['bookmark_ids']), chunk['reason'])
 
         # 処理時間とトークン数をログ
         elapsed_time = time.time() - start_time
-        usage = response.usage
-        logger.info(f"📊 [bulk-assign-folders] 処理完了")
-        logger.info(f"  ⏱️  処理時間: {elapsed_time:.2f}秒")
-        logger.info(f"  🔢 入力トークン: {usage.prompt_tokens}")
-        logger.info(f"  🔢 出力トークン: {usage.completion_tokens}")
-        logger.info(f"  🔢 合計トークン: {usage.total_tokens}")
-        logger.info(f"  📝 処理ブックマーク数: {len(suggestions)}")
+        logger.info("📊 [bulk-assign-folders] 処理完了")
+        logger.info("  ⏱️  処理時間: %.2f秒", elapsed_time)
+        logger.info("  🔢 入力トークン: %s", sum(u.prompt_tokens for u in usages))
+        logger.info("  🔢 出力トークン: %s", sum(u.completion_tokens for u in usages))
+        logger.info("  🔢 合計トークン: %s", sum(u.total_tokens for u in usages))
+        logger.info("  📝 処理ブックマーク数: %s", len(suggestions))
 
         return BulkFolderAssignmentResponse(
             suggestions=suggestions,
             total_processed=len(suggestions),
-            overall_reasoning=f"{len(suggestions)}件のブックマークに対してフォルダを提案しました。"
+            overall_reasoning=f"{len(suggestions)}件のブックマークに対してフォルダを提案しました。",
+            failed_chunks=failed_chunks
         )
 
-    except json.JSONDecodeError as e:
+    except HTTPException:
+        raise
+    except Exception as e:
         elapsed_time = time.time() - start_time
-        logger.error(f"❌ [bulk-assign-folders] JSON解析エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"JSON解析エラー: {e}")
-        logger.error(f"エラー位置: line {e.lineno}, column {e.colno}")
-        logger.error(f"レスポンス全体の長さ: {len(response_content if 'response_content' in locals() else '')} 文字")
-        if 'response_content' in locals():
-            logger.error(f"レスポンス内容（最初の1000文字）: {response_content[:1000]}")
-            logger.error(f"レスポンス内容（最後の1000文字）: {response_content[-1000:]}")
-        if 'response' in locals():
-            logger.error(f"Finish reason: {response.choices[0].finish_reason}")
-            logger.error(f"Usage: {response.usage}")
+        logger.error("❌ [bulk-assign-folders] エラー (処理時間: %.2f秒)", elapsed_time)
+        logger.error("一括フォルダ割り当てエラー: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
-            detail=f"AIからの応答をJSON形式で解析できませんでした。トークン制限により応答が不完全な可能性があります。ブックマーク数: {len(request.bookmarks)}件"
+            detail=f"一括フォルダ割り当て中にエラーが発生しました: {str(e)}"
         )
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        logger.error(f"❌ [bulk-assign-folders] エラー (処理時間: {elapsed_time:.2f}秒)")
-        logger.error(f"一括フォルダ割り当てエラー: {e}", exc_info=True)
+
+
+@app.post("/bulk-assign-tags/stream")
+async def bulk_assign_tags_stream(request: BulkTagAssignmentRequest):
+    """
+    /bulk-assign-tags のストリーミング版
+    各ブックマークの提案を完了した順にNDJSONで送信し、最後に集計レコードを送る
+    """
+    # OpenAI API キーのチェック
+    if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(
             status_code=500,
-            detail=f"一括フォルダ割り当て中にエラーが発生しました: {str(e)}"
+            detail="OpenAI API key is not configured"
+        )
+
+    bookmarks = request.bookmarks if request.available_tags else []
+    return StreamingResponse(
+        _stream_assignments(
+            _iter_tag_assignments(bookmarks, request.available_tags, request.library_id),
+            "bulk-assign-tags", "タグ"
+        ),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post("/bulk-assign-folders/stream")
+async def bulk_assign_folders_stream(request: BulkFolderAssignmentRequest):
+    """
+    /bulk-assign-folders のストリーミング版
+    各ブックマークの提案を完了した順にNDJSONで送信し、最後に集計レコードを送る
+    """
+    # OpenAI API キーのチェック
+    if not os.getenv("OPENAI_API_KEY"):
+        raise HTTPException(
+            status_code=500,
+            detail="OpenAI API key is not configured"
         )
 
+    bookmarks = request.bookmarks if request.available_folders else []
+    return StreamingResponse(
+        _stream_assignments(
+            _iter_folder_assignments(bookmarks, request.available_folders, request.library_id),
+            "bulk-assign-folders", "フォルダ"
+        ),
+        media_type="application/x-ndjson"
+    )
+
+
+# ===== バックグラウンドジョブ =====
+# 時間のかかる処理をジョブとして実行し、クライアントはジョブIDでポーリングする
+JOB_STORE = os.getenv("JOB_STORE", "memory")  # memory / sqlite
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", str(24 * 60 * 60)))
+JOB_PROGRESS_INTERVAL = 0.5  # 途中結果を記録する最短間隔（秒）
+
+# ジョブ種別 -> (リクエストモデル, 処理関数)
+JOB_KINDS = {
+    "suggest-tags": (TagSuggestionRequest, _suggest_tags_job),
+    "analyze-tag-structure": (OptimalTagStructureRequest, analyze_tag_structure),
+    "bulk-assign-tags": (BulkTagAssignmentRequest, bulk_assign_tags),
+    "analyze-folder-structure": (OptimalFolderStructureRequest, analyze_folder_structure),
+    "bulk-assign-folders": (BulkFolderAssignmentRequest, bulk_assign_folders),
+}
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # queued / running / succeeded / failed / cancelled
+    progress: Optional[dict] = None  # {stage, partial, processed, total}
+    result: Optional[dict] = None  # 完了時のレスポンス（各エンドポイントと同じ形式）
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+def _job_handler(kind, model, endpoint):
+    async def run(payload):
+        metrics.set_job_route(f"/{kind}")
+        response = await endpoint(model(**payload))
+        return response.dict()
+    return run
+
+
+def _job_error_message(e):
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    return str(e)
+
+
+def _job_response(job):
+    return JobResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        progress=job.get("progress"),
+        result=job.get("result"),
+        error=job.get("error"),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+    )
+
+
+job_manager = jobs.JobManager(
+    jobs.SQLiteJobStore(JOB_DB_PATH) if JOB_STORE == "sqlite" else jobs.InMemoryJobStore(),
+    {kind: _job_handler(kind, model, endpoint) for kind, (model, endpoint) in JOB_KINDS.items()},
+    max_workers=JOB_WORKERS,
+    ttl_seconds=JOB_TTL_SECONDS,
+    error_message=_job_error_message,
+)
+
+
+@app.on_event("startup")
+async def resume_jobs():
+    """前回のプロセスで終了しなかったジョブを再実行する"""
+    resumed = job_manager.resume_unfinished()
+    if resumed:
+        logger.info("🔁 中断されたジョブを再実行: %s件", resumed)
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """OpenAIへの接続プールを閉じる"""
+    await llm.client.close()
+
+
+@app.post("/jobs/{kind}", response_model=JobResponse, status_code=202)
+async def create_job(kind: str, payload: dict = Body(...)):
+    """
+    ジョブを登録してジョブIDを返す
+    kind: suggest-tags / analyze-tag-structure / bulk-assign-tags / analyze-folder-structure / bulk-assign-folders
+    リクエストボディは各エンドポイントと同じ
+    """
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=404, detail=f"不明なジョブ種別です: {kind}")
+    model, _ = JOB_KINDS[kind]
+    try:
+        validated = model(**payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
+    job = job_manager.submit(kind, validated.dict())
+    logger.info("🧵 ジョブ登録: %s (%s)", kind, job['id'])
+    return _job_response(job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """ジョブの状態・途中結果・結果を返す"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return _job_response(job)
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """実行待ち・実行中のジョブをキャンセルする"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return _job_response(job)
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,372 @@
+"""
+フォルダ構成のローカル検証（MECE）
+
+LLMが提案したフォルダ構成を、決まったルールで検査・修正する。
+- 名前の正規化: NFKC・大文字小文字・全角半角・カタカナ/ひらがな・区切り記号の違いを吸収し、
+  別名辞書（「AI」と「人工知能」など）で同じ意味の名前をまとめる
+- 重複: 同じ親の下の同名フォルダは統合、トップレベルとサブフォルダの同名はどちらかを残す、
+  異なる親の下の同名サブフォルダは既存フォルダに合わせて統合（手がかりがなければ曖昧として報告）
+- 親子関係: 循環している親子関係を断ち切り、存在しない親フォルダを補う
+- 曖昧なフォルダ（「その他」など）と、ブックマークが少なすぎる既存フォルダは削除推奨にする
+- 削除推奨は現在存在するフォルダだけにし、保護フォルダ（「未分類」など）は除く
+
+ルールで決められないもの（意味の近いフォルダ名など）は ambiguities として返し、
+その場合だけLLMに最終確認させる。
+"""
+import json
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# 削除しないフォルダ
+PROTECTED_FOLDERS = frozenset({"未分類", "Uncategorized", "Inbox"})
+
+# 同じ意味とみなす名前（先頭が代表）
+DEFAULT_ALIASES = [
+    ["AI", "人工知能", "エーアイ"],
+    ["Web", "ウェブ"],
+    ["プログラミング", "Programming", "コーディング", "Coding"],
+    ["テクノロジー", "Technology", "Tech", "テック"],
+    ["料理", "クッキング", "Cooking"],
+    ["レシピ", "Recipe", "Recipes"],
+    ["旅行", "Travel", "トラベル"],
+    ["ニュース", "News"],
+    ["デザイン", "Design"],
+    ["ゲーム", "Game", "Games"],
+    ["音楽", "Music", "ミュージック"],
+    ["映画", "Movie", "Movies", "Film"],
+    ["動画", "Video", "Videos", "ビデオ"],
+    ["仕事", "Work", "ワーク"],
+    ["学習", "勉強", "Learning", "Study"],
+    ["ツール", "Tool", "Tools"],
+    ["ノート", "メモ", "Note", "Notes", "Memo"],
+    ["買い物", "ショッピング", "Shopping"],
+    ["健康", "Health", "ヘルスケア"],
+    ["金融", "Finance", "ファイナンス"],
+]
+
+# MECEに反する曖昧なフォルダ名
+VAGUE_NAMES = ["その他", "Others", "Other", "Misc", "Miscellaneous", "雑多", "いろいろ", "色々"]
+
+_SEPARATORS = re.compile(r"[\s・･/／\\\-_&＆+,、.。()（）\[\]「」]+")
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def normalize_name(name: str) -> str:
+    """比較用のフォルダ名（NFKC・小文字・カタカナをひらがなに・区切り記号を除去）"""
+    text = unicodedata.normalize("NFKC", str(name or "")).casefold()
+    text = text.translate(_KATAKANA_TO_HIRAGANA)
+    return _SEPARATORS.sub("", text)
+
+
+def build_alias_map(groups: Iterable[Sequence[str]]) -> Dict[str, str]:
+    """別名の正規化形 -> 代表の正規化形"""
+    aliases = {}
+    for group in groups:
+        canonical = normalize_name(group[0])
+        for name in group:
+            aliases[normalize_name(name)] = canonical
+    return aliases
+
+
+def load_aliases(path: Optional[str]) -> List[List[str]]:
+    """既定の別名辞書に、JSONファイル（[["代表", "別名", ...], ...]）の別名を加える"""
+    groups = [list(group) for group in DEFAULT_ALIASES]
+    if path:
+        with open(path, encoding="utf-8") as f:
+            groups.extend(json.load(f))
+    return groups
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)} if len(text) > 1 else {text}
+
+
+@dataclass
+class ValidationResult:
+    suggested_folders: List[dict]
+    folders_to_remove: List[str]
+    fixes: List[str] = field(default_factory=list)  # ルールで修正した内容
+    ambiguities: List[str] = field(default_factory=list)  # ルールで決められなかった点（LLMに確認させる）
+
+
+class MeceValidator:
+    """
+    使い方:
+        validator = MeceValidator(aliases=load_aliases(None), min_bookmarks=3)
+        result = validator.validate(suggested, folders_to_remove, current_folders, folder_usage)
+    current_folders: [{"name", "parent"}]  folder_usage: フォルダ名 -> ブックマーク数
+    """
+
+    def __init__(self, aliases: Iterable[Sequence[str]] = DEFAULT_ALIASES, *, min_bookmarks: int = 3, similarity_threshold: float = 0.6):
+        self.aliases = build_alias_map(aliases)
+        self.vague = {normalize_name(name) for name in VAGUE_NAMES}
+        self.protected = {normalize_name(name) for name in PROTECTED_FOLDERS}
+        self.min_bookmarks = min_bookmarks
+        self.similarity_threshold = similarity_threshold
+
+    def key(self, name: str) -> str:
+        """同じフォルダとみなす名前のキー（正規化＋別名の解決）"""
+        normalized = normalize_name(name)
+        return self.aliases.get(normalized, normalized)
+
+    def validate(
+        self,
+        suggested: Sequence,
+        folders_to_remove: Sequence,
+        current_folders: Sequence[dict],
+        folder_usage: Optional[Dict[str, int]] = None,
+    ) -> ValidationResult:
+        fixes: List[str] = []
+        ambiguities: List[str] = []
+
+        current_by_key: Dict[str, List[dict]] = {}
+        current_names: Dict[str, str] = {}  # 正規化した名前 -> 既存フォルダの表記
+        for item in current_folders:
+            current_by_key.setdefault(self.key(item["name"]), []).append(item)
+            current_names.setdefault(normalize_name(item["name"]), item["name"])
+        usage = Counter()
+        for name, count in (folder_usage or {}).items():
+            usage[self.key(str(name).split("/")[-1])] += count
+
+        folders = self._sanitize(suggested, current_names, fixes)
+        folders = self._drop_vague(folders, fixes)
+        folders = self._resolve_duplicates(folders, current_by_key, fixes, ambiguities)
+        self._break_cycles(folders, fixes)
+        folders = self._add_missing_parents(folders, current_by_key, fixes)
+        folders, too_small = self._drop_small(folders, current_by_key, usage, fixes)
+        self._clean_merge_from(folders, current_names)
+        removals = self._clean_removals(folders, list(folders_to_remove or []) + too_small, current_by_key, current_names, fixes)
+        ambiguities.extend(self._similar_names(folders))
+
+        return ValidationResult(
+            suggested_folders=folders,
+            folders_to_remove=removals,
+            fixes=fixes,
+            ambiguities=ambiguities,
+        )
+
+    # ===== 個別のルール =====
+
+    def _sanitize(self, suggested: Sequence, current_names: Dict[str, str], fixes: List[str]) -> List[dict]:
+        """
+        不正な要素を除き、名前に親のパスが含まれていれば親に移す
+        表記ゆれ（大文字小文字・全角半角など）だけが違う既存フォルダがあれば既存の表記にそろえる
+        """
+        folders = []
+        for item in suggested or []:
+            if not isinstance(item, dict):
+                fixes.append(f"不正な形式の提案を除外: {item!r}")
+                continue
+            name = str(item.get("name") or "").strip()
+            parent = str(item.get("parent") or "").strip()
+            if "/" in parent:
+                parent = parent.rstrip("/").split("/")[-1].strip()
+            if "/" in name:
+                path = [part.strip() for part in name.split("/") if part.strip()]
+                if not path:
+                    continue
+                name = path[-1]
+                if len(path) > 1:
+                    parent = path[-2]
+                fixes.append(f"フォルダ名から親を分離: {item.get('name')} → {parent}/{name}")
+            if not name:
+                continue
+            name = current_names.get(normalize_name(name), name)
+            parent = current_names.get(normalize_name(parent), parent) if parent else ""
+            folders.append({
+                "name": name,
+                "description": item.get("description", "") or "",
+                "reasoning": item.get("reasoning", "") or "",
+                "parent": parent,
+                "merge_from": [str(m) for m in (item.get("merge_from") or []) if isinstance(m, str)],
+            })
+        return folders
+
+    def _drop_vague(self, folders: List[dict], fixes: List[str]) -> List[dict]:
+        kept = []
+        for folder in folders:
+            if self.key(folder["name"]) in self.vague:
+                fixes.append(f"曖昧なフォルダを除外: {folder['name']}")
+                continue
+            kept.append(folder)
+        # 曖昧なフォルダの下にあったフォルダはトップレベルへ
+        vague_parents = {self.key(f["name"]) for f in folders} - {self.key(f["name"]) for f in kept}
+        for folder in kept:
+            if folder["parent"] and self.key(folder["parent"]) in vague_parents:
+                folder["parent"] = ""
+        return kept
+
+    def _exists(self, folder: dict, current_by_key: Dict[str, List[dict]]) -> int:
+        """既存フォルダとの一致度（2: 同じ親の下に存在 / 1: 名前だけ存在 / 0: なし）"""
+        matches = current_by_key.get(self.key(folder["name"]), [])
+        if any(self.key(item.get("parent") or "") == self.key(folder["parent"]) for item in matches):
+            return 2
+        return 1 if matches else 0
+
+    def _resolve_duplicates(self, folders, current_by_key, fixes, ambiguities) -> List[dict]:
+        """同じキーのフォルダを1つにまとめる"""
+        groups: Dict[str, List[dict]] = {}
+        for folder in folders:
+            groups.setdefault(self.key(folder["name"]), []).append(folder)
+        parent_keys = {self.key(folder["parent"]) for folder in folders if folder["parent"]}
+
+        survivors = {}
+        for key, group in groups.items():
+            if len(group) == 1:
+                survivors[key] = group[0]
+                continue
+            parents = {self.key(folder["parent"]) for folder in group}
+            top_level = [folder for folder in group if not folder["parent"]]
+            if len(parents) > 1 and not top_level and not any(self._exists(f, current_by_key) == 2 for f in group):
+                paths = "」「".join(f"{f['parent']}/{f['name']}" for f in group)
+                ambiguities.append(f"異なる親の下に同じ名前のフォルダがあります: 「{paths}」（どの親に置くべきか）")
+
+            # 既存の同じ場所にあるもの > 名前が既存のもの > 子を持つトップレベル > サブフォルダ > 先に提案されたもの
+            def priority(folder):
+                has_children = not folder["parent"] and key in parent_keys
+                return (-self._exists(folder, current_by_key), not has_children, not folder["parent"])
+
+            ranked = sorted(group, key=priority)
+            keep = dict(ranked[0])
+            for other in ranked[1:]:
+                keep["merge_from"] = list(dict.fromkeys([keep["name"]] + keep["merge_from"] + other["merge_from"] + [other["name"]]))
+                if not keep["description"]:
+                    keep["description"] = other["description"]
+            fixes.append(
+                "重複フォルダを統合: "
+                + "、".join(f"{f['parent'] + '/' if f['parent'] else ''}{f['name']}" for f in group)
+                + f" → {keep['parent'] + '/' if keep['parent'] else ''}{keep['name']}"
+            )
+            survivors[key] = keep
+
+        # 親の参照を残ったフォルダの名前に合わせる
+        resolved = list(survivors.values())
+        for folder in resolved:
+            if folder["parent"]:
+                parent = survivors.get(self.key(folder["parent"]))
+                if parent is not None:
+                    folder["parent"] = parent["name"]
+        return resolved
+
+    def _break_cycles(self, folders: List[dict], fixes: List[str]) -> None:
+        """親子関係の循環（自分自身を親にする場合を含む）を、循環の最初のフォルダをトップレベルにして断ち切る"""
+        by_key = {self.key(folder["name"]): folder for folder in folders}
+        state: Dict[str, int] = {}  # 1: 探索中 / 2: 確定
+        for folder in folders:
+            path = []
+            key = self.key(folder["name"])
+            while key in by_key and state.get(key) is None:
+                state[key] = 1
+                path.append(key)
+                parent = by_key[key]["parent"]
+                key = self.key(parent) if parent else None
+            if key is not None and state.get(key) == 1:
+                cycle_start = by_key[key]
+                fixes.append(f"循環している親子関係を解消: {cycle_start['name']} をトップレベルに移動")
+                cycle_start["parent"] = ""
+            for visited in path:
+                state[visited] = 2
+
+    def _add_missing_parents(self, folders, current_by_key, fixes) -> List[dict]:
+        """提案にない親フォルダを補う（既存なら維持、なければ新規）"""
+        folders = list(folders)
+        known = {self.key(folder["name"]) for folder in folders}
+        index = 0
+        while index < len(folders):
+            parent = folders[index]["parent"]
+            index += 1
+            if not parent or self.key(parent) in known:
+                continue
+            existing = current_by_key.get(self.key(parent))
+            grandparent = ""
+            if existing:
+                grandparent = existing[0].get("parent") or ""
+                if grandparent and self.key(grandparent) == self.key(parent):
+                    grandparent = ""
+                reason = "サブフォルダの親として既存フォルダを維持"
+            else:
+                reason = "サブフォルダの親として追加"
+            folders.append({"name": parent, "description": "", "reasoning": reason, "parent": grandparent, "merge_from": []})
+            known.add(self.key(parent))
+            fixes.append(f"{reason}: {parent}")
+        return folders
+
+    def _drop_small(self, folders, current_by_key, usage, fixes):
+        """
+        ブックマークが min_bookmarks 件未満の既存フォルダを提案から外す（子や統合元を持つものは残す）
+        戻り値: (残すフォルダ, 外したフォルダ名)
+        """
+        if self.min_bookmarks <= 0 or not usage:
+            return folders, []
+        parent_keys = {self.key(folder["parent"]) for folder in folders if folder["parent"]}
+        kept, dropped = [], []
+        for folder in folders:
+            key = self.key(folder["name"])
+            small = key in current_by_key and usage.get(key, 0) < self.min_bookmarks
+            if small and key not in parent_keys and not folder["merge_from"] and key not in self.protected:
+                fixes.append(f"ブックマークが{usage.get(key, 0)}件のフォルダを削除推奨に変更: {folder['name']}")
+                dropped.append(folder["name"])
+                continue
+            kept.append(folder)
+        return kept, dropped
+
+    def _clean_merge_from(self, folders, current_names) -> None:
+        """統合元は既存フォルダ（既存の表記）だけにし、2個未満なら統合ではないので空にする"""
+        for folder in folders:
+            merge_from = [
+                current_names[normalize_name(name)] for name in folder["merge_from"]
+                if normalize_name(name) in current_names and self.key(name) not in self.protected
+            ]
+            merge_from = list(dict.fromkeys(merge_from))
+            folder["merge_from"] = merge_from if len(merge_from) >= 2 else []
+
+    def _clean_removals(self, folders, folders_to_remove, current_by_key, current_names, fixes) -> List[str]:
+        """削除推奨は既存フォルダのうち、残すフォルダ・保護フォルダ以外にする"""
+        kept_names = {normalize_name(folder["name"]) for folder in folders}
+        removals = []
+        candidates = [name for name in folders_to_remove if isinstance(name, str)]
+        # 既存の曖昧なフォルダは必ず削除推奨にする
+        candidates += [
+            item["name"] for items in current_by_key.values() for item in items
+            if self.key(item["name"]) in self.vague
+        ]
+        for name in candidates:
+            normalized = normalize_name(name.split("/")[-1].strip())
+            if normalized not in current_names or self.key(name) in self.protected or normalized in kept_names:
+                continue
+            removals.append(current_names[normalized])
+        removals = list(dict.fromkeys(removals))
+        dropped = [name for name in folders_to_remove if isinstance(name, str) and name not in removals]
+        if dropped:
+            fixes.append(f"削除推奨から除外（存在しない・残す・保護フォルダ）: {'、'.join(dropped)}")
+        return removals
+
+    def _similar_names(self, folders: List[dict]) -> List[str]:
+        """意味が重なっていそうなフォルダ（表記が近い兄弟フォルダ・名前が近いフォルダ）"""
+        by_key = {self.key(folder["name"]): folder for folder in folders}
+
+        def ancestors(key):
+            seen = set()
+            parent = by_key[key]["parent"]
+            while parent and self.key(parent) in by_key and self.key(parent) not in seen:
+                seen.add(self.key(parent))
+                parent = by_key[self.key(parent)]["parent"]
+            return seen
+
+        keys = list(by_key)
+        lineage = {key: ancestors(key) for key in keys}
+        grams = {key: _bigrams(key) for key in keys}
+        found = []
+        for i, a in enumerate(keys):
+            for b in keys[i + 1:]:
+                if a in lineage[b] or b in lineage[a] or a in self.protected or b in self.protected:
+                    continue
+                siblings = self.key(by_key[a]["parent"]) == self.key(by_key[b]["parent"])
+                overlap = len(grams[a] & grams[b]) / len(grams[a] | grams[b])
+                contained = siblings and min(len(a), len(b)) >= 2 and (a in b or b in a)
+                if overlap >= self.similarity_threshold or contained:
+                    found.append(f"意味が重なっている可能性: 「{by_key[a]['name']}」と「{by_key[b]['name']}」")
+        return found
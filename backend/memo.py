@@ -0,0 +1,145 @@
+"""
+ブックマーク単位のタグ提案メモ
+
+/suggest-tags と /bulk-assign-tags で共有する。
+ブックマークの内容ごとに「どのタグ一覧（語彙）から何を選んだか」を記録し、
+同じブックマークを再度処理するときはLLMを呼ばずに結果を返す。
+
+タグ一覧が変わった場合は、影響を受けるブックマークだけを再計算の対象にする:
+- 削除されたタグを提案していたブックマーク
+- 追加されたタグがタイトル・URL・メモに現れるブックマーク（新しいタグが選ばれうる）
+それ以外のブックマークは前回の結果をそのまま使う。
+"""
+import re
+from typing import List, Optional, Sequence, Set, Tuple
+
+from cache import ResponseCache, make_key, normalize_text
+
+_TAG_TOKEN_SPLIT = re.compile(r"[\s/・,、|＆&+\-_.()（）]+")
+
+
+def vocabulary_fingerprint(vocabulary: Sequence[str]) -> str:
+    """タグ一覧の指紋（並び順・表記ゆれに依存しない）"""
+    return make_key(vocabulary=vocabulary)
+
+
+def _bookmark_text(bookmark: dict) -> str:
+    return normalize_text(
+        " ".join(str(bookmark.get(field) or "") for field in ("title", "url", "excerpt"))
+    ).casefold()
+
+
+def _mentions(text: str, tag: str) -> bool:
+    """タグ（またはタグを区切った2文字以上の語）がテキストに現れるか"""
+    normalized = normalize_text(tag).casefold()
+    if normalized and normalized in text:
+        return True
+    return any(len(token) >= 2 and token in text for token in _TAG_TOKEN_SPLIT.split(normalized))
+
+
+class TagMemo:
+    """
+    ブックマーク単位のタグ提案メモ
+    entries: ブックマークのキー -> {"vocabulary": 指紋, "tags": [...]}
+    vocabularies: 指紋 -> タグ一覧（差分の計算用）
+
+    タグ一覧が変わっても記録は書き換えず、読むたびに記録時のタグ一覧との差分で影響を判定する。
+    一括処理では get_many / set_many で、読み書きをそれぞれ1回にまとめる（SQLiteならスレッドで実行）。
+    """
+
+    def __init__(self, entries: ResponseCache, vocabularies: ResponseCache):
+        self.entries = entries
+        self.vocabularies = vocabularies
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0  # タグ一覧の変更で再計算が必要になった件数
+        self._last_fingerprint = ((), vocabulary_fingerprint(()))  # 一括処理では同じタグ一覧が続く
+
+    def _fingerprint(self, vocabulary: Sequence[str]) -> str:
+        vocabulary = tuple(vocabulary)
+        if self._last_fingerprint[0] != vocabulary:
+            self._last_fingerprint = (vocabulary, vocabulary_fingerprint(vocabulary))
+        return self._last_fingerprint[1]
+
+    @staticmethod
+    def bookmark_key(bookmark: dict, *, model: str, reasoning_effort: str) -> str:
+        return make_key(
+            title=bookmark.get("title"),
+            url=bookmark.get("url"),
+            excerpt=bookmark.get("excerpt"),
+            model=model,
+            reasoning_effort=reasoning_effort,
+        )
+
+    async def get(self, bookmark: dict, vocabulary: Sequence[str], *, model: str, reasoning_effort: str) -> Optional[List[str]]:
+        """記録済みの提案を返す（なければ、またはタグ一覧の変更の影響を受ける場合は None）"""
+        return (await self.get_many([bookmark], vocabulary, model=model, reasoning_effort=reasoning_effort))[0]
+
+    async def get_many(
+        self, bookmarks: Sequence[dict], vocabulary: Sequence[str], *, model: str, reasoning_effort: str
+    ) -> List[Optional[List[str]]]:
+        """ブックマークごとの記録済みの提案（入力順。使えないものは None）"""
+        keys = [self.bookmark_key(bookmark, model=model, reasoning_effort=reasoning_effort) for bookmark in bookmarks]
+        entries = await self.entries.aget_many(keys)
+
+        fingerprint = self._fingerprint(vocabulary)
+        current = set(vocabulary)
+        # 記録時のタグ一覧ごとに、追加されたタグを1回だけ求める（記録時のタグ一覧が残っていなければ None）
+        stale = {entry["vocabulary"] for entry in entries.values() if entry["vocabulary"] != fingerprint}
+        previous = await self.vocabularies.aget_many(stale) if stale else {}
+        added = {old: current.difference(previous[old]) if old in previous else None for old in stale}
+
+        results: List[Optional[List[str]]] = []
+        for bookmark, key in zip(bookmarks, keys):
+            entry = entries.get(key)
+            if entry is None:
+                self.misses += 1
+                results.append(None)
+                continue
+            if entry["vocabulary"] != fingerprint:
+                added_tags = added[entry["vocabulary"]]
+                if added_tags is None or self._affected(bookmark, entry["tags"], current, added_tags):
+                    self.invalidated += 1
+                    self.misses += 1
+                    results.append(None)
+                    continue
+            self.hits += 1
+            results.append(list(entry["tags"]))
+        return results
+
+    async def set(self, bookmark: dict, vocabulary: Sequence[str], tags: Sequence[str], *, model: str, reasoning_effort: str) -> None:
+        await self.set_many([(bookmark, tags)], vocabulary, model=model, reasoning_effort=reasoning_effort)
+
+    async def set_many(
+        self, items: Sequence[Tuple[dict, Sequence[str]]], vocabulary: Sequence[str], *, model: str, reasoning_effort: str
+    ) -> None:
+        """(ブックマーク, タグ) の組をまとめて記録する"""
+        if not items:
+            return
+        fingerprint = self._fingerprint(vocabulary)
+        # タグ一覧はバッチごとに1回保存する（記録より先に期限切れにならないよう保存時刻も更新する）
+        await self.vocabularies.aset(fingerprint, sorted(set(vocabulary)))
+        await self.entries.aset_many({
+            self.bookmark_key(bookmark, model=model, reasoning_effort=reasoning_effort): {"vocabulary": fingerprint, "tags": list(tags)}
+            for bookmark, tags in items
+        })
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+        }
+
+    @staticmethod
+    def _affected(bookmark: dict, tags: Sequence[str], current: Set[str], added: Set[str]) -> bool:
+        """削除されたタグを提案していたか、追加されたタグがブックマークに現れるか"""
+        if any(tag not in current for tag in tags):
+            return True
+        if not added:
+            return False
+        text = _bookmark_text(bookmark)
+        return any(_mentions(text, tag) for tag in added)
@@ -0,0 +1,325 @@
+"""
+Prometheus形式のメトリクス
+
+/metrics でテキスト形式（version 0.0.4）を返す。依存パッケージは使わない。
+- MetricsMiddleware: ルートごとのリクエスト数・応答時間・同時処理数、
+  応答時間のうちLLMを待っていた時間とローカル処理の時間
+- llm.py の呼び出し: OpenAIの応答時間・トークン数（エンドポイント・モデル・reasoning_effort 別）・
+  途中で切れた応答の数
+- register_collector(): キャッシュのヒット率など、出力時に値を読むメトリクス
+
+LLMの呼び出しがどのエンドポイントのものかは contextvar（current_route）で渡す。
+"""
+import contextvars
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+# 実行中のリクエストのルート（ジョブの場合は /jobs/{kind}）と、LLMを待っている時間の集計
+current_route: contextvars.ContextVar[str] = contextvars.ContextVar("metrics_route", default="background")
+_request_timer: contextvars.ContextVar[Optional["_LLMTimer"]] = contextvars.ContextVar("metrics_llm_timer", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for key, value in self._values.items():
+            yield self.name, self._labels(key), value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state["buckets"][i] += 1
+                break
+        state["sum"] += value
+        state["count"] += 1
+
+    def samples(self):
+        for key, state in self._values.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["buckets"]):
+                cumulative += count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_bucket", dict(labels, le="+Inf"), state["count"]
+            yield f"{self.name}_sum", labels, state["sum"]
+            yield f"{self.name}_count", labels, state["count"]
+
+
+# (名前, 種類, 説明, [(ラベル, 値)]) を返す関数
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+_metrics: List[_Metric] = []
+_collectors: List[Collector] = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Collector):
+    """出力のたびに呼ばれる関数を登録する（外部の統計をそのまま出す場合）"""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines = []
+
+    def add(name, metric_type, documentation, samples):
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+    for metric in _metrics:
+        add(metric.name, metric.type, metric.documentation, metric.samples())
+    for collector in _collectors:
+        for name, metric_type, documentation, values in collector():
+            add(name, metric_type, documentation, ((name, labels, value) for labels, value in values))
+    return "\n".join(lines) + "\n"
+
+
+# ===== HTTP =====
+
+HTTP_REQUESTS = _register(Counter("http_requests_total", "Requests by route, method and status", ("route", "method", "status")))
+HTTP_DURATION = _register(Histogram("http_request_duration_seconds", "Request latency by route", ("route", "method")))
+HTTP_LLM_WAIT = _register(Histogram("http_request_llm_wait_seconds", "Time within a request spent waiting on the LLM", ("route",)))
+HTTP_LOCAL = _register(Histogram("http_request_local_seconds", "Time within a request spent on local processing", ("route",)))
+HTTP_IN_FLIGHT = _register(Gauge("http_requests_in_flight", "Requests being processed by route", ("route",)))
+
+# ===== LLM =====
+
+LLM_DURATION = _register(Histogram("llm_request_duration_seconds", "Upstream LLM latency including retries", ("endpoint", "model", "kind")))
+LLM_REQUESTS = _register(Counter("llm_requests_total", "Upstream LLM calls by outcome", ("endpoint", "model", "kind", "outcome")))
+LLM_IN_FLIGHT = _register(Gauge("llm_requests_in_flight", "Upstream LLM calls in progress", ("kind",)))
+LLM_PROMPT_TOKENS = _register(Counter("llm_prompt_tokens_total", "Prompt tokens", ("endpoint", "model", "reasoning_effort")))
+LLM_COMPLETION_TOKENS = _register(Counter("llm_completion_tokens_total", "Completion tokens", ("endpoint", "model", "reasoning_effort")))
+LLM_PROMPT_TOKENS_HISTOGRAM = _register(Histogram("llm_prompt_tokens", "Prompt tokens per call", ("endpoint",), TOKEN_BUCKETS))
+LLM_COMPLETION_TOKENS_HISTOGRAM = _register(Histogram("llm_completion_tokens", "Completion tokens per call", ("endpoint",), TOKEN_BUCKETS))
+LLM_TRUNCATED = _register(Counter("llm_truncated_total", "Responses cut off by max_completion_tokens (finish_reason=length)", ("endpoint", "model")))
+LLM_JSON_REPAIRS = _register(Counter(
+    "llm_json_repairs_total",
+    "JSON responses that could not be parsed as a whole (salvaged: partial results kept / failed: discarded)",
+    ("endpoint", "outcome"),
+))
+
+
+def set_job_route(route: str):
+    """
+    バックグラウンドジョブのLLM呼び出しを route（同期版のエンドポイント）として数える
+    ジョブのタスクはジョブを登録したリクエストの contextvar を引き継ぐため、そのリクエストの計測からは外す
+    """
+    current_route.set(route)
+    _request_timer.set(None)
+
+
+def json_repair(outcome: str, amount: int = 1):
+    """LLMの応答JSONを部分的に採用した（salvaged）・捨てた（failed）"""
+    LLM_JSON_REPAIRS.inc(amount, endpoint=current_route.get(), outcome=outcome)
+
+
+class _LLMTimer:
+    """1リクエストの中でLLMの応答を1件以上待っていた時間（並行した呼び出しは重ねて数えない）"""
+
+    def __init__(self):
+        self.active = 0
+        self.started = 0.0
+        self.total = 0.0
+
+    def enter(self):
+        if self.active == 0:
+            self.started = time.perf_counter()
+        self.active += 1
+
+    def exit(self):
+        self.active -= 1
+        if self.active == 0:
+            self.total += time.perf_counter() - self.started
+
+
+class waiting_on_llm:
+    """
+    実行中のHTTPリクエストがLLMの応答を待っている区間（llm.py の公開関数を囲む）
+    実行中の同一リクエストに合流した呼び出しも、待っている時間として数える
+    """
+
+    async def __aenter__(self):
+        self.timer = _request_timer.get()
+        if self.timer is not None:
+            self.timer.enter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.timer is not None:
+            self.timer.exit()
+        return False
+
+
+class llm_call:
+    """
+    OpenAIへの呼び出し1回分の計測（再試行を含む。合流した呼び出しは数えない）
+        async with metrics.llm_call("chat", kwargs) as call:
+            response = await ...
+            call.record(response)
+    """
+
+    def __init__(self, kind: str, kwargs: dict):
+        self.kind = kind
+        self.model = str(kwargs.get("model", ""))
+        self.reasoning_effort = str(kwargs.get("reasoning_effort") or "none")
+        self.endpoint = current_route.get()
+        self.outcome = "error"
+
+    async def __aenter__(self):
+        self.started = time.perf_counter()
+        LLM_IN_FLIGHT.inc(kind=self.kind)
+        return self
+
+    def record(self, response):
+        """応答の usage と finish_reason を記録する"""
+        self.outcome = "ok"
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            labels = {"endpoint": self.endpoint, "model": self.model, "reasoning_effort": self.reasoning_effort}
+            LLM_PROMPT_TOKENS.inc(prompt_tokens, **labels)
+            LLM_COMPLETION_TOKENS.inc(completion_tokens, **labels)
+            LLM_PROMPT_TOKENS_HISTOGRAM.observe(prompt_tokens, endpoint=self.endpoint)
+            if self.kind != "embeddings":
+                LLM_COMPLETION_TOKENS_HISTOGRAM.observe(completion_tokens, endpoint=self.endpoint)
+        choices = getattr(response, "choices", None)
+        if choices and getattr(choices[0], "finish_reason", None) == "length":
+            self.outcome = "truncated"
+            LLM_TRUNCATED.inc(endpoint=self.endpoint, model=self.model)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        LLM_IN_FLIGHT.dec(kind=self.kind)
+        labels = {"endpoint": self.endpoint, "model": self.model, "kind": self.kind}
+        LLM_DURATION.observe(time.perf_counter() - self.started, **labels)
+        LLM_REQUESTS.inc(outcome="error" if exc_type is not None else self.outcome, **labels)
+        return False
+
+
+# ===== ミドルウェア =====
+
+def _route_of(scope) -> str:
+    """パスではなくルートのテンプレート（/jobs/{job_id} など）を返す（ラベルの種類を増やさないため）"""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match.name == "FULL":
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """HTTPリクエストごとの応答時間（本文の送信完了まで）・ステータス・同時処理数を記録する"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = _route_of(scope)
+        method = scope.get("method", "")
+        status = {"code": 500}
+        timer = _LLMTimer()
+        route_token = current_route.set(route)
+        timer_token = _request_timer.set(timer)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route=route)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(route=route)
+            HTTP_REQUESTS.inc(route=route, method=method, status=status["code"])
+            HTTP_DURATION.observe(elapsed, route=route, method=method)
+            HTTP_LLM_WAIT.observe(timer.total, route=route)
+            HTTP_LOCAL.observe(max(0.0, elapsed - timer.total), route=route)
+            current_route.reset(route_token)
+            _request_timer.reset(timer_token)
@@ -0,0 +1,82 @@
+"""
+フォルダ構成の変更に伴うブックマークの移動計画
+
+構成分析の結果（FolderDiff）と各ブックマークの current_folder から、移動先をローカルで決める。
+- 現在のフォルダが残る: 移動しない
+- 現在のフォルダが別のフォルダに統合される（merge_from）・別の親に移る: 統合先・移動先へ
+- 現在のフォルダが削除されるが移動先が決まらない・同名のフォルダが複数あり特定できない: 曖昧
+曖昧なブックマークだけを埋め込み・LLMで割り当てればよい。
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from folder_tree import FolderDiff, FolderKey
+
+PATH_SEPARATOR = " / "  # クライアントのフォルダパスの区切り
+
+
+@dataclass
+class MovePlan:
+    moves: List[dict] = field(default_factory=list)  # {index, from_folder, to_folder(パス), reason}
+    ambiguous: List[int] = field(default_factory=list)  # 移動先を決められなかったブックマークの番号
+    unchanged: int = 0
+
+
+def _source_keys(folder: str, diff: FolderDiff) -> List[FolderKey]:
+    """current_folder（フォルダ名またはパス）に当たる既存フォルダのキー"""
+    parts = [part.strip() for part in folder.split("/") if part.strip()]
+    if not parts:
+        return []
+    candidates = diff.current.by_name.get(parts[-1], [])
+    if len(parts) > 1:
+        exact = [key for key in candidates if key[0] == parts[-2]]
+        if exact:
+            return exact
+    return list(candidates)
+
+
+def plan_moves(bookmarks: Sequence[dict], diff: FolderDiff, *, folder_field: str = "current_folder") -> MovePlan:
+    """ブックマークごとの移動先を決める"""
+    merge_plan = diff.merge_plan()
+    removed = set(diff.to_remove)
+    paths = diff.suggested.paths(PATH_SEPARATOR)
+    destination_cache: Dict[str, Optional[tuple]] = {}
+
+    def destination(folder: str):
+        """(移動先のキー, 理由)、移動しない場合は ("", "")、決められない場合は None"""
+        if folder in destination_cache:
+            return destination_cache[folder]
+        outcomes = set()
+        for key in _source_keys(folder, diff):
+            if key in merge_plan:
+                target = merge_plan[key]
+                outcomes.add((target, "移動" if diff.moved.get(target) == key else "統合"))
+            elif key in removed:
+                outcomes.add(None)
+            else:
+                outcomes.add(("", ""))
+        if not outcomes:
+            result = ("", "")  # 既存の構成にないフォルダ（未分類など）はそのまま
+        else:
+            # 同名のフォルダが複数あり行き先が分かれる場合も曖昧
+            result = outcomes.pop() if len(outcomes) == 1 else None
+        destination_cache[folder] = result
+        return result
+
+    plan = MovePlan()
+    for index, bookmark in enumerate(bookmarks):
+        folder = str(bookmark.get(folder_field) or "").strip()
+        outcome = destination(folder) if folder else ("", "")
+        if outcome is None:
+            plan.ambiguous.append(index)
+        elif not outcome[0]:
+            plan.unchanged += 1
+        else:
+            target, reason = outcome
+            plan.moves.append({
+                "index": index,
+                "from_folder": folder,
+                "to_folder": paths.get(target, target[1]),
+                "reason": f"{reason}: {folder} → {paths.get(target, target[1])}",
+            })
+    return plan
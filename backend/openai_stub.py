@@ -0,0 +1,313 @@
+"""
+ローカルで動くOpenAI APIの偽サーバー（負荷テスト・ベンチマーク用）
+
+/v1/chat/completions（通常・ストリーミング）と /v1/embeddings に応答する。APIキーやネットワークは不要。
+- プロンプトの先頭（prompts.py の指示文）からエンドポイントを判別し、それぞれが解析できる形の応答を返す
+- 応答時間は latency を中央値とする対数正規分布（jitter が広がり）
+- usage（プロンプト・応答のトークン数）を返し、応答が max_completion_tokens を超えれば
+  finish_reason="length" で途中までにする
+- error_rate の割合で 429（Retry-After 付き）、truncate_rate の割合で途中で切れた応答、
+  malformed_rate の割合で壊れたJSONを返す
+TLSは使わないため、新しい接続の最初のリクエストには handshake 秒の待ちを足す
+（本物のAPIで接続ごとにかかるTCP・TLSハンドシェイクの代わり）。
+
+使い方:
+    async with openai_stub.serve(latency=0.01) as stub:
+        client = AsyncOpenAI(api_key="x", base_url=stub.base_url)
+"""
+import asyncio
+import contextlib
+import json
+import math
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+import uvicorn
+
+import prompts
+import tokens
+
+_BOOKMARK_ID = re.compile(r"ID:(\S+) \|")
+_FOLDER_LINE = re.compile(r"^(.*?) \(親: (.*)\)$")
+
+EMBEDDING_DIM = 64
+
+
+def _section(text: str, header: str) -> str:
+    """プロンプト中の【見出し】から次の【見出し】までの本文（見出しの行は除く）"""
+    start = text.find(header)
+    if start < 0:
+        return ""
+    start = text.find("\n", start) + 1
+    end = text.find("\n\n【", start)
+    return text[start:] if end < 0 else text[start:end]
+
+
+def _lines(section: str) -> List[str]:
+    """番号・箇条書きの記号を除いた行"""
+    return [re.sub(r"^(\d+\. |- )", "", line).strip() for line in section.splitlines() if line.strip()]
+
+
+def _matching(line: str, candidates: List[str], count: int) -> List[str]:
+    """行に名前が含まれる候補（なければ先頭の候補）"""
+    matched = [candidate for candidate in candidates if candidate and candidate.split(" / ")[-1] in line]
+    return (matched or candidates)[:count]
+
+
+class StubOpenAI:
+    """ASGIアプリ（呼び出し回数・同時実行数・返したエラーを数える）"""
+
+    def __init__(
+        self,
+        latency: float = 0.01,
+        handshake: float = 0.0,
+        *,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        truncate_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.handshake = handshake
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.connections = set()  # これまでに受けた接続（クライアントのアドレス）
+        self.calls = 0
+        self.calls_by_kind: Counter = Counter()  # テンプレート名（embeddings）ごとの呼び出し回数
+        self.faults: Counter = Counter()  # rate_limited / truncated / malformed
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.base_url = ""
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "calls": self.calls,
+            "calls_by_kind": dict(self.calls_by_kind),
+            "faults": dict(self.faults),
+            "max_in_flight": self.max_in_flight,
+            "connections": len(self.connections),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        path = scope["path"].rstrip("/")
+        if path not in ("/v1/chat/completions", "/v1/embeddings"):
+            await self._send_json(send, 404, {"error": {"message": "not found"}})
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        request = json.loads(body or b"{}")
+
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            client = scope.get("client")
+            delay = self.latency * math.exp(self.random.gauss(0, self.jitter)) if self.jitter else self.latency
+            if client not in self.connections:
+                self.connections.add(client)
+                delay += self.handshake
+            await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.faults["rate_limited"] += 1
+            await self._send_json(send, 429, {
+                "error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"},
+            }, extra_headers=[(b"retry-after-ms", str(int(self.latency * 1000)).encode())])
+            return
+
+        if path == "/v1/embeddings":
+            self.calls_by_kind["embeddings"] += 1
+            await self._send_json(send, 200, self._embeddings(request))
+            return
+
+        kind, content = self.reply(request)
+        self.calls_by_kind[kind] += 1
+        content, finish_reason = self._apply_faults(request, content)
+        if request.get("stream"):
+            await self._send_stream(send, request, content, finish_reason)
+        else:
+            await self._send_json(send, 200, {
+                "id": f"chatcmpl-stub-{self.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": self._usage(request, content),
+            })
+
+    # ===== 応答本文 =====
+
+    def reply(self, request: dict):
+        """(テンプレート名, 応答本文)。どのテンプレートでもなければ最後のメッセージをそのまま返す"""
+        messages = request.get("messages") or [{}]
+        user = str(messages[-1].get("content", ""))
+        for template in prompts.TEMPLATES:
+            if user.startswith(template.prefix):
+                # 指示文にも見出しの名前が出てくるので、データ部分だけを渡す
+                builder = getattr(self, "_reply_" + template.name.replace("-", "_"))
+                return template.name, builder(user[len(template.prefix):])
+        return "echo", user
+
+    def _reply_suggest_tags(self, user: str) -> str:
+        tags = _section(user, "【既存のタグリスト】").split(", ")
+        return ", ".join(_matching(_section(user, "【ブックマーク情報】"), tags, 3))
+
+    _reply_bulk_assign_tags = _reply_suggest_tags
+
+    def _reply_bulk_assign_tags_batch(self, user: str) -> str:
+        tags = _section(user, "【既存のタグリスト】").split(", ")
+        return json.dumps({"assignments": [
+            {"bookmark_id": match.group(1), "suggested_tags": _matching(line, tags, 3)}
+            for line in _lines(_section(user, "【ブックマーク一覧】"))
+            for match in [_BOOKMARK_ID.search(line)] if match
+        ]}, ensure_ascii=False)
+
+    def _reply_analyze_tag_structure(self, user: str) -> str:
+        tags = [tag for tag in _section(user, "【現在のタグ一覧】").split(", ") if tag]
+        keep, remove = tags[:max(1, len(tags) * 3 // 4)], tags[max(1, len(tags) * 3 // 4):]
+        return json.dumps({
+            "suggested_tags": [
+                {"name": tag, "description": f"{tag}に関するブックマーク", "reasoning": "使用数が多いため", "merge_from": []}
+                for tag in keep
+            ],
+            "tags_to_remove": remove,
+            "overall_reasoning": "使用数の少ないタグを整理しました",
+        }, ensure_ascii=False)
+
+    def _reply_analyze_folder_structure(self, user: str) -> str:
+        folders = []
+        for line in _lines(_section(user, "【現在のフォルダ一覧】")):
+            match = _FOLDER_LINE.match(line)
+            name, parent = (match.group(1), match.group(2)) if match else (line, "なし")
+            folders.append({"name": name, "parent": "" if parent == "なし" else parent})
+        vague = [folder["name"] for folder in folders if folder["name"] in ("その他", "Others", "雑多")]
+        return json.dumps({
+            "suggested_folders": [
+                dict(folder, description=f"{folder['name']}のブックマーク", reasoning="現在の構成を維持", merge_from=[])
+                for folder in folders if folder["name"] not in vague
+            ],
+            "folders_to_remove": vague,
+            "overall_reasoning": "曖昧なフォルダを削除しました",
+        }, ensure_ascii=False)
+
+    def _reply_review_folder_structure(self, user: str) -> str:
+        return json.dumps({"needs_adjustment": False}, ensure_ascii=False)
+
+    def _reply_bulk_assign_folders(self, user: str) -> str:
+        folders = [folder for folder in _lines(_section(user, "【利用可能なフォルダリスト】")) if folder != "未分類"] or ["未分類"]
+        return json.dumps({"assignments": [
+            {"bookmark_id": match.group(1), "suggested_folder": _matching(line, folders, 1)[0], "reasoning": "タイトルから判断"}
+            for line in _lines(_section(user, "【ブックマーク一覧】"))
+            for match in [_BOOKMARK_ID.search(line)] if match
+        ]}, ensure_ascii=False)
+
+    def _embeddings(self, request: dict) -> dict:
+        inputs = request.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            rng = random.Random(zlib.crc32(str(text).encode("utf-8")))
+            data.append({"object": "embedding", "index": index, "embedding": [rng.gauss(0, 1) for _ in range(EMBEDDING_DIM)]})
+        prompt_tokens = sum(tokens.raw_tokens(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    # ===== 障害の再現 =====
+
+    def _apply_faults(self, request: dict, content: str):
+        """(本文, finish_reason): max_completion_tokens 超過・ランダムな途中切れ・壊れたJSON"""
+        limit = request.get("max_completion_tokens") or request.get("max_tokens")
+        if limit and tokens.raw_tokens(content) > limit:
+            self.faults["truncated"] += 1
+            return tokens.truncate(content, int(limit), suffix=""), "length"
+        if self.truncate_rate and self.random.random() < self.truncate_rate:
+            self.faults["truncated"] += 1
+            return content[:len(content) // 2], "length"
+        if self.malformed_rate and request.get("response_format") and self.random.random() < self.malformed_rate:
+            self.faults["malformed"] += 1
+            return content[:-1] + ",}", "stop"
+        return content, "stop"
+
+    # ===== 送信 =====
+
+    def _usage(self, request: dict, content: str) -> dict:
+        prompt_tokens = sum(tokens.raw_tokens(str(message.get("content", ""))) + 4 for message in request.get("messages") or [])
+        completion_tokens = tokens.raw_tokens(content)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def _headers(self, content_type: bytes):
+        return [
+            (b"content-type", content_type),
+            (b"x-ratelimit-limit-requests", b"10000"),
+            (b"x-ratelimit-remaining-requests", b"9999"),
+            (b"x-ratelimit-reset-requests", b"6ms"),
+        ]
+
+    async def _send_json(self, send, status: int, payload: dict, extra_headers=()):
+        headers = self._headers(b"application/json") + list(extra_headers)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": json.dumps(payload, ensure_ascii=False).encode("utf-8")})
+
+    async def _send_stream(self, send, request: dict, content: str, finish_reason: str = "stop", piece_size: int = 40):
+        await send({"type": "http.response.start", "status": 200, "headers": self._headers(b"text/event-stream")})
+        base = {"id": f"chatcmpl-stub-{self.calls}", "object": "chat.completion.chunk", "created": int(time.time()), "model": request.get("model", "stub")}
+        chunks = [
+            dict(base, choices=[{
+                "index": 0,
+                "delta": {"content": content[start:start + piece_size]},
+                "finish_reason": finish_reason if start + piece_size >= len(content) else None,
+            }])
+            for start in range(0, len(content), piece_size)
+        ]
+        chunks.append(dict(base, choices=[], usage=self._usage(request, content)))
+        for chunk in chunks:
+            data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+
+@contextlib.asynccontextmanager
+async def serve(stub: StubOpenAI = None, *, latency: float = 0.01, handshake: float = 0.0, host: str = "127.0.0.1"):
+    """偽サーバーを空いているポートで起動し、終了時に止める"""
+    stub = stub or StubOpenAI(latency, handshake)
+    server = uvicorn.Server(uvicorn.Config(stub, host=host, port=0, log_level="warning", access_log=False))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()  # 起動に失敗した場合は例外を出す
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    stub.base_url = f"http://{host}:{port}/v1"
+    try:
+        yield stub
+    finally:
+        server.should_exit = True
+        await task
@@ -0,0 +1,548 @@
+"""
+LLMに送るプロンプトのテンプレート
+
+指示文（システムメッセージとユーザーメッセージの先頭）はリクエストによらず同じなので、
+import時に1回だけ組み立てておく（PromptTemplate）。リクエストごとに変わるデータ
+（タグ一覧・ブックマーク一覧など）は必ず指示文の後ろに付ける。
+- 先頭がバイト単位で毎回同じになり、OpenAI側のプロンプトキャッシュが効く
+- リクエストごとの処理はデータ部分の組み立てだけになる
+
+render() の結果にはセクションごとのトークン数（概算）が付く。
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+from tokens import estimate_tokens
+
+
+@dataclass
+class Prompt:
+    name: str
+    messages: List[dict]
+    tokens: Dict[str, int] = field(default_factory=dict)  # セクション名 -> トークン数（概算）
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    @property
+    def user(self) -> str:
+        return self.messages[-1]["content"]
+
+    def describe(self) -> str:
+        """ログ用: セクションごとのトークン数"""
+        parts = " + ".join(f"{name} {count}" for name, count in self.tokens.items())
+        return f"{self.name}: {parts} = {self.total_tokens}トークン"
+
+
+class PromptTemplate:
+    """
+    system: システムメッセージ（固定）
+    instructions: ユーザーメッセージ先頭の指示文（固定）
+    sections: [(セクション名, str.format 形式のテンプレート)]（指示文の後ろに順に付ける可変部分）
+    """
+
+    def __init__(self, name: str, *, system: str, instructions: str, sections: Sequence[Tuple[str, str]]):
+        self.name = name
+        self.system = system
+        self.prefix = instructions.strip() + "\n\n"
+        self.sections = list(sections)
+        # 固定部分のトークン数は1回だけ数える
+        self.static_tokens = {"system": estimate_tokens(system), "指示": estimate_tokens(self.prefix)}
+
+    def render(self, **values) -> Prompt:
+        tokens = dict(self.static_tokens)
+        rendered = []
+        for name, template in self.sections:
+            text = template.format(**values)
+            tokens[name] = estimate_tokens(text)
+            rendered.append(text)
+        return Prompt(
+            name=self.name,
+            messages=[
+                {"role": "system", "content": self.system},
+                {"role": "user", "content": self.prefix + "\n\n".join(rendered)},
+            ],
+            tokens=tokens,
+        )
+
+
+def numbered(lines: Sequence[str]) -> str:
+    """「1. ...」形式の一覧"""
+    return "\n".join(f"{i + 1}. {line}" for i, line in enumerate(lines))
+
+
+# ===== タグ提案（/suggest-tags、/bulk-assign-tags の1件ずつの処理） =====
+
+_TAG_SYSTEM = "あなたは正確で簡潔なタグ提案を行うアシスタントです。必ず既存のタグリストの中からのみ選択してください。"
+
+_TAG_FOLDER_DISTINCTION = """【重要】タグとフォルダの使い分け
+- **フォルダ**: カテゴリや分類（例: 仕事、趣味、プロジェクト名など）
+- **タグ**: コンテンツの特徴や属性を表すキーワード
+  - そのブックマークの特徴・属性（技術スタック、テーマ、形式など）
+  - 検索・フィルタリングで使うキーワード
+  - 横断的な分類（複数のフォルダにまたがる特徴）"""
+
+_SUGGEST_TAGS_INSTRUCTIONS = f"""あなたはブックマーク管理アシスタントです。
+末尾の【ブックマーク情報】を分析し、【既存のタグリスト】から最も適切なタグを選んでください。
+
+{_TAG_FOLDER_DISTINCTION}
+
+【指示】
+1. このブックマークの**特徴・属性**を表すタグを既存リストから1〜3個選んでください
+2. 検索やフィルタリングで使いやすいキーワードを優先してください
+3. 既存のタグリストに適切なものがない場合は、空のリストを返してください
+4. タグ名のみをカンマ区切りで返してください（説明は不要）
+
+良い例:
+- 技術記事 → タグ: Python, AI, チュートリアル
+- デザイン参考 → タグ: UI/UX, レスポンシブ, モダン
+- ニュース記事 → タグ: テクノロジー, 最新動向, 2024年
+
+回答例: プログラミング, Python, AI"""
+
+# タグリストはリクエスト内の全ブックマークで同じなので、ブックマーク情報より前に置く
+SUGGEST_TAGS = PromptTemplate(
+    "suggest-tags",
+    system=_TAG_SYSTEM,
+    instructions=_SUGGEST_TAGS_INSTRUCTIONS,
+    sections=[
+        ("タグ一覧", "【既存のタグリスト】\n{tags}"),
+        ("ブックマーク", "【ブックマーク情報】\nタイトル: {title}\nURL: {url}\nメモ: {excerpt}"),
+    ],
+)
+
+SUGGEST_TAGS_WITH_CURRENT = PromptTemplate(
+    "bulk-assign-tags",
+    system=_TAG_SYSTEM,
+    instructions=_SUGGEST_TAGS_INSTRUCTIONS,
+    sections=[
+        ("タグ一覧", "【既存のタグリスト】\n{tags}"),
+        ("ブックマーク", "【ブックマーク情報】\nタイトル: {title}\nURL: {url}\nメモ: {excerpt}\n\n【現在のタグ】\n{current_tags}"),
+    ],
+)
+
+
+# ===== タグ一括提案（複数ブックマークを1回のJSONモードのリクエストで） =====
+
+BATCH_TAGS = PromptTemplate(
+    "bulk-assign-tags-batch",
+    system=_TAG_SYSTEM + "必ずJSON形式で回答してください。",
+    instructions=f"""あなたはブックマーク管理アシスタントです。
+末尾の【ブックマーク一覧】の各ブックマークを分析し、【既存のタグリスト】から最も適切なタグをブックマークごとに選んでください。
+
+{_TAG_FOLDER_DISTINCTION}
+
+【指示】
+1. 各ブックマークの**特徴・属性**を表すタグを既存リストから1〜3個選んでください
+2. 検索やフィルタリングで使いやすいキーワードを優先してください
+3. 既存のタグリストに適切なものがない場合は、空の配列にしてください
+4. 以下のJSON形式で回答してください（他の説明は不要）：
+
+{{
+  "assignments": [
+    {{
+      "bookmark_id": "ブックマークID",
+      "suggested_tags": ["タグ1", "タグ2"]
+    }}
+  ]
+}}
+
+注意：
+- **全てのブックマークに対して提案すること**
+- bookmark_idは一覧のIDをそのまま使うこと
+- suggested_tagsは必ず既存のタグリストから完全一致で選ぶこと""",
+    sections=[
+        ("タグ一覧", "【既存のタグリスト】\n{tags}"),
+        ("ブックマーク", "【ブックマーク一覧】（全{count}件）\n{bookmarks}"),
+    ],
+)
+
+
+# ===== タグ構成分析 =====
+
+ANALYZE_TAGS = PromptTemplate(
+    "analyze-tag-structure",
+    system="あなたは情報整理とタグ分類の専門家です。実用的で分かりやすいタグ構成を提案してください。必ずJSON形式で回答してください。",
+    instructions="""あなたは熟練したブックマーク管理・情報整理の専門家です。
+末尾のブックマーク一覧と現在のタグ構成を分析し、最適なタグ構成を提案してください。
+
+【重要】タグとフォルダの使い分け
+- **フォルダ**: 大分類・カテゴリ（例: 仕事、趣味、プロジェクト名）
+- **タグ**: コンテンツの特徴・属性を表すキーワード
+  - そのコンテンツの具体的な特徴（技術、テーマ、形式など）
+  - 検索・フィルタリング用のキーワード
+  - 横断的な分類（複数フォルダにまたがる特徴）
+
+【分析と提案】
+以下の観点で分析し、改善案を提案してください：
+
+1. **新規タグの提案**
+   - コンテンツの**特徴・属性**を表すタグ
+   - **検索・フィルタリングで使いやすい**キーワード
+   - 各タグの説明と、なぜ必要かの理由（簡潔に）
+   - **重要：１つのブックマークにしか適用されないタグは提案しないでください**
+   - **重要：タグ名は基本的に日本語で提案してください。アルファベットは必要最小限にしてください**
+   - **重要：英語の固有名詞や専門用語を除き、できるだけ日本語表記を使用してください**
+   - **重要：タグは概念的・抽象的な単語に限定してください。詳細すぎる・具体的すぎるタグは避けてください**
+   - **良い例：「開発」「デザイン」「学習」「リファレンス」「チュートリアル」「ツール」**
+   - **悪い例：「React Hooks の使い方」「VSCode 拡張機能開発」「Python データ分析入門」（詳細すぎる）**
+   - **タグは2-5文字程度の簡潔な単語を推奨します**
+
+2. **タグの統合提案**
+   - 意味が重複している類似タグの統合案
+   - **統合元のタグが2個以上ある場合のみ提案**（1個だけの場合は統合不要）
+   - 例：「プログラミング」と「コーディング」→「プログラミング」に統合
+   - **統合後のタグ名も日本語を優先し、より概念的な単語を選んでください**
+
+3. **削除推奨タグ**
+   - ほとんど使われていないタグ
+   - 曖昧すぎるタグ、または大分類的なタグ（フォルダで管理すべきもの）
+   - 検索・フィルタリングに役立たないタグ
+   - **詳細すぎる・具体的すぎるタグ（「○○の使い方」「××入門」など）**
+   - **重要：１つのブックマークにしか使われていないタグは削除候補にしてください**
+
+【回答形式】
+JSON形式で以下の構造で返してください。overall_reasoningは100字以内で簡潔に：
+
+{
+  "suggested_tags": [
+    {
+      "name": "提案するタグ名（日本語優先）",
+      "description": "このタグの用途説明（30字以内）",
+      "reasoning": "なぜこのタグが必要か（50字以内）",
+      "merge_from": ["統合元のタグ1", "統合元のタグ2"]
+    }
+  ],
+  "tags_to_remove": ["削除推奨タグ1", "削除推奨タグ2"],
+  "overall_reasoning": "全体的な分析結果と改善方針の説明（100字以内）"
+}
+
+注意：
+- merge_fromは既存タグの統合時のみ使用（新規タグの場合は空配列）
+- **merge_fromには必ず2個以上のタグを含めること**（1個だけの場合は統合提案しない）
+- suggested_tagsには新規タグと統合後のタグの両方を含める
+- タグはコンテンツの**特徴・属性**や**検索キーワード**であることを意識
+- フォルダで管理すべき大分類的なタグは提案しない
+- **タグ名は日本語を基本とし、英語の固有名詞や広く使われている専門用語以外はアルファベットを避けてください**
+- **タグは概念的・抽象的な単語（2-5文字程度）に限定し、詳細すぎる・具体的すぎるタグは避けてください**
+- **複数の単語を組み合わせた長いタグや、文章のようなタグは作成しないでください**
+- 日本語で分かりやすく説明してください
+- 実用的で具体的な提案をしてください""",
+    sections=[
+        ("タグ一覧", "【現在のタグ一覧】（全{tag_count}個）\n{tags}"),
+        ("使用数", "【タグごとの使用数】（全{bookmark_count}件から集計。括弧内は使用しているブックマーク数）\n{usage}"),
+        ("ブックマーク", "【ブックマーク一覧】（全{bookmark_count}件から、タグ・フォルダごとに偏りなく選んだ{sample_count}件）\n{bookmarks}"),
+    ],
+)
+
+
+# ===== フォルダ構成分析 =====
+
+ANALYZE_FOLDERS = PromptTemplate(
+    "analyze-folder-structure",
+    system="あなたは情報整理とフォルダ分類の専門家です。ブックマーク総数に対して適切な粒度でフォルダを提案してください。MECE原則（相互排他的かつ網羅的）を徹底してください。必ず以下を守ってください：1) 【超重要】同じ名前のフォルダは絶対に重複提案しない（例: トップレベル「旅行」とサブ「生活/旅行」を両方提案するのは禁止。「エンタメ/ゲーム」を2回提案するのも禁止）、2) 【最重要】階層化できるものは必ず親フォルダとサブフォルダに構造化（フラット構造を避け、関連フォルダは親子関係で整理。トップレベルに単独で存在するフォルダを減らす）、3) フォルダを細分化しすぎない（1フォルダあたり最低5〜10件、1〜2件しか入らないフォルダは提案しない）、4) suggested_foldersに5件以上提案（第2階層、第3階層のフォルダも積極的に含める。ただしブックマーク数が少ない場合は階層を浅く）、5) 【最重要】類似・重複フォルダを削除推奨に含める（例: 「その他」「Others」などの曖昧フォルダは最優先削除、「料理」「レシピ」「クッキング」は1つに統合して残りを削除、「AI」「人工知能」はどちらか削除、「Web」「ウェブ」はどちらか削除、親とサブで重複する名前も削除、異なる親の下に同じ名前のサブフォルダがあれば統合または削除）、6) folders_to_removeに2件以上提案（特に「その他」等の曖昧フォルダ、類似フォルダ、細分化しすぎているフォルダ。【超重要】削除推奨フォルダは必ずcurrent_foldersに存在するものから選ぶこと）、7) 【超重要】nameには親フォルダ名を含めない（例: ❌\"プログラミング/Python\" → ⭕\"Python\"でparent=\"プログラミング\"）、8) 【重要】「未分類」フォルダは統合・削除の対象外とする。必ずJSON形式で回答してください。",
+    instructions="""あなたは熟練したブックマーク管理・情報整理の専門家です。
+末尾のブックマーク一覧と現在のフォルダ構成を分析し、最適なフォルダ構成を提案してください。
+ブックマーク総数は末尾の【ブックマーク数】を参照してください。
+
+【フォルダ数の上限ルール】
+- 作成するフォルダの最大数は、以下の数式で決定してください：
+  - 最大フォルダ数 = min(15, max(3, floor(1.5 * sqrt(ブックマーク数))))
+- 例: 9件 → 4個, 100件 → 15個, 400件 → 15個（上限）
+- この上限を超えてフォルダを提案しないこと
+
+【フォルダ名の命名規則】
+- **フォルダ名は原則として日本語で付けてください**
+- アルファベットや英単語の使用は最低限にしてください
+- 例: ❌「Programming」「Web Design」 → ⭕「プログラミング」「ウェブデザイン」
+- 例: ❌「Python」「JavaScript」 → ⭕「Python学習」「JavaScript開発」（技術名は許容）
+
+【重要】フォルダとタグの使い分け
+- **フォルダ**: 大分類・カテゴリ（例: 仕事、趣味、プロジェクト名、テーマ別）
+  - 主要な分類軸となるカテゴリ
+  - ブックマークの所属先（1つのフォルダに所属）
+  - **階層構造で整理可能**（親フォルダ/子フォルダの関係）
+- **タグ**: コンテンツの特徴・属性を表すキーワード
+  - 横断的な分類（複数のフォルダにまたがる特徴）
+  - 検索・フィルタリング用
+
+【最重要原則：MECE（Mutually Exclusive, Collectively Exhaustive）】
+- **Mutually Exclusive（相互排他的）**: フォルダ間に重複・ダブりがないこと
+  - 同じブックマークが複数のフォルダに該当するような曖昧な分類は避ける
+  - 各フォルダの定義が明確で、境界が重ならないこと
+  - 類似した意味のフォルダは統合すること
+- **Collectively Exhaustive（網羅的）**: 全てのブックマークが適切なフォルダに分類できること
+  - 抜け漏れがなく、全てのブックマークがどこかのフォルダに所属できる
+  - 「その他」「未分類」を最小限に抑える
+
+【適切な粒度の原則】
+**ブックマーク数に対してフォルダを細分化しすぎないこと**
+- ブックマーク総数を常に意識する
+- **1フォルダあたり最低5〜10件のブックマーク**が入る粒度を目安にする
+- 目安：
+  * ブックマーク50件未満 → フォルダは5〜8個程度（第1階層のみ、または浅い階層）
+  * ブックマーク50〜200件 → フォルダは10〜15個程度（第2階層まで）
+  * ブックマーク200件以上 → フォルダは15〜25個程度（第3階層まで可）
+- **細かすぎる分類は避ける**：1〜2個のブックマークしか入らないフォルダは作らない
+- **粒度を揃える**：同じ階層のフォルダは同程度の粒度・規模にする
+
+【分析指示】
+現在のフォルダ一覧を見て、必ず以下の3つを提案してください：
+
+1. **新規・階層構造の提案（必須）**
+   - **【最重要】階層化できるものは必ず親フォルダとサブフォルダに構造化**
+   - **【最重要】同じ名前のフォルダは絶対に重複作成しない**
+     * ❌ 悪い例: トップレベル「旅行」とサブ「生活/旅行」の両方を提案
+     * ✅ 良い例: 「生活/旅行」のみを提案（トップレベルに「旅行」は作らない）
+     * ❌ 悪い例: 「エンタメ/ゲーム」を2回提案
+     * ✅ 良い例: 「エンタメ/ゲーム」を1回だけ提案
+   - **【最重要】提案する全フォルダを確認し、同じ名前が複数ないことを確認**
+   - **ブックマーク総数に対して適切な粒度で提案**
+   - フォルダを細分化しすぎないこと（1フォルダあたり最低5〜10件を目安）
+   - 第1階層だけでなく、**第2階層、第3階層のフォルダも積極的に提案**してください
+     * ただし、ブックマーク数が少ない場合は階層を浅くする
+   - **【重要】現在フラット構造のフォルダを分析し、関連性のあるものは親子関係で階層化**
+     * 例: 「AI」「機械学習」「データサイエンス」→親「テクノロジー」の下に配置
+     * 例: 「旅行」「宿泊」「観光」→親「トラベル」の下に配置
+     * 例: 単独の「料理」→親「生活」の下にサブフォルダ「料理・レシピ」として配置
+   - 親子関係を活用した階層構造を作成してください
+   - 例: 親「プログラミング」→子「Python」「JavaScript」「Web開発」
+   - **重要：フォルダ名には親フォルダ名を含めないこと**
+     * 良い例: 親「プログラミング」、子「Python」
+     * 悪い例: 親「プログラミング」、子「プログラミング/Python」
+   - **MECE原則を遵守**：各フォルダの定義が明確で、重複しないこと
+   - **1〜2個のブックマークしか入らないフォルダは提案しない**
+   - **【必須】トップレベルに単独で存在するフォルダを減らし、より大きなカテゴリの下に配置**
+
+2. **フォルダ統合（必須：類似・重複フォルダを必ず探して提案）**
+   - **MECEの「相互排他的」を実現するため、重複・ダブりを徹底排除**
+   - **【最重要】類似・重複フォルダは統合ではなく削除推奨に含めてください**
+   - **【重要】「その他」「Others」などの曖昧フォルダは統合ではなく削除してください（MECE違反のため）**
+   - **現在のフォルダ一覧を注意深く見て、類似・重複しているフォルダを必ず見つけ出す**
+   - 第1階層だけでなく、**第2階層以降の子フォルダも必ずチェック**
+   - 統合すべきパターン（MECE違反）：
+     * 同じカテゴリの複数フォルダ（例: 「レシピ」「料理」「クッキング」→1つに統合、残りは削除推奨）
+     * 異なる親の下に同じ子フォルダ（例: 「A/Web」「B/Web」→「開発/Web」に統合）
+     * 表記違い（例: 「AI」「人工知能」→どちらか1つに統合して、もう1つは削除）
+     * 範囲重複（例: 「Web開発」「フロントエンド」「React」→「Web開発」に統合）
+   - **【重要】「未分類」フォルダは統合対象から除外してください**
+   - **統合提案は2個以上のフォルダをまとめる場合のみ**
+   - **類似フォルダは統合ではなく、削除推奨として提案してください**
+
+3. **削除推奨（必須：不要フォルダを必ず探して提案）**
+   - **【超重要】削除推奨フォルダは必ず現在のフォルダ一覧（current_folders）に存在するものから選んでください**
+   - **現在存在しないフォルダを削除推奨に含めないでください**
+   - **全階層（第1層、第2層、第3層以降）で不要なフォルダを必ず見つけ出す**
+   - **細分化しすぎているフォルダを積極的に削除**（ブックマーク数に対して粒度が細かすぎる）
+   - **【最重要】類似・重複フォルダを削除対象として優先的に提案**
+     * **【必須】「その他」「Others」などの曖昧なフォルダ（最優先で削除）**
+     * **【必須】親フォルダとサブフォルダで重複する名前（例: 「技術」の下に「技術関連」サブフォルダ）**
+     * **【必須】同じ階層で意味が重複（例: 「その他」と「雑多」、「メモ」と「ノート」）**
+     * 意味が近いフォルダ（例: 「開発」「プログラミング」「コーディング」）
+     * 表記違い（例: 「AI」「人工知能」、「Web」「ウェブ」）
+     * 英語・日本語の違い（例: 「Technology」「テクノロジー」）
+     * カテゴリが重複（例: 「料理」「レシピ」「クッキング」）
+     * 範囲が重複（例: 「Web開発」と「フロントエンド」が別々に存在）
+     * **【重要】サブフォルダ同士でも重複チェック（例: 親A/サブX、親B/サブXのように異なる親の下に同じ名前）**
+   - 削除すべきパターン：
+     * **【最優先】「その他」「Others」などの曖昧フォルダ（MECE違反のため必ず削除）**
+     * **【最優先】類似・重複フォルダ（意味・表記・階層の重複すべて含む）**
+     * 1〜2個のブックマークにしか使われていないフォルダ（必ず削除）
+     * ほとんど使われていないフォルダ（3〜4個以下）
+     * 曖昧すぎるフォルダ（例: 「メモ」「資料」「雑多」）→MECE違反
+     * 統合後に不要になるフォルダ
+     * 定義が不明確で分類しづらいフォルダ
+     * 他のフォルダと統合できる細かすぎるフォルダ
+   - **【重要】「未分類」フォルダは削除対象から除外してください**
+   - **類似フォルダが見つからない場合でも、最低2〜3件は削除候補を出してください**
+
+【回答形式】
+JSON形式で以下の構造で返してください。overall_reasoningは100字以内で簡潔に：
+
+{
+  "suggested_folders": [
+    {
+      "name": "フォルダ名（親フォルダ名を含めない！）",
+      "description": "このフォルダの用途説明（30字以内）",
+      "reasoning": "なぜこのフォルダが必要か（50字以内）",
+      "parent": "親フォルダ名（トップレベルの場合は空文字\\"\\"）",
+      "merge_from": ["統合元のフォルダ1", "統合元のフォルダ2"]
+    }
+  ],
+  "folders_to_remove": ["削除推奨フォルダ1", "削除推奨フォルダ2"],
+  "overall_reasoning": "全体的な分析結果と改善方針の説明（100字以内）"
+}
+
+【重要な注意事項】
+- **【階層化】フラット構造を避け、関連するフォルダは必ず親子関係で整理**
+  - 単独で存在するトップレベルフォルダを減らす
+  - 関連性のあるフォルダは共通の親フォルダの下にまとめる
+  - 例: 「料理」「レシピ」→親「生活」の下に「料理・レシピ」として配置
+  - 例: 「AI」「機械学習」→親「テクノロジー」の下に配置
+- **【粒度】ブックマーク総数に対して適切な数・粒度のフォルダを提案**
+  - フォルダを細分化しすぎない（1フォルダあたり最低5〜10件を目安）
+  - 1〜2個のブックマークしか入らないフォルダは提案しない
+- **【最重要】nameには親フォルダ名を含めないこと**
+  - 良い例: {"name": "Python", "parent": "プログラミング"}
+  - 悪い例: {"name": "プログラミング/Python", "parent": "プログラミング"}
+- **MECE原則を徹底**
+  - Mutually Exclusive: フォルダ間に重複・ダブりがないこと
+  - Collectively Exhaustive: 全てのブックマークが適切に分類できること
+- **suggested_foldersには必ず5件以上提案してください**（新規フォルダ＋統合フォルダの合計）
+  - **第2階層、第3階層のフォルダも積極的に含める**（第1階層だけでなく）
+  - ただし、ブックマーク数が少ない場合は階層を浅く、数を減らす
+- **folders_to_removeには必ず2件以上提案してください**（不要・重複フォルダ）
+  - 特に細分化しすぎているフォルダを削除対象にする
+- parentで親フォルダを指定（階層構造）。**トップレベルの場合は空文字""**
+- **【超重要】nameには親フォルダ名を絶対に含めないこと**（例: ❌"プログラミング/Python" → ⭕"Python"）
+- merge_fromは統合時のみ使用（新規は空配列[]）。**2個以上のフォルダを含めること**
+- MECE原則を徹底し、重複のない明確なフォルダ構成を提案""",
+    sections=[
+        ("ブックマーク数", "【ブックマーク数】{bookmark_count}件"),
+        ("フォルダ一覧", "【現在のフォルダ一覧】（全{folder_count}個）\n{folders}"),
+        ("ブックマーク", "{bookmarks}"),
+    ],
+)
+
+
+# ===== フォルダ構成の最終調整（ローカル検証で決められない点が残った場合） =====
+
+REVIEW_FOLDERS = PromptTemplate(
+    "review-folder-structure",
+    system="あなたは情報整理の専門家です。フォルダ構成を俯瞰的にレビューし、重複・類似・MECE違反がないか最終チェックを行ってください。【最重要1】トップレベルフォルダと同名のサブフォルダは100%削除対象です（例: トップレベル「旅行」とサブ「生活/旅行」が両方存在する場合、必ずどちらかを削除）。【最重要2】異なる親フォルダのサブフォルダ間でも重複をチェックしてください（例: 「生活/料理」と「趣味/料理」は重複なので統合）。【超重要】suggested_foldersは必ず辞書の配列で返してください（フォルダ名だけの文字列配列は絶対に不可）。各フォルダは{name, description, reasoning, parent, merge_from}の完全な形式で返してください。必ずJSON形式で回答してください。",
+    instructions="""末尾は第1段階で提案されたフォルダ構成です。全体を俯瞰して最終調整を行ってください。
+【サブフォルダ一覧】で同じ名前のサブフォルダが異なる親の下にないか必ず確認し、
+【自動チェックで判断できなかった点】は特に注意して確認してください。
+
+【最終チェック項目】
+1. **重複・類似チェック（全階層で徹底）**: 提案フォルダ内に類似名称や重複がないか
+   - **【最重要】トップレベルフォルダと同名のサブフォルダは削除**
+     * 例: トップレベル「旅行」とサブ「生活/旅行」→どちらか一方を削除（重複）
+     * 例: トップレベル「料理」とサブ「生活/料理」→どちらか一方を削除（重複）
+     * 例: トップレベル「AI」とサブ「技術/AI」→どちらか一方を削除（重複）
+     * **このパターンは100%削除対象！必ずチェックして削除してください**
+   - **【最重要】異なる親フォルダのサブフォルダ間でも重複チェック**
+     * 例: 「フォルダA/Web」と「フォルダB/Web」→どちらか一方の親に統合
+     * 例: 「生活/料理」と「趣味/料理」→意味的に重複しているので統合
+     * 例: 「技術/AI」と「仕事/AI」→用途が異なるか確認し、重複なら統合
+   - 同じ階層での重複
+     * 例: 「Web」と「ウェブ」、「AI」と「人工知能」など
+   - **全てのサブフォルダを網羅的にチェックし、重複があれば必ず統合または削除**
+   - 見つかった場合は1つに統合し、もう一方を削除推奨に追加
+
+2. **階層構造の妥当性**: 親子関係が論理的か
+   - 不自然な階層（例: 「技術/料理」のような関連性のない組み合わせ）
+   - トップレベルに単独で存在すべきでないフォルダ
+
+3. **MECE原則の再確認**: 相互排他的かつ網羅的か
+   - フォルダ間の境界が明確か
+   - 「その他」「未分類」以外の曖昧なフォルダがないか
+   - サブフォルダ間でも相互排他性を確認
+   - **トップレベルとサブフォルダで同名がないか再確認**
+
+4. **削除推奨の妥当性**: 削除推奨フォルダが適切か
+   - 「その他」「Others」などの曖昧フォルダが含まれているか
+   - 不要なフォルダが削除推奨に含まれているか
+   - サブフォルダの重複も削除推奨に含める
+   - **トップレベルとサブで同名の場合、必ずどちらかを削除推奨に含める**
+
+【重要】
+- suggested_foldersは必ず以下の形式の辞書の配列で返してください：
+  {"name": "文字列", "description": "文字列", "reasoning": "文字列", "parent": "文字列", "merge_from": ["配列"]}
+- フォルダ名だけの配列は不可！必ず完全な辞書形式で！
+
+【回答形式】
+元の提案に問題がなければ、元のデータをそのまま返してください（needs_adjustment: false）。
+調整が必要な場合は、修正後の構成を以下のJSON形式で返してください：
+
+{
+  "needs_adjustment": true/false,
+  "suggested_folders": [
+    {"name": "フォルダ名", "description": "説明", "reasoning": "理由", "parent": "親フォルダ名", "merge_from": []},
+    ...
+  ],
+  "folders_to_remove": ["削除1", "削除2"],
+  "overall_reasoning": "修正後の全体説明（100字以内）"
+}""",
+    sections=[
+        ("提案JSON", "【元のJSON形式のデータ】\n```json\n{data}\n```"),
+        ("階層表示", "【提案されたフォルダ構成】（階層表示）\n{hierarchy}"),
+        ("サブフォルダ", "【サブフォルダ一覧】（重複チェック用）\n{subfolders}"),
+        ("削除推奨", "【削除推奨フォルダ】\n{folders_to_remove}"),
+        ("未解決点", "【自動チェックで判断できなかった点】\n{ambiguities}"),
+    ],
+)
+
+
+# ===== フォルダ一括割り当て =====
+
+ASSIGN_FOLDERS = PromptTemplate(
+    "bulk-assign-folders",
+    system="あなたはブックマーク整理の専門家です。各ブックマークの内容を分析し、最も適切なフォルダに分類してください。階層の深いフォルダ（第2階層、第3階層）を積極的に使用して、より詳細で整理された分類を行ってください。【超重要】「未分類」は極力避け、少しでも関連性があればそのフォルダに割り当ててください。どうしても全く関連性がない場合のみ「未分類」を選んでください。必ずJSON形式で回答してください。",
+    instructions="""あなたはブックマーク管理アシスタントです。
+末尾の【ブックマーク一覧】の各ブックマークを分析し、【利用可能なフォルダリスト】から最も適切なフォルダを1つずつ選んでください。
+
+【重要】フォルダとタグの使い分け
+- **フォルダ**: 大分類・カテゴリ（例: 仕事、趣味、プロジェクト名、テーマ別）
+  - ブックマークの主要な分類軸
+  - 1つのブックマークは1つのフォルダに所属
+  - **階層構造を持つフォルダが利用可能**（例: 「プログラミング / Python」「開発 / Web開発」）
+- **タグ**: コンテンツの特徴・属性を表すキーワード
+  - 横断的な分類（複数のフォルダにまたがる特徴）
+
+【重要な選択ルール】
+1. **最も深い階層のフォルダを優先的に選択してください**
+   - ❌ 悪い例: 「プログラミング」（浅すぎる）
+   - ✅ 良い例: 「プログラミング / Python / Django」（具体的）
+   - ✅ 良い例: 「開発 / Web開発 / フロントエンド」（具体的）
+
+2. **階層が深いフォルダが複数ある場合は、最も適切なものを選ぶ**
+   - 利用可能なフォルダをよく見て、「/」が含まれる深い階層のフォルダを積極的に使用
+
+3. **第1階層（親フォルダのみ）は極力避ける**
+   - 第2階層、第3階層がある場合は、そちらを優先
+
+【指示】
+1. 各ブックマークの内容を詳しく分析してください
+2. 利用可能なフォルダリストから、**最も深い階層で最も具体的なフォルダ**を選んでください
+3. ブックマークの**主要なテーマ・カテゴリ**に基づいて判断してください
+4. **【超重要】「未分類」は極力避けてください**
+   - 必ず利用可能なフォルダの中から最も近い・関連するものを選んでください
+   - 完全一致でなくても、少しでも関連性があればそのフォルダに割り当ててください
+   - どうしても全く関連性がない場合のみ「未分類」を選んでください（最終手段）
+5. **フォルダ名は利用可能なフォルダリストから完全一致で選ぶこと**（階層構造も含めて）
+6. **全てのブックマークに対して提案してください**（現在のフォルダと同じでも構いません）
+7. 以下のJSON形式で回答してください（他の説明は不要）：
+
+{
+  "assignments": [
+    {
+      "bookmark_id": "ブックマークID",
+      "suggested_folder": "提案するフォルダ名",
+      "reasoning": "選択理由（20字以内）"
+    }
+  ]
+}
+
+注意：
+- **全てのブックマークに対して提案すること**
+- **suggested_folderは階層構造を含む完全なパスで指定**（例: 「プログラミング / Python」）
+- suggested_folderは必ず利用可能なフォルダリストから完全一致で選ぶこと
+- **【超重要】「未分類」は極力避けること**。少しでも関連性があればそのフォルダを選ぶこと
+- **第2階層、第3階層のフォルダを積極的に使用すること**（より詳細な分類）
+- reasoningは簡潔に（例: 「Python学習コンテンツ」「Webデザイン参考」）
+- 日本語で回答してください""",
+    sections=[
+        ("フォルダ一覧", "【利用可能なフォルダリスト】（階層構造を含む）\n{folders}"),
+        ("ブックマーク", "【ブックマーク一覧】（全{count}件）\n{bookmarks}"),
+    ],
+)
+
+
+TEMPLATES = [SUGGEST_TAGS, SUGGEST_TAGS_WITH_CURRENT, BATCH_TAGS, ANALYZE_TAGS, ANALYZE_FOLDERS, REVIEW_FOLDERS, ASSIGN_FOLDERS]
+
+
+def stats() -> Dict[str, int]:
+    """テンプレートごとの固定部分（キャッシュ対象の先頭）のトークン数"""
+    return {template.name: sum(template.static_tokens.values()) for template in TEMPLATES}
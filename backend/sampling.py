@@ -0,0 +1,145 @@
+"""
+構成分析用のブックマークの代表サンプル
+
+先頭から切り出す（クライアントの並び順に依存する）代わりに、決まった件数を
+現在のタグ・フォルダで層別して選ぶ。
+- 層: そのブックマークのタグのうち全体で最も使用数の少ないもの
+  （少数派のタグも層として現れ、層の数だけ異なるタグがサンプルに入る）
+- 割り当て: 層の大きさの平方根に比例（大きな層に偏りすぎず、小さな層も拾う）。端数は最大剰余法
+- 層の中: ベクトルがあれば farthest-point sampling で互いに似ていないものを、
+  なければフォルダ順に並べて等間隔で選ぶ（フォルダによる暗黙の層別）
+
+タグの使用数は全件に対して1回の走査で正確に数える。
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+UNTAGGED = "（タグなし）"
+
+
+def tag_usage(bookmarks: Sequence[dict], field: str = "current_tags") -> Counter:
+    """全ブックマークのタグごとの使用数（1回の走査）"""
+    counts = Counter()
+    for bookmark in bookmarks:
+        counts.update(set(bookmark.get(field) or ()))
+    return counts
+
+
+def _strata(bookmarks: Sequence[dict], usage: Counter, folder_field: str, tag_field: str) -> Tuple[np.ndarray, np.ndarray]:
+    """各ブックマークの層の番号とフォルダの番号"""
+    # 使用数の少ない順の順位（同数ならタグ名順）
+    rank = {tag: i for i, (tag, _) in enumerate(sorted(usage.items(), key=lambda item: (item[1], item[0])))}
+    tag_numbers: Dict[str, int] = {}
+    folder_numbers: Dict[str, int] = {}
+    strata = np.empty(len(bookmarks), dtype=np.int64)
+    folders = np.empty(len(bookmarks), dtype=np.int64)
+    for i, bookmark in enumerate(bookmarks):
+        tags = bookmark.get(tag_field)
+        primary = min(tags, key=rank.__getitem__) if tags else UNTAGGED
+        strata[i] = tag_numbers.setdefault(primary, len(tag_numbers))
+        folders[i] = folder_numbers.setdefault(bookmark.get(folder_field) or "", len(folder_numbers))
+    return strata, folders
+
+
+def allocate(sizes: np.ndarray, budget: int) -> np.ndarray:
+    """
+    budget 件を層に割り当てる（平方根比例・最大剰余法・層の大きさが上限）
+    層の数が budget より多い場合は大きい層から1件ずつ
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    budget = int(min(budget, sizes.sum()))
+    allocation = np.zeros(len(sizes), dtype=np.int64)
+    if budget <= 0:
+        return allocation
+    if len(sizes) >= budget:
+        allocation[np.argsort(-sizes, kind="stable")[:budget]] = 1
+        return allocation
+
+    # 各層に最低1件を割り当て、残りを平方根比例で配る（上限に達した層の分は他の層に回す）
+    allocation[:] = 1
+    remaining = budget - len(sizes)
+    while remaining > 0:
+        open_strata = allocation < sizes
+        weights = np.where(open_strata, np.sqrt(sizes), 0.0)
+        quota = weights / weights.sum() * remaining
+        extra = np.minimum(np.floor(quota).astype(np.int64), sizes - allocation)
+        leftover = remaining - extra.sum()
+        if leftover > 0:
+            remainder = np.where(open_strata & (allocation + extra < sizes), quota - np.floor(quota), -1.0)
+            for index in np.argsort(-remainder, kind="stable")[:leftover]:
+                if remainder[index] < 0:
+                    break
+                extra[index] += 1
+        if extra.sum() == 0:
+            break
+        allocation += extra
+        remaining -= int(extra.sum())
+    return allocation
+
+
+def farthest_points(vectors: np.ndarray, k: int) -> List[int]:
+    """重心に最も近い1件から始め、選んだものから最も遠いものを順に選ぶ"""
+    centroid = vectors.mean(axis=0)
+    chosen = [int(np.argmax(vectors @ centroid))]
+    closest = vectors @ vectors[chosen[0]]
+    for _ in range(k - 1):
+        closest[chosen] = np.inf
+        index = int(np.argmin(closest))
+        chosen.append(index)
+        closest = np.maximum(closest, vectors @ vectors[index])
+    return chosen
+
+
+def stratified_sample(
+    bookmarks: Sequence[dict],
+    budget: int,
+    *,
+    vectors: Optional[np.ndarray] = None,
+    usage: Optional[Counter] = None,
+    folder_field: str = "current_folder",
+    tag_field: str = "current_tags",
+) -> List[int]:
+    """
+    層別した代表サンプルの番号（元の並び順）を返す
+    vectors: 各ブックマークの正規化済みベクトル（層の中で多様なものを選ぶのに使う）
+    """
+    n = len(bookmarks)
+    if n <= budget:
+        return list(range(n))
+    if usage is None:
+        usage = tag_usage(bookmarks, tag_field)
+
+    strata, folders = _strata(bookmarks, usage, folder_field, tag_field)
+    # 層の順、層の中はフォルダ順
+    order = np.lexsort((folders, strata))
+    sizes = np.bincount(strata)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    allocation = allocate(sizes, budget)
+
+    chosen = []
+    for stratum in np.flatnonzero(allocation):
+        members = order[starts[stratum]:starts[stratum] + sizes[stratum]]
+        k = int(allocation[stratum])
+        if k >= len(members):
+            chosen.extend(members.tolist())
+        elif vectors is not None:
+            chosen.extend(members[farthest_points(vectors[members], k)].tolist())
+        else:
+            # フォルダ順に並んだ層全体から等間隔で選ぶ（並び順の偏りを避け、フォルダにも散らばる）
+            positions = ((np.arange(k) + 0.5) * len(members) / k).astype(np.int64)
+            chosen.extend(members[positions].tolist())
+    return sorted(chosen)
+
+
+def format_usage(usage: Counter, vocabulary: Sequence[str], *, limit: int = 300) -> str:
+    """タグの使用数をプロンプト用のテキストにする（既存タグは使用数0も含め、多い順）"""
+    counts = {tag: usage.get(tag, 0) for tag in vocabulary}
+    for tag, count in usage.items():
+        counts.setdefault(tag, count)
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    text = ", ".join(f"{tag}({count})" for tag, count in ranked[:limit])
+    if len(ranked) > limit:
+        text += f" ほか{len(ranked) - limit}個"
+    return text
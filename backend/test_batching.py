@@ -0,0 +1,41 @@
+"""
+batching.py のテスト（トークン予算と件数の上限によるバッチ分割）
+
+実行: python -m unittest test_batching
+"""
+import unittest
+
+from batching import pack_by_token_budget
+
+
+def pack(sizes, *, fixed_tokens=10, budget=100, max_items=10):
+    return pack_by_token_budget(sizes, lambda size: size, fixed_tokens=fixed_tokens, budget=budget, max_items=max_items)
+
+
+class PackByTokenBudgetTest(unittest.TestCase):
+    def test_budget_includes_fixed_tokens(self):
+        # 10 + 30 + 30 + 30 = 100 は予算内、次の1件で超える
+        self.assertEqual(pack([30, 30, 30, 30]), [[30, 30, 30], [30]])
+
+    def test_max_items(self):
+        self.assertEqual(pack([1] * 5, max_items=2), [[1, 1], [1, 1], [1]])
+
+    def test_oversized_item_gets_its_own_batch(self):
+        self.assertEqual(pack([20, 500, 20]), [[20], [500], [20]])
+        self.assertEqual(pack([500]), [[500]])
+
+    def test_fixed_tokens_over_budget(self):
+        # 共通部分だけで予算を超える場合も1件ずつは処理する
+        self.assertEqual(pack([1, 1], fixed_tokens=200), [[1], [1]])
+
+    def test_order_and_empty(self):
+        items = list(range(1, 30))
+        batches = pack(items)
+        self.assertEqual([item for batch in batches for item in batch], items)
+        for batch in batches:
+            self.assertTrue(len(batch) == 1 or 10 + sum(batch) <= 100, batch)
+        self.assertEqual(pack([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+cache.py のテスト（キーの正規化・TTL・上限による削除・まとめた読み書き）
+
+実行: python -m unittest test_cache
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import cache
+
+
+class MakeKeyTest(unittest.TestCase):
+    def test_normalization(self):
+        a = cache.make_key(title="  Python　入門 ", tags=["b", "a", "a"])
+        b = cache.make_key(title="Python 入門", tags=["a", "b"])
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, cache.make_key(title="Python 入門", tags=["a"]))
+        # 全角英数字は半角と同じ
+        self.assertEqual(cache.make_key(title="ＡＩ"), cache.make_key(title="AI"))
+
+
+class CacheBehaviorMixin:
+    """InMemoryCache と SQLiteCache で共通の振る舞い"""
+
+    def create(self, *, ttl_seconds=60, max_entries=100):
+        raise NotImplementedError
+
+    def test_get_set_and_stats(self):
+        c = self.create()
+        self.assertIsNone(c.get("a"))
+        c.set("a", {"tags": ["x"]})
+        self.assertEqual(c.get("a"), {"tags": ["x"]})
+        self.assertEqual(c.stats()["hits"], 1)
+        self.assertEqual(c.stats()["misses"], 1)
+        self.assertEqual(c.stats()["entries"], 1)
+
+    def test_get_many_and_set_many(self):
+        c = self.create()
+        c.set_many({"a": 1, "b": 2, "c": 3})
+        self.assertEqual(c.get_many(["a", "c", "missing", "a"]), {"a": 1, "c": 3})
+        self.assertEqual((c.hits, c.misses), (2, 1))
+        self.assertEqual(c.get_many([]), {})
+
+    def test_ttl(self):
+        c = self.create(ttl_seconds=10)
+        with mock.patch("cache.time.time", return_value=1000.0):
+            c.set("a", 1)
+        with mock.patch("cache.time.time", return_value=1005.0):
+            self.assertEqual(c.get("a"), 1)
+        with mock.patch("cache.time.time", return_value=1011.0):
+            self.assertIsNone(c.get("a"))
+        self.assertEqual(len(c), 0)
+
+    def test_async_api(self):
+        c = self.create()
+
+        async def run():
+            await c.aset("a", [1])
+            await c.aset_many({"b": [2]})
+            return await c.aget("a"), await c.aget_many(["a", "b", "c"])
+
+        self.assertEqual(asyncio.run(run()), ([1], {"a": [1], "b": [2]}))
+
+
+class InMemoryCacheTest(CacheBehaviorMixin, unittest.TestCase):
+    def create(self, *, ttl_seconds=60, max_entries=100):
+        return cache.InMemoryCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+    def test_lru_eviction(self):
+        c = self.create(max_entries=2)
+        c.set("a", 1)
+        c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        self.assertEqual(c.get_many(["a", "b", "c"]), {"a": 1, "c": 3})
+
+
+class SQLiteCacheTest(CacheBehaviorMixin, unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def create(self, *, ttl_seconds=60, max_entries=100, table="cache"):
+        c = cache.SQLiteCache(self.path, ttl_seconds=ttl_seconds, max_entries=max_entries, table=table)
+        self.addCleanup(c._conn.close)
+        return c
+
+    def test_eviction_in_batches_keeps_recently_used(self):
+        c = self.create(max_entries=10)
+        with mock.patch("cache.time.time", return_value=1000.0):
+            c.set_many({f"old{i}": i for i in range(5)})
+        with mock.patch("cache.time.time", return_value=1001.0):
+            c.set_many({f"new{i}": i for i in range(5)})
+        with mock.patch("cache.time.time", return_value=1002.0):
+            self.assertEqual(c.get("old0"), 0)  # 最近使われたものは残る
+            self.assertEqual(len(c), 10)
+            c.set("extra", 1)
+            # 上限を超えたら EVICT_RATIO 分を余分に削除する
+            self.assertEqual(len(c), 9)
+            remaining = c.get_many([f"old{i}" for i in range(5)] + [f"new{i}" for i in range(5)] + ["extra"])
+        self.assertIn("old0", remaining)
+        self.assertIn("extra", remaining)
+        self.assertNotIn("old1", remaining)
+        self.assertNotIn("old2", remaining)
+
+    def test_replacing_a_key_does_not_evict(self):
+        c = self.create(max_entries=3)
+        c.set_many({"a": 1, "b": 2, "c": 3})
+        for value in range(10):
+            c.set("a", value)
+        self.assertEqual(c.get_many(["a", "b", "c"]), {"a": 9, "b": 2, "c": 3})
+
+    def test_count_survives_reopen(self):
+        c = self.create(max_entries=5)
+        c.set_many({f"k{i}": i for i in range(5)})
+        reopened = self.create(max_entries=5)
+        reopened.set("k5", 5)
+        self.assertLessEqual(len(reopened), 5)
+
+    def test_tables_share_a_file(self):
+        a = self.create(table="first")
+        b = self.create(table="second")
+        a.set("k", 1)
+        self.assertIsNone(b.get("k"))
+        with self.assertRaises(ValueError):
+            self.create(table="bad name")
+
+    def test_many_keys(self):
+        c = self.create(max_entries=5000)
+        c.set_many({f"k{i}": i for i in range(1200)})
+        self.assertEqual(len(c.get_many(f"k{i}" for i in range(1300))), 1200)
+
+    def test_async_api_runs_off_the_event_loop(self):
+        c = self.create()
+        threads = []
+        original = c._set_many
+
+        def record(items, now):
+            threads.append(threading.get_ident())
+            original(items, now)
+
+        c._set_many = record
+        asyncio.run(c.aset("a", 1))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+class CreateCacheTest(unittest.TestCase):
+    def test_backends(self):
+        self.assertIsInstance(cache.create_cache("memory", "", ttl_seconds=1, max_entries=1), cache.InMemoryCache)
+        self.assertIsNone(cache.create_cache("off", "", ttl_seconds=1, max_entries=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
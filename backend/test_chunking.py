@@ -0,0 +1,161 @@
+"""
+chunking.py のテスト（再試行・チャンクの縮小・失敗の報告・途中結果の確定）
+
+実行: python -m unittest test_chunking
+"""
+import asyncio
+import unittest
+
+from chunking import ChunkError, iter_chunked
+
+ITEMS = [{"id": str(i)} for i in range(6)]
+
+
+def split(size):
+    """試行ごとにチャンクを半分にする"""
+    def plan(items, attempt):
+        step = max(1, size >> attempt)
+        return [list(items[i:i + step]) for i in range(0, len(items), step)]
+    return plan
+
+
+def run(process_chunk, *, items=ITEMS, plan_chunks=split(3), retries=2, timeout=1.0, on_round=None):
+    async def collect():
+        return [event async for event in iter_chunked(
+            items,
+            item_id=lambda item: item["id"],
+            plan_chunks=plan_chunks,
+            process_chunk=process_chunk,
+            concurrency=2,
+            timeout=timeout,
+            retries=retries,
+            on_round=on_round,
+        )]
+    return asyncio.run(collect())
+
+
+def results_of(events):
+    merged = {}
+    for kind, value in events:
+        if kind == "results":
+            merged.update(value)
+    return merged
+
+
+class IterChunkedTest(unittest.TestCase):
+    def test_all_items_in_one_round(self):
+        rounds = []
+
+        async def process(chunk, emit):
+            return {item["id"]: int(item["id"]) * 10 for item in chunk}, {"tokens": len(chunk)}
+
+        events = run(process, on_round=lambda *args: rounds.append(args))
+        self.assertEqual(results_of(events), {str(i): i * 10 for i in range(6)})
+        self.assertEqual(sorted(value["tokens"] for kind, value in events if kind == "usage"), [3, 3])
+        self.assertEqual(rounds, [(0, 6, 2)])
+        self.assertFalse([event for event in events if event[0] == "failed_chunk"])
+
+    def test_missing_items_are_retried_in_smaller_chunks(self):
+        chunk_sizes = []
+
+        async def process(chunk, emit):
+            chunk_sizes.append(len(chunk))
+            # 最初の試行では各チャンクの最後の1件が応答に含まれない
+            answered = chunk if len(chunk) < 3 else chunk[:-1]
+            return {item["id"]: True for item in answered}, None
+
+        events = run(process)
+        self.assertEqual(set(results_of(events)), {item["id"] for item in ITEMS})
+        # 1回目は3件ずつ、2回目は欠けた2件だけを1件ずつ
+        self.assertEqual(chunk_sizes, [3, 3, 1, 1])
+
+    def test_failures_reported_by_original_chunk(self):
+        async def process(chunk, emit):
+            if any(item["id"] in ("1", "4") for item in chunk):
+                raise ChunkError("応答が壊れています", usage={"tokens": 1})
+            return {item["id"]: True for item in chunk}, None
+
+        events = run(process, retries=1)
+        self.assertEqual(set(results_of(events)), {"0", "2", "3", "5"})
+        failed = [value for kind, value in events if kind == "failed_chunk"]
+        self.assertEqual(failed, [
+            {"chunk_index": 0, "bookmark_ids": ["1"], "reason": "応答が壊れています"},
+            {"chunk_index": 1, "bookmark_ids": ["4"], "reason": "応答が壊れています"},
+        ])
+        # 失敗したチャンクのトークン数も集計される（1回目 2チャンク + 2回目 2チャンク）
+        self.assertEqual(len([kind for kind, _ in events if kind == "usage"]), 4)
+        # failed_chunk は最後にまとめて返す
+        self.assertEqual([kind for kind, _ in events][-2:], ["failed_chunk", "failed_chunk"])
+
+    def test_never_answered_items(self):
+        async def process(chunk, emit):
+            return {"unknown": True}, None  # チャンクにないIDは無視する
+
+        events = run(process, retries=0)
+        self.assertEqual(results_of(events), {})
+        failed = [value for kind, value in events if kind == "failed_chunk"]
+        self.assertEqual([value["bookmark_ids"] for value in failed], [["0", "1", "2"], ["3", "4", "5"]])
+        self.assertEqual(failed[0]["reason"], "AIの応答に含まれていませんでした")
+
+    def test_emitted_results_survive_timeout(self):
+        calls = []
+
+        async def process(chunk, emit):
+            calls.append([item["id"] for item in chunk])
+            emit({chunk[0]["id"]: "streamed"})
+            if len(chunk) > 1:
+                await asyncio.sleep(10)  # 残りを返す前にタイムアウト
+            return {item["id"]: "done" for item in chunk}, None
+
+        events = run(process, retries=1, timeout=0.05)
+        results = results_of(events)
+        self.assertEqual(results["0"], "streamed")
+        self.assertEqual(results["3"], "streamed")
+        # emit 済みのアイテムは再試行しない
+        self.assertTrue(all("0" not in ids and "3" not in ids for ids in calls[2:]))
+        self.assertEqual(set(results), {item["id"] for item in ITEMS})
+
+    def test_timeout_reason(self):
+        async def process(chunk, emit):
+            await asyncio.sleep(10)
+
+        events = run(process, retries=0, timeout=0.01)
+        failed = [value for kind, value in events if kind == "failed_chunk"]
+        self.assertTrue(failed)
+        self.assertTrue(all(value["reason"].startswith("タイムアウト") for value in failed))
+
+    def test_stopping_early_cancels_pending_chunks(self):
+        cancelled = []
+
+        async def process(chunk, emit):
+            if chunk[0]["id"] == "0":
+                return {item["id"]: True for item in chunk}, None
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(chunk[0]["id"])
+                raise
+            return {}, None
+
+        async def first_event():
+            events = iter_chunked(
+                ITEMS,
+                item_id=lambda item: item["id"],
+                plan_chunks=split(3),
+                process_chunk=process,
+                concurrency=2,
+                timeout=5,
+                retries=0,
+            )
+            event = await events.__anext__()
+            await events.aclose()
+            await asyncio.sleep(0)
+            return event
+
+        kind, value = asyncio.run(first_event())
+        self.assertEqual((kind, set(value)), ("results", {"0", "1", "2"}))
+        self.assertEqual(cancelled, ["3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+folder_tree.py のテスト（循環・同名フォルダ・統合・保護フォルダ）
+
+実行: python -m unittest test_folder_tree
+"""
+import unittest
+
+from folder_tree import FolderTree
+
+
+class FolderTreeCycleTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = FolderTree.from_folders([
+            {"name": "A", "parent": "B"},
+            {"name": "B", "parent": "A"},
+            {"name": "C", "parent": "C"},  # 自分自身が親
+            {"name": "X", "parent": ""},
+            {"name": "Y", "parent": "X"},
+            {"name": "Z", "parent": "B"},  # 循環の下にあるフォルダ
+        ])
+
+    def test_walk_visits_each_folder_once(self):
+        keys = [key for _, key in self.tree.walk()]
+        self.assertEqual(len(keys), len(self.tree))
+        self.assertEqual(set(keys), set(self.tree.nodes))
+        # ルートから辿れるものが先、循環しているものは後
+        self.assertEqual(keys[:2], [("", "X"), ("X", "Y")])
+
+    def test_render(self):
+        self.assertEqual(self.tree.render(), "X\n  ├─ Y\nA\n  ├─ B\n    ├─ Z\nC")
+
+    def test_cycle_keys(self):
+        self.assertEqual(self.tree.cycle_keys(), {("B", "A"), ("A", "B"), ("C", "C")})
+
+    def test_paths_stop_at_cycle(self):
+        paths = self.tree.paths()
+        self.assertEqual(paths[("X", "Y")], "X/Y")
+        self.assertEqual(paths[("C", "C")], "C")
+        self.assertEqual(paths[("B", "A")], "B/A")
+        self.assertEqual(paths[("A", "B")], "A/B")
+        self.assertEqual(paths[("B", "Z")], "A/B/Z")
+        # どのパスにも同じフォルダは2回現れない
+        for path in paths.values():
+            parts = path.split("/")
+            self.assertEqual(len(parts), len(set(parts)), path)
+        # 1件ずつ求めた場合と同じ
+        self.assertEqual(paths, {key: self.tree.path(key) for key in self.tree.nodes})
+
+
+class FolderTreeDuplicateTest(unittest.TestCase):
+    def test_same_name_under_different_parents(self):
+        tree = FolderTree.from_folders([
+            {"name": "Python", "parent": "仕事"},
+            {"name": "Python", "parent": "趣味"},
+            {"name": "仕事"},
+            {"name": "趣味"},
+            {"name": "Python", "parent": "仕事"},  # 完全な重複は1つにまとめる
+            {"name": "  ", "parent": "仕事"},  # 名前が空のものは除く
+        ])
+        self.assertEqual(len(tree), 4)
+        self.assertEqual(tree.by_name["Python"], [("仕事", "Python"), ("趣味", "Python")])
+        self.assertEqual(tree.paths(" / "), {
+            ("仕事", "Python"): "仕事 / Python",
+            ("趣味", "Python"): "趣味 / Python",
+            ("", "仕事"): "仕事",
+            ("", "趣味"): "趣味",
+        })
+
+    def test_missing_parent_is_kept_in_path(self):
+        tree = FolderTree.from_folders([{"name": "Python", "parent": "プログラミング"}])
+        self.assertEqual(tree.roots(), [("プログラミング", "Python")])
+        self.assertEqual(tree.path(("プログラミング", "Python")), "プログラミング/Python")
+
+
+class FolderDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.current = FolderTree.from_folders([
+            {"name": "料理"},
+            {"name": "レシピ"},
+            {"name": "生活"},
+            {"name": "未分類"},
+            {"name": "仕事"},
+            {"name": "Python", "parent": "仕事"},
+        ])
+
+    def test_merge_and_move_empty_source_folders(self):
+        suggested = FolderTree.from_folders([
+            {"name": "生活"},
+            {"name": "料理", "parent": "生活", "merge_from": ["料理", "レシピ"]},
+            {"name": "仕事"},
+            {"name": "Python", "parent": "仕事"},
+        ])
+        diff = suggested.diff(self.current, protected={"未分類"})
+
+        self.assertEqual(diff.new, [("生活", "料理")])
+        self.assertEqual(diff.existing, [("", "生活"), ("", "仕事"), ("仕事", "Python")])
+        # 統合・移動で空になる既存フォルダは削除側に入る。保護フォルダは入らない
+        self.assertEqual(diff.to_remove, [("", "料理"), ("", "レシピ")])
+        self.assertEqual(diff.moved, {("生活", "料理"): ("", "料理")})
+        self.assertEqual(diff.merges, {("生活", "料理"): [("", "料理"), ("", "レシピ")]})
+        self.assertEqual(diff.merge_plan(), {("", "料理"): ("生活", "料理"), ("", "レシピ"): ("生活", "料理")})
+        self.assertEqual(diff.removed_names(), ["料理", "レシピ"])
+
+        final = {(item["parent"], item["name"]): item for item in diff.final_structure()}
+        self.assertEqual(final[("生活", "料理")]["status"], "new")
+        self.assertEqual(final[("生活", "料理")]["moved_from"], "")
+        self.assertEqual(final[("", "レシピ")]["status"], "to_remove")
+        self.assertNotIn(("", "未分類"), final)
+
+    def test_merge_from_ignores_folders_that_are_kept(self):
+        suggested = FolderTree.from_folders([
+            {"name": "料理", "merge_from": ["料理", "レシピ", "生活"]},
+            {"name": "生活"},
+        ])
+        diff = suggested.diff(self.current, protected={"未分類"})
+        # 生活は提案に残るため統合元にしない
+        self.assertEqual(diff.merges, {("", "料理"): [("", "レシピ")]})
+
+    def test_protected_folders_are_never_removed(self):
+        diff = FolderTree.from_folders([]).diff(self.current, protected={"未分類"})
+        self.assertNotIn(("", "未分類"), diff.to_remove)
+        self.assertEqual(len(diff.to_remove), len(self.current) - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+jsonstream.py のテスト（途中で切れた応答・エスケープ・不正な要素）
+
+実行: python -m unittest test_jsonstream
+"""
+import unittest
+
+from jsonstream import JsonArrayStreamParser
+
+# 文字列中の括弧・エスケープした引用符・\u エスケープ・バックスラッシュを含み、3件目の途中で切れた応答
+TRUNCATED = (
+    '{"assignments": ['
+    '{"id": "1", "reasoning": "a \\"}\\" b ]"}, '
+    '{"id": "2", "reasoning": "\\u30c6\\\\"}, '
+    '{"id": "3", "reasoning": "trun'
+)
+
+
+def parse(chunks, key="assignments"):
+    parser = JsonArrayStreamParser(key)
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return parser, items
+
+
+class JsonArrayStreamParserTest(unittest.TestCase):
+    def test_truncated_response_keeps_completed_items(self):
+        parser, items = parse([TRUNCATED])
+        self.assertEqual(items, [
+            {"id": "1", "reasoning": 'a "}" b ]'},
+            {"id": "2", "reasoning": "テ\\"},
+        ])
+        self.assertEqual(parser.count, 2)
+        self.assertEqual(parser.invalid, 0)
+        self.assertFalse(parser.closed)
+
+    def test_one_character_at_a_time(self):
+        # エスケープや要素の区切りがチャンクの境目にあっても同じ結果になる
+        parser, items = parse(list(TRUNCATED))
+        self.assertEqual([item["id"] for item in items], ["1", "2"])
+        self.assertEqual(items[0]["reasoning"], 'a "}" b ]')
+        self.assertFalse(parser.closed)
+
+    def test_completing_truncated_item(self):
+        parser = JsonArrayStreamParser("assignments")
+        self.assertEqual(len(parser.feed(TRUNCATED)), 2)
+        self.assertEqual(parser.feed('cated"}]}'), [{"id": "3", "reasoning": "truncated"}])
+        self.assertTrue(parser.closed)
+        # 配列が閉じた後は何も返さない
+        self.assertEqual(parser.feed(', {"id": "4"}'), [])
+        self.assertEqual(parser.count, 3)
+
+    def test_invalid_and_non_object_items(self):
+        parser, items = parse(['{"assignments": [{"id": 1}, {"id": 2,, }, [1], 3, {"id": 4}]}'])
+        self.assertEqual(items, [{"id": 1}, {"id": 4}])
+        self.assertEqual(parser.count, 2)
+        self.assertEqual(parser.invalid, 1)
+        self.assertTrue(parser.closed)
+
+    def test_nested_objects(self):
+        _, items = parse(['{"assignments": [{"id": 1, "tags": [{"name": "a"}]}]}'])
+        self.assertEqual(items, [{"id": 1, "tags": [{"name": "a"}]}])
+
+    def test_key_inside_escaped_string_is_ignored(self):
+        _, items = parse(['{"note": "\\"assignments\\": [{\\"id\\": 0}]", ', '"assignments": [{"id": 1}]}'])
+        self.assertEqual(items, [{"id": 1}])
+
+    def test_key_split_across_chunks(self):
+        parser, items = parse(['{"assign', 'ments"', ' : [', '{"id": 1}', "]"])
+        self.assertEqual(items, [{"id": 1}])
+        self.assertTrue(parser.closed)
+
+    def test_no_array(self):
+        parser, items = parse(['{"other": [{"id": 1}]}'])
+        self.assertEqual(items, [])
+        self.assertEqual(parser.count, 0)
+        self.assertFalse(parser.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
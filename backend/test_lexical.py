@@ -0,0 +1,91 @@
+"""
+lexical.py のテスト（単語の途中での一致・1文字のタグ・英数字の境界・URL）
+
+実行: python -m unittest test_lexical
+"""
+import unittest
+
+import lexical
+
+
+def scores(tags, **fields):
+    return dict(lexical.score_tags(tags, **fields))
+
+
+class JapaneseMatchTest(unittest.TestCase):
+    def test_tags_inside_longer_words_are_not_confident(self):
+        tags = ["テスト", "本", "日本", "プログラミング", "日本語", "結果"]
+        scored = lexical.score_tags(tags, title="プログラミングコンテスト結果 日本語の本質")
+        result = dict(scored)
+        # カタカナ語・漢字語の途中での一致、1文字のタグは部分一致
+        self.assertLessEqual(result["テスト"], lexical.PARTIAL_MATCH_FACTOR)
+        self.assertLessEqual(result["日本"], lexical.PARTIAL_MATCH_FACTOR)
+        self.assertLessEqual(result["本"], lexical.PARTIAL_MATCH_FACTOR)
+        self.assertLessEqual(result["プログラミング"], lexical.PARTIAL_MATCH_FACTOR)
+        # 文字種の切れ目で区切られた語は完全一致
+        self.assertEqual(result["日本語"], 1.0)
+        self.assertEqual(result["結果"], 1.0)
+        self.assertEqual(lexical.confident_tags(scored, 0.9), ["日本語", "結果"])
+
+    def test_word_boundaries_by_script(self):
+        result = scores(["機械学習", "デザイン", "Web開発", "まとめ"], title="機械学習の入門 デザイン Web開発まとめ")
+        self.assertEqual(result["機械学習"], 1.0)  # 後ろがひらがな
+        self.assertEqual(result["デザイン"], 1.0)  # 前後が空白
+        self.assertEqual(result["Web開発"], 1.0)  # 後ろがひらがな
+        self.assertEqual(result["まとめ"], 1.0)  # 前が漢字
+
+        result = scores(["機械学習"], title="機械学習入門")
+        self.assertLessEqual(result["機械学習"], lexical.PARTIAL_MATCH_FACTOR)
+
+    def test_single_character_tag_is_never_confident(self):
+        scored = lexical.score_tags(["本"], title="本 の紹介")
+        self.assertEqual(dict(scored)["本"], lexical.PARTIAL_MATCH_FACTOR)
+        self.assertEqual(lexical.confident_tags(scored, 0.0), [])
+
+    def test_partial_bigram_overlap(self):
+        result = scores(["機械学習"], title="機械の学習")
+        # bigram「機械」「学習」が一致（3個中2個）
+        self.assertAlmostEqual(result["機械学習"], 2 / 3 * lexical.PARTIAL_MATCH_FACTOR)
+        self.assertEqual(scores(["機械学習"], title="料理のレシピ")["機械学習"], 0.0)
+
+    def test_full_width_and_half_width_kana(self):
+        self.assertEqual(scores(["デザイン"], title="ﾃﾞｻﾞｲﾝ の基本")["デザイン"], 1.0)
+
+
+class AsciiMatchTest(unittest.TestCase):
+    def test_word_boundaries(self):
+        result = scores(["go", "Python", "C++", "node.js"], title="Google で Python と C++、Node.js を検索")
+        self.assertEqual(result["go"], 0.0)
+        self.assertEqual(result["Python"], 1.0)
+        self.assertEqual(result["C++"], 1.0)
+        self.assertEqual(result["node.js"], 1.0)
+
+    def test_single_character_tag_is_partial(self):
+        scored = lexical.score_tags(["C", "R"], title="Plan C の話")
+        self.assertEqual(dict(scored)["C"], lexical.PARTIAL_MATCH_FACTOR)
+        self.assertEqual(dict(scored)["R"], 0.0)
+        self.assertEqual(lexical.confident_tags(scored, 0.5), [])
+
+
+class FieldWeightTest(unittest.TestCase):
+    def test_url_and_excerpt_weights(self):
+        result = scores(["Python", "async"], url="https://example.com/python-async", excerpt="Python の非同期処理")
+        self.assertEqual(result["Python"], lexical.FIELD_WEIGHTS["url"])
+        self.assertEqual(result["async"], lexical.FIELD_WEIGHTS["url"])
+        result = scores(["非同期"], excerpt="Python の非同期処理")
+        self.assertLessEqual(result["非同期"], lexical.PARTIAL_MATCH_FACTOR)  # 後ろが漢字
+        result = scores(["非同期"], excerpt="非同期 の処理")
+        self.assertEqual(result["非同期"], lexical.FIELD_WEIGHTS["excerpt"])
+
+    def test_url_stopwords(self):
+        self.assertEqual(lexical.url_tokens("https://www.example.co.jp/index.html"), frozenset({"example"}))
+
+    def test_order_and_limits(self):
+        scored = lexical.score_tags(["A1", "Python", "Python", "Go"], title="Python と Go")
+        self.assertEqual(scored, [("Python", 1.0), ("Go", 1.0), ("A1", 0.0)])
+        self.assertEqual(lexical.confident_tags(scored, 0.9, limit=1), ["Python"])
+        self.assertEqual(lexical.narrow_candidates(scored, 2), ["Python", "Go"])
+
+
+if __name__ == "__main__":
+    unittest.main()
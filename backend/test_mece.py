@@ -0,0 +1,110 @@
+"""
+mece.py のテスト（循環・重複・保護フォルダ・削除推奨）
+
+実行: python -m unittest test_mece
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from mece import MeceValidator, load_aliases
+
+
+def names(result):
+    return [(folder["parent"], folder["name"]) for folder in result.suggested_folders]
+
+
+class MeceValidatorTest(unittest.TestCase):
+    def setUp(self):
+        self.validator = MeceValidator(load_aliases(None))
+
+    def test_cycles_are_broken(self):
+        result = self.validator.validate([
+            {"name": "A", "parent": "B"},
+            {"name": "B", "parent": "A"},
+            {"name": "C", "parent": "C"},
+        ], [], [])
+        self.assertEqual(names(result), [("", "A"), ("A", "B"), ("", "C")])
+        self.assertEqual(result.fixes, [
+            "循環している親子関係を解消: A をトップレベルに移動",
+            "循環している親子関係を解消: C をトップレベルに移動",
+        ])
+
+    def test_duplicates_under_different_parents_without_hint(self):
+        result = self.validator.validate([
+            {"name": "Python", "parent": "仕事"},
+            {"name": "python", "parent": "趣味"},
+            {"name": "仕事"},
+            {"name": "趣味"},
+        ], [], [])
+        self.assertEqual(names(result), [("仕事", "Python"), ("", "仕事"), ("", "趣味")])
+        self.assertEqual(result.fixes, ["重複フォルダを統合: 仕事/Python、趣味/python → 仕事/Python"])
+        self.assertEqual(len(result.ambiguities), 1)
+        self.assertIn("仕事/Python", result.ambiguities[0])
+
+    def test_duplicates_follow_existing_location(self):
+        result = self.validator.validate(
+            [{"name": "Python", "parent": "仕事"}, {"name": "python", "parent": "趣味"}, {"name": "仕事"}, {"name": "趣味"}],
+            [],
+            [{"name": "Python", "parent": "趣味"}, {"name": "趣味", "parent": ""}],
+        )
+        self.assertIn(("趣味", "Python"), names(result))
+        self.assertNotIn(("仕事", "Python"), names(result))
+        self.assertEqual(result.ambiguities, [])
+
+    def test_aliases_vague_and_protected_folders(self):
+        result = self.validator.validate(
+            [{"name": "AI"}, {"name": "人工知能"}, {"name": "その他"}, {"name": "Web", "parent": "その他"}],
+            ["未分類", "Inbox", "存在しないフォルダ"],
+            [{"name": "未分類", "parent": ""}, {"name": "その他", "parent": ""}, {"name": "Inbox", "parent": ""}, {"name": "人工知能", "parent": ""}],
+            {"未分類": 0, "Inbox": 1, "人工知能": 10},
+        )
+        # 別名は1つにまとめ、曖昧なフォルダの子はトップレベルへ
+        self.assertEqual(names(result), [("", "AI"), ("", "Web")])
+        # 保護フォルダ・存在しないフォルダは削除推奨にしない。既存の曖昧なフォルダは削除推奨にする
+        self.assertEqual(result.folders_to_remove, ["その他"])
+
+    def test_small_folders_are_removed_unless_protected(self):
+        result = self.validator.validate(
+            [{"name": "未分類"}, {"name": "メモ"}, {"name": "仕事"}],
+            [],
+            [{"name": "未分類", "parent": ""}, {"name": "メモ", "parent": ""}, {"name": "仕事", "parent": ""}],
+            {"未分類": 0, "メモ": 1, "仕事": 5},
+        )
+        self.assertEqual(names(result), [("", "未分類"), ("", "仕事")])
+        self.assertEqual(result.folders_to_remove, ["メモ"])
+
+    def test_merge_from_drops_protected_and_unknown_folders(self):
+        result = self.validator.validate(
+            [{"name": "料理", "merge_from": ["料理", "レシピ", "未分類", "存在しない"]}],
+            [],
+            [{"name": "料理", "parent": ""}, {"name": "レシピ", "parent": ""}, {"name": "未分類", "parent": ""}],
+        )
+        self.assertEqual(result.suggested_folders[0]["merge_from"], ["料理", "レシピ"])
+
+        # 統合元が1つしか残らなければ統合ではない
+        result = self.validator.validate(
+            [{"name": "料理", "merge_from": ["料理", "未分類"]}],
+            [],
+            [{"name": "料理", "parent": ""}, {"name": "未分類", "parent": ""}],
+        )
+        self.assertEqual(result.suggested_folders[0]["merge_from"], [])
+
+    def test_path_in_name_and_invalid_items(self):
+        result = self.validator.validate(["文字列", {"name": "プログラミング/Python"}, {"name": ""}], [], [])
+        self.assertEqual(names(result), [("プログラミング", "Python"), ("", "プログラミング")])
+        self.assertTrue(any("不正な形式" in fix for fix in result.fixes))
+
+    def test_load_aliases_from_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            json.dump([["読書", "本", "Books"]], f, ensure_ascii=False)
+        self.addCleanup(os.remove, f.name)
+        validator = MeceValidator(load_aliases(f.name))
+        self.assertEqual(validator.key("Books"), validator.key("読書"))
+        # 既定の別名も残る
+        self.assertEqual(validator.key("人工知能"), validator.key("AI"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+memo.py のテスト（タグ一覧の変更で再計算が必要になるブックマークの判定・まとめた読み書き）
+
+実行: python -m unittest test_memo
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+
+import cache
+from memo import TagMemo
+
+OPTIONS = {"model": "gpt-test", "reasoning_effort": "low"}
+
+PYTHON = {"title": "Python の非同期処理", "url": "https://example.com/python-async", "excerpt": ""}
+COOKING = {"title": "カレーの作り方", "url": "https://example.com/curry", "excerpt": "スパイスから作る"}
+TRAVEL = {"title": "京都の紅葉", "url": "https://example.com/kyoto", "excerpt": ""}
+
+
+class TagMemoBehaviorMixin:
+    def create_caches(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.memo = TagMemo(*self.create_caches())
+        self.vocabulary = ["Python", "料理", "旅行"]
+        asyncio.run(self.memo.set_many(
+            [(PYTHON, ["Python"]), (COOKING, ["料理"]), (TRAVEL, ["旅行"])], self.vocabulary, **OPTIONS,
+        ))
+
+    def get_many(self, bookmarks, vocabulary):
+        return asyncio.run(self.memo.get_many(bookmarks, vocabulary, **OPTIONS))
+
+    def test_same_vocabulary(self):
+        self.assertEqual(self.get_many([PYTHON, COOKING, TRAVEL], self.vocabulary), [["Python"], ["料理"], ["旅行"]])
+        self.assertEqual(self.memo.stats()["hits"], 3)
+
+    def test_vocabulary_order_does_not_matter(self):
+        self.assertEqual(self.get_many([PYTHON], list(reversed(self.vocabulary))), [["Python"]])
+        self.assertEqual(self.memo.invalidated, 0)
+
+    def test_unknown_bookmark_and_options(self):
+        other = dict(PYTHON, title="Python 入門")
+        self.assertEqual(self.get_many([other], self.vocabulary), [None])
+        self.assertIsNone(asyncio.run(self.memo.get(PYTHON, self.vocabulary, model="other", reasoning_effort="low")))
+        self.assertEqual(self.memo.invalidated, 0)
+
+    def test_removed_tag_invalidates_only_bookmarks_that_used_it(self):
+        vocabulary = ["Python", "旅行"]
+        self.assertEqual(self.get_many([PYTHON, COOKING, TRAVEL], vocabulary), [["Python"], None, ["旅行"]])
+        self.assertEqual(self.memo.invalidated, 1)
+
+    def test_added_tag_invalidates_only_bookmarks_that_mention_it(self):
+        # 「非同期」は PYTHON のタイトルに現れる。「スパイス・ハーブ」は区切ると「スパイス」が COOKING のメモに現れる
+        vocabulary = self.vocabulary + ["非同期", "スパイス・ハーブ", "音楽"]
+        self.assertEqual(self.get_many([PYTHON, COOKING, TRAVEL], vocabulary), [None, None, ["旅行"]])
+        self.assertEqual(self.memo.invalidated, 2)
+
+    def test_unaffected_entries_are_not_rewritten(self):
+        entries = self.memo.entries
+        before = entries.get_many(TagMemo.bookmark_key(b, **OPTIONS) for b in (PYTHON, COOKING, TRAVEL))
+        self.get_many([PYTHON, COOKING, TRAVEL], self.vocabulary + ["音楽"])
+        after = entries.get_many(TagMemo.bookmark_key(b, **OPTIONS) for b in (PYTHON, COOKING, TRAVEL))
+        self.assertEqual(before, after)
+
+    def test_changes_are_compared_with_the_recorded_vocabulary(self):
+        # 2回変わっても、記録時のタグ一覧との差分で判定する（途中で追加・削除されたタグは影響しない）
+        self.get_many([TRAVEL], self.vocabulary + ["非同期"])
+        self.assertEqual(self.get_many([PYTHON, TRAVEL], self.vocabulary + ["音楽"]), [["Python"], ["旅行"]])
+
+    def test_missing_recorded_vocabulary_invalidates(self):
+        self.memo.vocabularies = cache.InMemoryCache(ttl_seconds=60, max_entries=10)
+        self.assertEqual(self.get_many([TRAVEL], self.vocabulary), [["旅行"]])
+        self.assertEqual(self.get_many([TRAVEL], self.vocabulary + ["音楽"]), [None])
+
+    def test_set_overwrites_with_new_vocabulary(self):
+        vocabulary = ["Python", "旅行"]
+        asyncio.run(self.memo.set(COOKING, vocabulary, [], **OPTIONS))
+        self.assertEqual(self.get_many([COOKING], vocabulary), [[]])
+
+    def test_empty_batches(self):
+        self.assertEqual(self.get_many([], self.vocabulary), [])
+        asyncio.run(self.memo.set_many([], self.vocabulary, **OPTIONS))
+
+
+class InMemoryTagMemoTest(TagMemoBehaviorMixin, unittest.TestCase):
+    def create_caches(self):
+        return (
+            cache.InMemoryCache(ttl_seconds=60, max_entries=100),
+            cache.InMemoryCache(ttl_seconds=60, max_entries=10),
+        )
+
+
+class SQLiteTagMemoTest(TagMemoBehaviorMixin, unittest.TestCase):
+    def create_caches(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "memo.sqlite3")
+        caches = (
+            cache.SQLiteCache(path, ttl_seconds=60, max_entries=100, table="tag_memo"),
+            cache.SQLiteCache(path, ttl_seconds=60, max_entries=10, table="tag_vocabularies"),
+        )
+        for c in caches:
+            self.addCleanup(c._conn.close)
+        return caches
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+move_plan.py のテスト（統合・移動・同名フォルダ・保護フォルダ）
+
+実行: python -m unittest test_move_plan
+"""
+import unittest
+
+from folder_tree import FolderTree
+from move_plan import plan_moves
+
+
+class PlanMovesTest(unittest.TestCase):
+    def setUp(self):
+        current = FolderTree.from_folders([
+            {"name": "料理"},
+            {"name": "レシピ"},
+            {"name": "生活"},
+            {"name": "未分類"},
+            {"name": "仕事"},
+            {"name": "趣味"},
+            {"name": "Python", "parent": "仕事"},
+            {"name": "Python", "parent": "趣味"},
+        ])
+        suggested = FolderTree.from_folders([
+            {"name": "生活"},
+            {"name": "料理", "parent": "生活", "merge_from": ["料理", "レシピ"]},
+            {"name": "仕事"},
+            {"name": "Python", "parent": "仕事"},
+        ])
+        self.diff = suggested.diff(current, protected={"未分類"})
+
+    def plan(self, *folders):
+        return plan_moves([{"current_folder": folder} for folder in folders], self.diff)
+
+    def test_moved_and_merged_folders(self):
+        plan = self.plan("料理", "レシピ")
+        self.assertEqual(plan.moves, [
+            {"index": 0, "from_folder": "料理", "to_folder": "生活 / 料理", "reason": "移動: 料理 → 生活 / 料理"},
+            {"index": 1, "from_folder": "レシピ", "to_folder": "生活 / 料理", "reason": "統合: レシピ → 生活 / 料理"},
+        ])
+        self.assertEqual(plan.ambiguous, [])
+        self.assertEqual(plan.unchanged, 0)
+
+    def test_protected_and_unknown_folders_stay(self):
+        plan = self.plan("未分類", "存在しないフォルダ", "", "生活")
+        self.assertEqual(plan.moves, [])
+        self.assertEqual(plan.ambiguous, [])
+        self.assertEqual(plan.unchanged, 4)
+
+    def test_removed_folder_without_destination_is_ambiguous(self):
+        plan = self.plan("趣味")
+        self.assertEqual(plan.ambiguous, [0])
+
+    def test_duplicate_names_resolved_by_path(self):
+        plan = self.plan("Python", "仕事/Python", "趣味 / Python")
+        # 名前だけでは残る方か消える方か決まらない
+        self.assertEqual(plan.ambiguous, [0, 2])
+        self.assertEqual(plan.unchanged, 1)
+        self.assertEqual(plan.moves, [])
+
+    def test_missing_folder_field(self):
+        plan = plan_moves([{}, {"current_folder": None}], self.diff)
+        self.assertEqual(plan.unchanged, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+トークン数の見積もり
+
+LLMを呼び出す前に、プロンプトと応答のトークン数を見積もる（チャンクの大きさ・
+max_completion_tokens・タイトルの短縮をこれで決め、応答が途中で切れるのを防ぐ）。
+
+- tiktoken がインストールされ、エンコーディングの表がローカルにある場合はそれで数える
+  （TIKTOKEN_CACHE_DIR に表を置けばネットワークなしで使える）
+- ない場合は文字種ごとの比率で見積もる（o200k_base の傾向に合わせた値）
+  - ASCII（英数字・記号）: 約4文字で1トークン
+  - ひらがな・カタカナ: 約0.6トークン/文字（よく使う並びはまとまる）
+  - 漢字: 約0.9トークン/文字
+  - その他（全角記号・絵文字など）: 約1トークン/文字
+  さらに、実際の呼び出しの usage.prompt_tokens と見積もりの比で補正係数を少しずつ更新する
+"""
+import logging
+import math
+import os
+import re
+from typing import Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+logger = logging.getLogger("tag_suggestion_api")
+
+# auto: tiktoken が使えれば使う / ratio: 常に文字種の比率で見積もる
+TOKENIZER = os.getenv("TOKENIZER", "auto")
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+ASCII_CHARS_PER_TOKEN = 4.0
+KANA_TOKENS_PER_CHAR = 0.6
+KANJI_TOKENS_PER_CHAR = 0.9
+NON_ASCII_TOKENS_PER_CHAR = 1.0
+
+# メッセージ1件あたりの固定トークン（role など）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 推論モデルが応答の前に使う推論トークンの見込み（max_completion_tokens に含まれる）
+REASONING_RESERVE_TOKENS = {"minimal": 512, "low": 4096, "medium": 8192, "high": 16384}
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "32000"))
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_KANA = re.compile(r"[぀-ヿｦ-ﾟ]")
+_KANJI = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+# 補正係数の範囲と更新の重み
+_CORRECTION_RANGE = (0.7, 1.5)
+_CORRECTION_WEIGHT = 0.1
+_CALIBRATION_MIN_TOKENS = 100
+
+
+def _load_encoding():
+    if TOKENIZER != "auto":
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:  # 未インストール・表が取得できない場合は比率で見積もる
+        logger.info("🔢 tiktoken を使わずに文字種の比率でトークン数を見積もります（%s）", type(e).__name__)
+        return None
+
+
+_encoding = _load_encoding()
+_state = {"correction": 1.0, "calibrations": 0}
+
+
+def _ratio_tokens(text: str) -> float:
+    non_ascii = len(_NON_ASCII.findall(text))
+    kana = len(_KANA.findall(text)) if non_ascii else 0
+    kanji = len(_KANJI.findall(text)) if non_ascii else 0
+    other = non_ascii - kana - kanji
+    return (
+        (len(text) - non_ascii) / ASCII_CHARS_PER_TOKEN
+        + kana * KANA_TOKENS_PER_CHAR
+        + kanji * KANJI_TOKENS_PER_CHAR
+        + other * NON_ASCII_TOKENS_PER_CHAR
+    )
+
+
+def raw_tokens(text: str) -> int:
+    """補正前のトークン数（tiktoken があれば正確な値）"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return int(_ratio_tokens(text)) + 1
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を見積もる"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return raw_tokens(text)
+    return int(_ratio_tokens(text) * _state["correction"]) + 1
+
+
+def estimate_messages(messages: Iterable[dict], *, raw: bool = False) -> int:
+    """chat.completions の messages 全体のトークン数"""
+    count = estimate_tokens if not raw else raw_tokens
+    return sum(count(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def calibrate(messages: Iterable[dict], actual_prompt_tokens: Optional[int]) -> None:
+    """実際の usage.prompt_tokens で比率の補正係数を更新する（tiktoken 使用時は何もしない）"""
+    if _encoding is not None or not actual_prompt_tokens:
+        return
+    estimated = estimate_messages(messages, raw=True)
+    if estimated < _CALIBRATION_MIN_TOKENS:
+        return
+    low, high = _CORRECTION_RANGE
+    ratio = min(high, max(low, actual_prompt_tokens / estimated))
+    _state["correction"] += (ratio - _state["correction"]) * _CORRECTION_WEIGHT
+    _state["calibrations"] += 1
+
+
+def truncate(text: str, max_tokens: int, *, suffix: str = "...") -> str:
+    """トークン数が max_tokens を超える場合は末尾を削って suffix を付ける"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        budget = max(0, max_tokens - raw_tokens(suffix))
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:budget]) + suffix
+    # 文字数を比例で縮め、まだ超えていれば少しずつ削る
+    length = max(0, int(len(text) * max_tokens / max(1, estimate_tokens(text))) - len(suffix))
+    while length > 0 and estimate_tokens(text[:length] + suffix) > max_tokens:
+        length = int(length * 0.9)
+    return text[:length] + suffix
+
+
+def completion_budget(output_tokens: int, reasoning_effort: Optional[str] = None, *, margin: float = 1.3) -> int:
+    """
+    max_completion_tokens: 見込みの出力トークン × 余裕 + 推論トークンの見込み（上限 MAX_COMPLETION_TOKENS）
+    """
+    reserve = REASONING_RESERVE_TOKENS.get(reasoning_effort or "", REASONING_RESERVE_TOKENS["medium"])
+    return min(MAX_COMPLETION_TOKENS, int(math.ceil(output_tokens * margin)) + reserve)
+
+
+def output_capacity(per_item_tokens: int, reasoning_effort: Optional[str] = None, *, margin: float = 1.3) -> int:
+    """completion_budget が上限に収まる最大の件数"""
+    reserve = REASONING_RESERVE_TOKENS.get(reasoning_effort or "", REASONING_RESERVE_TOKENS["medium"])
+    return max(1, int((MAX_COMPLETION_TOKENS - reserve) / (max(1, per_item_tokens) * margin)))
+
+
+def stats() -> Dict[str, object]:
+    return {
+        "tokenizer": TOKENIZER_ENCODING if _encoding is not None else "ratio",
+        "correction": round(_state["correction"], 3),
+        "calibrations": _state["calibrations"],
+    }
@@ -0,0 +1,297 @@
+"""
+ライブラリ（ユーザーのブックマーク全体）ごとの永続ベクトルインデックス
+
+ブックマークの埋め込みをディスクに保存し、再起動後も再計算せずに使えるようにする。
+- vectors.f32: float32 の行列（np.memmap でメモリマップ。容量が足りなくなったら倍に拡張）
+- meta.json: 行番号 -> ブックマークID・内容のハッシュ、埋め込みの種類
+
+削除した行は空き行として再利用する。
+"""
+import asyncio
+import json
+import os
+import re
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cache import make_key
+import embeddings
+
+_INITIAL_CAPACITY = 1024
+
+
+class VectorIndex:
+    """
+    1つのライブラリのベクトルインデックス
+    使い方:
+        index = VectorIndex.open("vector_index/user-1", dim=512, embedder="hashing")
+        index.upsert(["a", "b"], vectors, hashes=["...", "..."])
+        index.get(["a", "b"])  # (2, dim)
+        index.save()
+    """
+
+    def __init__(self, path: str, dim: int, embedder: str):
+        self.path = path
+        self.dim = dim
+        self.embedder = embedder
+        self._ids: List[Optional[str]] = []  # 行番号 -> ID（削除済みは None）
+        self._hashes: List[Optional[str]] = []  # 行番号 -> 内容のハッシュ
+        self._rows: Dict[str, int] = {}  # ID -> 行番号
+        self._free: List[int] = []  # 空き行
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+
+    # ===== 読み込み・保存 =====
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    @classmethod
+    def load(cls, path: str, *, embedder: str) -> Optional["VectorIndex"]:
+        """保存済みのインデックスを開く（ない、または埋め込みの種類が違う場合は None）"""
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path) or not os.path.exists(os.path.join(path, "vectors.f32")):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("embedder") != embedder:
+            return None
+        index = cls(path, meta["dim"], embedder)
+        index._load(meta)
+        return index
+
+    @classmethod
+    def create(cls, path: str, *, dim: int, embedder: str) -> "VectorIndex":
+        """空のインデックスを作る（既存のファイルは置き換える）"""
+        os.makedirs(path, exist_ok=True)
+        index = cls(path, dim, embedder)
+        if os.path.exists(index._vectors_path):
+            os.remove(index._vectors_path)
+        index._allocate(_INITIAL_CAPACITY)
+        index.save()
+        return index
+
+    @classmethod
+    def open(cls, path: str, *, dim: int, embedder: str) -> "VectorIndex":
+        """インデックスを開く（なければ作る。埋め込みの種類・次元が変わっていれば作り直す）"""
+        index = cls.load(path, embedder=embedder)
+        if index is None or index.dim != dim:
+            index = cls.create(path, dim=dim, embedder=embedder)
+        return index
+
+    def _load(self, meta: dict) -> None:
+        self._ids = meta["ids"]
+        self._hashes = meta["hashes"]
+        self._rows = {item_id: row for row, item_id in enumerate(self._ids) if item_id is not None}
+        self._free = [row for row, item_id in enumerate(self._ids) if item_id is None]
+        self._capacity = meta["capacity"]
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _allocate(self, capacity: int) -> None:
+        """ベクトルファイルを capacity 行に拡張して開き直す"""
+        old = self._vectors
+        if old is not None:
+            old.flush()
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def save(self) -> None:
+        """ベクトルをディスクに書き出し、メタデータを置き換える"""
+        if self._vectors is not None:
+            self._vectors.flush()
+        meta = {
+            "dim": self.dim,
+            "embedder": self.embedder,
+            "capacity": self._capacity,
+            "ids": self._ids,
+            "hashes": self._hashes,
+        }
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path)
+
+    # ===== 追加・更新・削除 =====
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ids(self) -> List[str]:
+        return list(self._rows)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    def content_hash(self, item_id: str) -> Optional[str]:
+        row = self._rows.get(item_id)
+        return self._hashes[row] if row is not None else None
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, hashes: Optional[Sequence[str]] = None) -> None:
+        """ベクトルを追加する（同じIDがあれば上書き）。vectors は正規化済みの (件数, dim)"""
+        rows = np.empty(len(ids), dtype=np.int64)
+        for i, item_id in enumerate(ids):
+            row = self._rows.get(item_id)
+            if row is None:
+                row = self._take_row()
+                self._rows[item_id] = row
+                self._ids[row] = item_id
+            self._hashes[row] = hashes[i] if hashes is not None else None
+            rows[i] = row
+        if len(ids):
+            self._vectors[rows] = vectors
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """IDを削除する（行は空き行として再利用される）"""
+        deleted = 0
+        for item_id in ids:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                continue
+            self._ids[row] = None
+            self._hashes[row] = None
+            self._free.append(row)
+            deleted += 1
+        return deleted
+
+    def get(self, ids: Sequence[str]) -> np.ndarray:
+        """IDのベクトルを返す（存在しないIDがあれば KeyError）"""
+        rows = [self._rows[item_id] for item_id in ids]
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def _take_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        row = len(self._ids)
+        if row >= self._capacity:
+            self._allocate(self._capacity * 2)
+        self._ids.append(None)
+        self._hashes.append(None)
+        return row
+
+
+# ===== ライブラリごとのインデックスの管理 =====
+
+_LIBRARY_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_library_id(library_id: str) -> bool:
+    """ディレクトリ名として使えるライブラリIDか"""
+    return bool(_LIBRARY_ID.match(library_id or ""))
+
+
+def bookmark_id(bookmark: dict) -> str:
+    """インデックス上のブックマークID（id がなければタイトルとURLから作る）"""
+    if bookmark.get("id"):
+        return str(bookmark["id"])
+    return "h:" + make_key(title=bookmark.get("title"), url=bookmark.get("url"))[:32]
+
+
+def embedder_key(embedder) -> str:
+    """埋め込みの種類（変わったらインデックスを作り直す）"""
+    return f"{embedder.name}:{getattr(embedder, 'model', '')}:{getattr(embedder, 'dim', '')}"
+
+
+class LibraryIndexes:
+    """
+    ライブラリIDごとの VectorIndex（root/ライブラリID/ に保存）
+    開いたインデックスは最大 max_open 個までメモリに保持する
+    ハッシュの計算・ファイルの読み書きは別スレッドで行い、同じライブラリの sync は1つずつ実行する
+    """
+
+    def __init__(self, root: str, embedder, *, max_open: int = 32):
+        self.root = root
+        self.embedder = embedder
+        self.max_open = max_open
+        self._open: "OrderedDict[str, VectorIndex]" = OrderedDict()
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.embedded = 0  # 埋め込みを計算した件数
+        self.reused = 0  # 保存済みのベクトルを使った件数
+
+    def get(self, library_id: str) -> Optional[VectorIndex]:
+        """開いている（または保存済みの）インデックス"""
+        index = self._open.get(library_id)
+        if index is None:
+            index = self._load(library_id)
+            if index is None:
+                return None
+            self._remember(library_id, index)
+        self._open.move_to_end(library_id)
+        return index
+
+    def _path(self, library_id: str) -> str:
+        return os.path.join(self.root, library_id)
+
+    def _load(self, library_id: str) -> Optional[VectorIndex]:
+        return VectorIndex.load(self._path(library_id), embedder=embedder_key(self.embedder))
+
+    def _remember(self, library_id: str, index: VectorIndex) -> None:
+        self._open[library_id] = index
+        self._open.move_to_end(library_id)
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+    def _lock(self, library_id: str) -> asyncio.Lock:
+        lock = self._locks.get(library_id)
+        if lock is None:
+            lock = self._locks[library_id] = asyncio.Lock()
+        return lock
+
+    async def sync(self, library_id: str, bookmarks: Sequence[dict], *, prune: bool = False) -> Tuple[VectorIndex, np.ndarray]:
+        """
+        ブックマークをインデックスに反映する（内容が変わったものだけ埋め込みを計算する）
+        prune: bookmarks をライブラリの全件とみなし、含まれないIDを削除する
+        戻り値: (インデックス, bookmarks と同じ順のベクトル)
+        """
+        # 同じライブラリを同時に作成・更新すると、ファイルの作り直しや行の再利用が衝突する
+        async with self._lock(library_id):
+            index = self._open.get(library_id)
+            if index is None:
+                index = await asyncio.to_thread(self._load, library_id)
+            if index is not None:
+                self._remember(library_id, index)
+
+            ids, texts, hashes, changed = await asyncio.to_thread(_diff, index, bookmarks)
+            vectors = await self.embedder.embed([texts[item_id] for item_id in changed]) if changed else None
+            index, result = await asyncio.to_thread(self._apply, library_id, index, ids, texts, hashes, changed, vectors, prune)
+            self._remember(library_id, index)
+            self.embedded += len(changed)
+            self.reused += len(texts) - len(changed)
+            return index, result
+
+    def _apply(self, library_id, index, ids, texts, hashes, changed, vectors, prune) -> Tuple[VectorIndex, np.ndarray]:
+        """変わったベクトルの書き込み・削除・保存（別スレッドで実行する）"""
+        if index is None:
+            dim = vectors.shape[1] if vectors is not None else getattr(self.embedder, "dim", 1)
+            index = VectorIndex.create(self._path(library_id), dim=dim, embedder=embedder_key(self.embedder))
+        if changed:
+            index.upsert(changed, vectors, [hashes[item_id] for item_id in changed])
+        removed = index.delete([item_id for item_id in index.ids() if item_id not in texts]) if prune else 0
+        if changed or removed:
+            index.save()
+        return index, index.get(ids)
+
+    def stats(self) -> dict:
+        return {"open": len(self._open), "embedded": self.embedded, "reused": self.reused}
+
+
+def _diff(index: Optional[VectorIndex], bookmarks: Sequence[dict]):
+    """ブックマークのID・テキスト・内容のハッシュと、インデックスの内容から変わったIDを求める"""
+    ids = [bookmark_id(bm) for bm in bookmarks]
+    texts = {}
+    hashes = {}
+    for item_id, bookmark in zip(ids, bookmarks):
+        text = embeddings.bookmark_text(bookmark)
+        texts[item_id] = text
+        hashes[item_id] = make_key(text=text)
+    changed = [item_id for item_id in texts if index is None or index.content_hash(item_id) != hashes[item_id]]
+    return ids, texts, hashes, changed